@@ -0,0 +1,83 @@
+"""Callback hooks per client on shared connections
+
+pynfs keeps one cb_pre_hook and one cb_post_hook per callback op on
+each connection, and the test environment's env.c1..c4 are shared by
+every client made from them, so clients on one connection replace each
+other's hooks.  add_cb_hook() instead installs a single dispatcher per
+connection and callback op, which hands each callback to the hooks of
+the client it was sent to: the client of the session CB_SEQUENCE named.
+
+    add_cb_hook(sess.client, OP_CB_RECALL, pre_hook, post_hook)
+"""
+import threading
+
+_lock = threading.Lock()
+
+
+class _Dispatcher(object):
+    """The hooks of one connection for one callback op, by clientid"""
+    def __init__(self, cb_op):
+        self.cb_op = cb_op
+        self.hooks = {}     # clientid -> (pre_hook, post_hook, internal)
+
+    def _hooks(self, env):
+        session = getattr(env, "session", None)
+        clientid = getattr(getattr(session, "client", None), "clientid",
+                           None)
+        with _lock:
+            if clientid is None and len(self.hooks) == 1:
+                # No CB_SEQUENCE to go by, but only one client to call
+                return list(self.hooks.values())[0]
+            return self.hooks.get(clientid, (None, None, False))
+
+    def pre_hook(self, arg, env):
+        pre_hook = self._hooks(env)[0]
+        if pre_hook is not None:
+            return pre_hook(arg, env)
+        return None
+
+    def post_hook(self, arg, env, res):
+        post_hook = self._hooks(env)[1]
+        if post_hook is not None:
+            return post_hook(arg, env, res)
+        return res
+
+
+def is_dispatcher(hook):
+    """Whether hook is a dispatcher installed by add_cb_hook()"""
+    return isinstance(getattr(hook, "__self__", None), _Dispatcher)
+
+
+def add_cb_hook(client, cb_op, pre_hook=None, post_hook=None,
+                internal=False):
+    """Hook the cb_op callbacks sent to client, leaving other clients' be
+
+    Replaces the hooks client had for cb_op.  internal marks hooks of the
+    test helpers themselves, which remove_cb_hooks() keeps by default.
+    """
+    connection = client.c
+    with _lock:
+        dispatchers = getattr(connection, "cb_dispatchers", None)
+        if dispatchers is None:
+            dispatchers = connection.cb_dispatchers = {}
+        dispatcher = dispatchers.get(cb_op)
+        if dispatcher is None:
+            dispatcher = dispatchers[cb_op] = _Dispatcher(cb_op)
+        dispatcher.hooks[client.clientid] = (pre_hook, post_hook, internal)
+    # Every time: a test may have set hooks of its own on the connection
+    client.cb_pre_hook(cb_op, dispatcher.pre_hook)
+    client.cb_post_hook(cb_op, dispatcher.post_hook)
+
+
+def remove_cb_hooks(client, internal=False):
+    """Drop the hooks add_cb_hook() gave client; internal ones too if
+    internal
+    """
+    dispatchers = getattr(client.c, "cb_dispatchers", None)
+    if not dispatchers:
+        return
+    with _lock:
+        for dispatcher in dispatchers.values():
+            hooks = dispatcher.hooks.get(client.clientid)
+            if hooks is not None and (internal or not hooks[2]):
+                del dispatcher.hooks[client.clientid]
@@ -0,0 +1,244 @@
+from nfs4_const import *
+from nfs4_type import *
+from environment import check, fail
+import nfs4_ops as op
+from multiclient import open_layout_fanout
+from recalltiming import percentile
+from seeding import Pattern, seed_file
+from sessionpool import destroy_session
+from waits import wait_until
+from multiprocessing.pool import ThreadPool
+
+import heapq
+import threading
+import time
+
+_clock = getattr(time, "monotonic", time.time)
+
+STRESS_SESSIONS = 8
+STRESS_DURATION = 10.0
+COMMIT_SIZE = 64 * 1024     # bytes written and committed per round
+COMMIT_SPLITS = 1           # disjoint LAYOUTCOMMITs per round
+COMMIT_RATE = None          # LAYOUTCOMMITs/s per session; None: flat out
+SIZE_POLL = 0.001           # seconds between the observer's GETATTRs
+
+
+def _histogram(values):
+    if not values:
+        return {"count": 0, "p50": None, "p99": None, "max": None}
+    values = sorted(values)
+    return {"count": len(values), "p50": percentile(values, 50),
+            "p99": percentile(values, 99), "max": values[-1]}
+
+
+class CommitStress(object):
+    """Continuous WRITE + LAYOUTCOMMIT on one file from many sessions
+
+    Each session repeatedly takes the next commit_size extent of the
+    file, WRITEs it (unstable, through the MDS) and commits it with
+    `splits` disjoint LAYOUTCOMMITs sent together, optionally paced to
+    `rate` LAYOUTCOMMITs per second.  Sessions take extents in turn, so
+    the file grows while they race.  An observer session polls the size
+    with GETATTR; the visibility lag of a round is the time from its
+    last LAYOUTCOMMIT reply to the first GETATTR reply that covers it.
+    """
+    def __init__(self, env, name, lo_type, update_body="", return_body="",
+                 nsessions=STRESS_SESSIONS, commit_size=COMMIT_SIZE,
+                 splits=COMMIT_SPLITS, rate=COMMIT_RATE):
+        if not 1 <= splits <= commit_size:
+            fail("Cannot split %i bytes into %i commits"
+                 % (commit_size, splits))
+        self.env = env
+        self.name = name
+        self.lo_type = lo_type
+        self.update_body = update_body
+        self.return_body = return_body
+        self.commit_size = commit_size
+        self.splits = splits
+        self.rate = rate
+        self.owner = "owner_%s" % name
+        self.data = Pattern(commit_size)[0:commit_size]
+        self.sessions = [
+            env.c1.new_client_session("%s_%i" % (name, i + 1),
+                                      flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+            for i in range(nsessions)]
+        self.observer = env.c1.new_client_session("%s_observer" % name)
+        self.path = self.sessions[0].c.homedir + [name]
+        self.fh = None
+        self.opened = None
+
+        self._extents = 0
+        self._unseen = []       # heap of (end, commit reply time)
+        self._commits = []
+        self._writes = []
+        self._lags = []
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def setup(self):
+        res = seed_file(self.sessions[0], self.owner, self.path, "",
+                        verify=False)
+        self.fh = res.fh
+        self.opened = open_layout_fanout(self.sessions, self.owner,
+                                         self.path, self.lo_type,
+                                         access=OPEN4_SHARE_ACCESS_BOTH,
+                                         want_deleg=False,
+                                         iomode=LAYOUTIOMODE4_RW)
+
+    def _next_extent(self):
+        with self._lock:
+            offset = self._extents * self.commit_size
+            self._extents += 1
+        return offset
+
+    def _layoutcommit(self, opened, offset, length, last):
+        return [op.putfh(opened.fh),
+                op.layoutcommit(offset, length, False, opened.layout_stateid,
+                                newoffset4(True, last), newtime4(False),
+                                layoutupdate4(self.lo_type,
+                                              self.update_body))]
+
+    def _round(self, sess, opened):
+        offset = self._next_extent()
+        last = offset + self.commit_size - 1
+
+        sent = _clock()
+        res = sess.compound([op.putfh(opened.fh),
+                             op.write(opened.stateid, offset, UNSTABLE4,
+                                      self.data)])
+        check(res, msg="WRITE at %i" % offset)
+        writes = [_clock() - sent]
+
+        step = self.commit_size // self.splits
+        ranges = [(offset + i * step,
+                   step if i < self.splits - 1
+                   else self.commit_size - i * step)
+                  for i in range(self.splits)]
+        pending = [(sess.compound_async(self._layoutcommit(opened, start,
+                                                           length, last)),
+                    _clock())
+                   for start, length in ranges]
+        commits = []
+        for slot, sent in pending:
+            res = sess.listen(slot)
+            check(res, msg="LAYOUTCOMMIT of %i bytes at %i"
+                  % (self.commit_size, offset))
+            commits.append(_clock() - sent)
+        replied = _clock()
+        with self._lock:
+            self._writes.extend(writes)
+            self._commits.extend(commits)
+            heapq.heappush(self._unseen, (last, replied))
+
+    def _drive(self, args):
+        sess, opened, deadline = args
+        interval = float(self.splits) / self.rate if self.rate else 0
+        due = _clock()
+        while _clock() < deadline and not self._stop.is_set():
+            self._round(sess, opened)
+            if interval:
+                due += interval
+                delay = due - _clock()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def _poll(self):
+        """GETATTR the size once; returns the number of unseen rounds"""
+        res = self.observer.compound([op.putfh(self.fh),
+                                      op.getattr(1 << FATTR4_SIZE)])
+        check(res, msg="GETATTR of size")
+        seen = _clock()
+        size = res.resarray[-1].obj_attributes[FATTR4_SIZE]
+        with self._lock:
+            self._size = max(self._size, size)
+            while self._unseen and self._unseen[0][0] < size:
+                last, replied = heapq.heappop(self._unseen)
+                self._lags.append(max(seen - replied, 0.0))
+            return len(self._unseen)
+
+    def _observe(self):
+        while not self._stop.wait(SIZE_POLL):
+            self._poll()
+
+    def run(self, duration=STRESS_DURATION):
+        """Stress for duration seconds; returns the measurements"""
+        if self.opened is None:
+            self.setup()
+        deadline = _clock() + duration
+        observer = threading.Thread(target=self._observe)
+        observer.daemon = True
+        pool = ThreadPool(len(self.sessions))
+        start = _clock()
+        observer.start()
+        try:
+            pool.map(self._drive, [(sess, opened, deadline) for sess, opened
+                                   in zip(self.sessions, self.opened)])
+        finally:
+            elapsed = _clock() - start
+            self._stop.set()
+            pool.close()
+            pool.join()
+            observer.join()
+        # Every committed size must become visible
+        wait_until(lambda: self._poll() == 0,
+                   what="committed sizes to become visible")
+        expected = self._extents * self.commit_size
+        if self._size != expected:
+            fail("File size is %i after committing %i bytes"
+                 % (self._size, expected))
+
+        commits = len(self._commits)
+        return {"sessions": len(self.sessions),
+                "commit_size": self.commit_size, "splits": self.splits,
+                "rate": self.rate, "seconds": elapsed, "commits": commits,
+                "commits_per_s": commits / elapsed,
+                "bytes_per_s": expected / elapsed,
+                "commit": _histogram(self._commits),
+                "write": _histogram(self._writes),
+                "visibility": _histogram(self._lags)}
+
+    def _finish(self, args):
+        sess, opened = args
+        ops = [op.putfh(opened.fh),
+               op.layoutreturn(False, self.lo_type, LAYOUTIOMODE4_ANY,
+                               layoutreturn4(LAYOUTRETURN4_FILE,
+                                             layoutreturn_file4(
+                                                 0, 0xffffffffffffffff,
+                                                 opened.layout_stateid,
+                                                 self.return_body))),
+               op.close(0, opened.stateid)]
+        res = sess.compound(ops)
+        check(res)
+
+    def finish(self):
+        """Return every layout, close every open and destroy the sessions
+
+        The sessions are destroyed even when the returns fail, or setup()
+        never ran.
+        """
+        try:
+            if self.opened is not None:
+                pool = ThreadPool(len(self.sessions))
+                try:
+                    pool.map(self._finish, zip(self.sessions, self.opened))
+                finally:
+                    pool.close()
+                    pool.join()
+        finally:
+            for sess in self.sessions + [self.observer]:
+                destroy_session(sess)
+
+
+def report(name, stats):
+    print("%s: %i sessions, %i byte rounds in %i commits: %.0f commits/s "
+          "%.1f MB/s"
+          % (name, stats["sessions"], stats["commit_size"], stats["splits"],
+             stats["commits_per_s"], stats["bytes_per_s"] / (1 << 20)))
+    for what in ("write", "commit", "visibility"):
+        h = stats[what]
+        if h["count"]:
+            print("%s %s: n=%i p50=%.1fms p99=%.1fms max=%.1fms"
+                  % (name, what, h["count"], h["p50"] * 1000,
+                     h["p99"] * 1000, h["max"] * 1000))
+    return stats
@@ -0,0 +1,133 @@
+from multiprocessing.pool import ThreadPool
+from teardown import at_finish
+
+import socket
+import threading
+import time
+
+_clock = getattr(time, "monotonic", time.time)
+
+DNS_TTL = 300           # seconds a successful lookup is reused
+DNS_NEGATIVE_TTL = 30   # seconds a failed lookup is remembered
+DNS_WORKERS = 16
+
+
+class ResolverCache(object):
+    """gethostbyname() with TTL, negative caching and parallel misses
+
+    resolve_all() looks up every uncached name concurrently on a small
+    thread pool, so all the FQDNs of one layout cost a single resolver
+    round trip.  Failed lookups are cached too and re-raised until their
+    negative TTL expires.  The first resolve() of a name resolve_all()
+    just looked up is part of that same lookup, not a hit.
+    """
+    def __init__(self, ttl=DNS_TTL, negative_ttl=DNS_NEGATIVE_TTL,
+                 workers=DNS_WORKERS):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.workers = workers
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.lookup_time = 0.0
+        self._entries = {}  # fqdn -> (expires, ipaddr, error)
+        self._prefetched = set()
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _cached(self, fqdn, now):
+        entry = self._entries.get(fqdn)
+        if entry is None or entry[0] <= now:
+            return None
+        return entry
+
+    def _lookup(self, fqdn):
+        start = _clock()
+        try:
+            ipaddr = socket.gethostbyname(fqdn)
+            error = None
+        except socket.error as e:
+            ipaddr = None
+            error = e
+        now = _clock()
+        ttl = self.negative_ttl if error is not None else self.ttl
+        entry = (now + ttl, ipaddr, error)
+        with self._lock:
+            self._entries[fqdn] = entry
+            self.lookup_time += now - start
+        return entry
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPool(self.workers)
+            return self._pool
+
+    def _entries_for(self, fqdns, prefetch=False):
+        now = _clock()
+        found = {}
+        missing = []
+        with self._lock:
+            for fqdn in fqdns:
+                if fqdn in found or fqdn in missing:
+                    continue
+                entry = self._cached(fqdn, now)
+                if entry is None:
+                    self.misses += 1
+                    missing.append(fqdn)
+                    continue
+                found[fqdn] = entry
+                if fqdn in self._prefetched:
+                    self._prefetched.discard(fqdn)
+                    continue
+                self.hits += 1
+                if entry[2] is not None:
+                    self.negative_hits += 1
+
+        if len(missing) == 1:
+            found[missing[0]] = self._lookup(missing[0])
+        elif missing:
+            entries = self._get_pool().map(self._lookup, missing)
+            found.update(zip(missing, entries))
+        if prefetch and missing:
+            with self._lock:
+                self._prefetched.update(missing)
+        return found
+
+    def resolve(self, fqdn):
+        """Return the address of fqdn, raising the (cached) lookup error"""
+        expires, ipaddr, error = self._entries_for([fqdn])[fqdn]
+        if error is not None:
+            raise error
+        return ipaddr
+
+    def resolve_all(self, fqdns):
+        """Return {fqdn: address or None}, looking up misses in parallel"""
+        return dict((fqdn, entry[1]) for fqdn, entry
+                    in self._entries_for(fqdns, prefetch=True).items())
+
+    def close(self):
+        """Stop the lookup threads; a later resolve_all() starts new ones"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._prefetched.clear()
+            self.hits = self.misses = self.negative_hits = 0
+            self.lookup_time = 0.0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "negative_hits": self.negative_hits,
+                    "size": len(self._entries),
+                    "lookup_seconds": self.lookup_time}
+
+resolver = ResolverCache()
+at_finish(resolver.close)
@@ -0,0 +1,153 @@
+from nfs4_const import NFS4_DEVICEID4_SIZE
+from objlayout import LayoutDecodeError
+
+import collections
+import struct
+
+# Decoder for flex-files (RFC 8435) layout and device address bodies.
+#
+#   struct ff_data_server4 {
+#       deviceid4           ffds_deviceid;
+#       uint32_t            ffds_efficiency;
+#       stateid4            ffds_stateid;
+#       nfs_fh4             ffds_fh_vers<>;
+#       fattr4_owner        ffds_user;
+#       fattr4_owner_group  ffds_group;
+#   };
+#
+#   struct ff_mirror4 {
+#       ff_data_server4     ffm_data_servers<>;
+#   };
+#
+#   struct ff_layout4 {
+#       length4             ffl_stripe_unit;
+#       ff_mirror4          ffl_mirrors<>;
+#       ffl_flags4          ffl_flags;
+#       uint32_t            ffl_stats_collect_hint;
+#   };
+#
+#   struct ff_device_versions4 {
+#       uint32_t            ffdv_version;
+#       uint32_t            ffdv_minorversion;
+#       uint32_t            ffdv_rsize;
+#       uint32_t            ffdv_wsize;
+#       bool                ffdv_tightly_coupled;
+#   };
+#
+#   struct ff_device_addr4 {
+#       multipath_list4     ffda_netaddrs;
+#       ff_device_versions4 ffda_versions<>;
+#   };
+#
+# Bodies are decoded in one pass with precompiled formats.  Mirrors are
+# tuples of FFDataServer, stateids are (seqid, other) and file handles,
+# device ids and stateid others are bytes.
+
+FF_FLAGS_NO_LAYOUTCOMMIT = 0x1
+FF_FLAGS_NO_IO_THRU_MDS = 0x2
+FF_FLAGS_NO_READ_IO = 0x4
+FF_FLAGS_WRITE_ONE_MIRROR = 0x8
+FF_FLAGS_MASK = 0xf
+
+_LAYOUT_HEAD = struct.Struct(">QI")
+_LAYOUT_TAIL = struct.Struct(">II")
+# deviceid, efficiency, stateid seqid and other, ffds_fh_vers count
+_DS_HEAD = struct.Struct(">%isII12sI" % NFS4_DEVICEID4_SIZE)
+_VERSION = struct.Struct(">IIIII")
+_UINT = struct.Struct(">I")
+
+FFDataServer = collections.namedtuple(
+    "FFDataServer", ["ffds_deviceid", "ffds_efficiency", "ffds_stateid",
+                     "ffds_fh_vers", "ffds_user", "ffds_group"])
+
+FFLayout = collections.namedtuple(
+    "FFLayout", ["ffl_stripe_unit", "ffl_mirrors", "ffl_flags",
+                 "ffl_stats_collect_hint"])
+
+FFNetAddr = collections.namedtuple("FFNetAddr", ["na_r_netid", "na_r_addr"])
+
+FFDeviceVersion = collections.namedtuple(
+    "FFDeviceVersion", ["ffdv_version", "ffdv_minorversion", "ffdv_rsize",
+                        "ffdv_wsize", "ffdv_tightly_coupled"])
+
+FFDeviceAddr = collections.namedtuple(
+    "FFDeviceAddr", ["ffda_netaddrs", "ffda_versions"])
+
+
+def _unpack(fmt, buf, pos, what):
+    end = pos + fmt.size
+    if end > len(buf):
+        raise LayoutDecodeError("%s truncated at offset %i" % (what, pos))
+    return fmt.unpack_from(buf, pos), end
+
+
+def _opaque(buf, pos, what):
+    (length,), pos = _unpack(_UINT, buf, pos, what)
+    end = pos + length
+    if end > len(buf):
+        raise LayoutDecodeError("%s truncated at offset %i" % (what, pos))
+    return buf[pos:end].tobytes(), pos + ((length + 3) & ~3)
+
+
+def _string(buf, pos, what):
+    value, pos = _opaque(buf, pos, what)
+    return value.decode("utf-8", "replace"), pos
+
+
+def _done(buf, pos):
+    if pos != len(buf):
+        raise LayoutDecodeError("Unextracted data remains (%i bytes)"
+                                % (len(buf) - pos))
+
+
+def decode_ff_layout(body):
+    """Decode an ff_layout4 body into an FFLayout"""
+    buf = memoryview(body)
+    what = "Layout body"
+    (stripe_unit, nmirrors), pos = _unpack(_LAYOUT_HEAD, buf, 0, what)
+    mirrors = []
+    for m in range(nmirrors):
+        (nservers,), pos = _unpack(_UINT, buf, pos, what)
+        servers = []
+        for s in range(nservers):
+            (dev_id, efficiency, seqid, other, nfh), pos = \
+                _unpack(_DS_HEAD, buf, pos, what)
+            fhs = []
+            for f in range(nfh):
+                fh, pos = _opaque(buf, pos, what)
+                fhs.append(fh)
+            user, pos = _string(buf, pos, what)
+            group, pos = _string(buf, pos, what)
+            servers.append(FFDataServer(dev_id, efficiency, (seqid, other),
+                                        tuple(fhs), user, group))
+        mirrors.append(tuple(servers))
+    (flags, hint), pos = _unpack(_LAYOUT_TAIL, buf, pos, what)
+    _done(buf, pos)
+    return FFLayout(stripe_unit, tuple(mirrors), flags, hint)
+
+
+def ff_layout_devices(layout):
+    """Device ids of every data server, mirror by mirror"""
+    return tuple(ds.ffds_deviceid
+                 for mirror in layout.ffl_mirrors for ds in mirror)
+
+
+def decode_ff_deviceaddr(body):
+    """Decode an ff_device_addr4 body into an FFDeviceAddr"""
+    buf = memoryview(body)
+    what = "Device address body"
+    (naddrs,), pos = _unpack(_UINT, buf, 0, what)
+    netaddrs = []
+    for i in range(naddrs):
+        netid, pos = _string(buf, pos, what)
+        addr, pos = _string(buf, pos, what)
+        netaddrs.append(FFNetAddr(netid, addr))
+    (nversions,), pos = _unpack(_UINT, buf, pos, what)
+    versions = []
+    for i in range(nversions):
+        (version, minor, rsize, wsize, tight), pos = \
+            _unpack(_VERSION, buf, pos, what)
+        versions.append(FFDeviceVersion(version, minor, rsize, wsize,
+                                        bool(tight)))
+    _done(buf, pos)
+    return FFDeviceAddr(tuple(netaddrs), tuple(versions))
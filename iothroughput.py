@@ -0,0 +1,196 @@
+from nfs4_const import *
+from nfs4_type import *
+from environment import check, fail
+import nfs4_ops as op
+from nfs4client import NFS4Client
+from layoutcheck import LAYOUT_TYPES, get_deviceaddr
+from recalltiming import percentile
+from seeding import Pattern
+from sessionpool import destroy_session
+
+import collections
+import time
+
+_clock = getattr(time, "monotonic", time.time)
+
+IO_SIZE = 1 << 20       # bytes per WRITE or READ
+IO_DURATION = 10.0      # seconds each run keeps the slots busy
+IO_SPAN = 64 << 20      # offsets cycle through the first IO_SPAN bytes
+COMPOUND_OVERHEAD = 1024
+
+ANONYMOUS_STATEID = stateid4(0, "\0" * 12)
+
+# client is the data server connection of a ds_target(), None otherwise
+IOTarget = collections.namedtuple(
+    "IOTarget", ["name", "sess", "fh", "stateid", "rsize", "wsize",
+                 "client"])
+
+
+def _channel_sizes(sess):
+    attrs = sess.fore_channel.attrs
+    return (attrs.ca_maxresponsesize - COMPOUND_OVERHEAD,
+            attrs.ca_maxrequestsize - COMPOUND_OVERHEAD)
+
+
+def mds_target(sess, fh, stateid, name="mds"):
+    """I/O through the metadata server on an open file"""
+    rsize, wsize = _channel_sizes(sess)
+    return IOTarget(name, sess, fh, stateid, rsize, wsize, None)
+
+
+def _obj_ds_version(decode):
+    return 1, None, None
+
+
+def _ff_ds_version(decode):
+    for v in decode.ffda_versions:
+        if v.ffdv_version == 4 and v.ffdv_minorversion >= 1:
+            return v.ffdv_minorversion, v.ffdv_rsize, v.ffdv_wsize
+    fail("Data server offers no NFSv4.1 or later version")
+
+# (minorversion, rsize, wsize) of a data server; None for the session limit
+_DS_VERSION = {
+    LAYOUT4_OBJECTS_V2: _obj_ds_version,
+    LAYOUT4_FLEX_FILES: _ff_ds_version,
+}
+
+
+def ds_target(sess, layout, name, index=0):
+    """I/O straight to the index'th data server of a layout
+
+    A session is established with the data server at the first address
+    of its device, and I/O uses the file handle and stateid the layout
+    gives for it (the anonymous stateid when it gives none).  Give the
+    session back with close_target() once done.
+    """
+    kind = LAYOUT_TYPES[layout.loc_type]
+    handles = list(kind.handles(kind.decode(layout.loc_body)))
+    if not 0 <= index < len(handles):
+        fail("Layout has %i data servers, no #%i" % (len(handles), index))
+    dev_id, fh, stateid = handles[index]
+    if fh is None:
+        fail("Layout gives no file handle for data server #%i" % index)
+    stateid = ANONYMOUS_STATEID if stateid is None else stateid4(*stateid)
+
+    decode = get_deviceaddr(sess, dev_id, layout.loc_type)
+    minorversion, rsize, wsize = _DS_VERSION[layout.loc_type](decode)
+    endpoints = kind.endpoints(decode)
+    if not endpoints:
+        fail("Data server #%i has no address" % index)
+    host, port = endpoints[0]
+    client = NFS4Client(host, port, minorversion=minorversion)
+    try:
+        ds_sess = client.new_client_session(name,
+                                            flags=EXCHGID4_FLAG_USE_PNFS_DS)
+    except Exception:
+        client.close()
+        raise
+    channel_rsize, channel_wsize = _channel_sizes(ds_sess)
+    return IOTarget("%s:%i" % (host, port), ds_sess, fh, stateid,
+                    min(rsize or channel_rsize, channel_rsize),
+                    min(wsize or channel_wsize, channel_wsize), client)
+
+
+def close_target(target):
+    """Destroy the data server session of a ds_target() and close its
+    connection; nothing to do for an mds_target()
+    """
+    if target.client is None:
+        return
+    try:
+        destroy_session(target.sess)
+    finally:
+        target.client.close()
+
+
+def _slotid(res, lane):
+    # The SEQUENCE reply names the slot; fall back on the pipeline lane
+    if res.resarray and res.resarray[0].resop == OP_SEQUENCE:
+        return getattr(res.resarray[0], "sr_slotid", lane)
+    return lane
+
+
+def run_io(target, mode="write", size=IO_SIZE, duration=IO_DURATION,
+           count=None, span=IO_SPAN, stable=UNSTABLE4, window=None):
+    """Keep every fore channel slot busy with WRITE or READ compounds
+
+    Sends size-byte WRITEs (mode "write") or READs (mode "read") at
+    offsets cycling through the first span bytes of the target file,
+    with up to window compounds in flight (default: the slot table),
+    for duration seconds or count compounds.  Unstable writes are
+    committed before the clock stops.  Returns a dict with MB/s, ops/s
+    and latency percentiles per slot.
+    """
+    if mode not in ("write", "read"):
+        fail("Unknown I/O mode %r" % mode)
+    sess = target.sess
+    size = min(size, target.wsize if mode == "write" else target.rsize)
+    if window is None:
+        window = sess.fore_channel.attrs.ca_maxrequests
+    window = max(window, 1)
+    steps = max(span // size, 1)
+    data = Pattern(size)[0:size]
+
+    def request(i):
+        offset = (i % steps) * size
+        if mode == "write":
+            return [op.putfh(target.fh),
+                    op.write(target.stateid, offset, stable, data)]
+        return [op.putfh(target.fh), op.read(target.stateid, offset, size)]
+
+    latencies = collections.defaultdict(list)
+    pending = collections.deque()
+    moved = [0]
+
+    def complete():
+        slot, lane, sent = pending.popleft()
+        res = sess.listen(slot)
+        latency = _clock() - sent
+        check(res, msg="%s %s" % (target.name, mode.upper()))
+        result = res.resarray[-1]
+        moved[0] += result.count if mode == "write" else len(result.data)
+        latencies[_slotid(res, lane)].append(latency)
+
+    start = _clock()
+    deadline = start + duration
+    sent = 0
+    while (count is None and _clock() < deadline) or \
+          (count is not None and sent < count):
+        if len(pending) >= window:
+            complete()
+        pending.append((sess.compound_async(request(sent)), sent % window,
+                        _clock()))
+        sent += 1
+    while pending:
+        complete()
+    if mode == "write" and stable != FILE_SYNC4:
+        res = sess.compound([op.putfh(target.fh), op.commit(0, 0)])
+        check(res, msg="%s COMMIT" % target.name)
+    elapsed = _clock() - start
+
+    slots = {}
+    for slotid, values in latencies.items():
+        values.sort()
+        slots[slotid] = {"count": len(values),
+                         "p50": percentile(values, 50),
+                         "p99": percentile(values, 99),
+                         "max": values[-1]}
+    return {"target": target.name, "mode": mode, "size": size,
+            "window": window, "ops": sent, "bytes": moved[0],
+            "seconds": elapsed,
+            "mb_per_s": moved[0] / elapsed / (1 << 20) if elapsed else 0.0,
+            "ops_per_s": sent / elapsed if elapsed else 0.0,
+            "slots": slots}
+
+
+def report(name, stats):
+    print("%s %s %s: %.1f MB/s %.0f ops/s (%i x %i bytes, %i slots)"
+          % (name, stats["target"], stats["mode"], stats["mb_per_s"],
+             stats["ops_per_s"], stats["ops"], stats["size"],
+             stats["window"]))
+    for slotid in sorted(stats["slots"]):
+        h = stats["slots"][slotid]
+        print("%s %s %s slot %s: n=%i p50=%.1fms p99=%.1fms max=%.1fms"
+              % (name, stats["target"], stats["mode"], slotid, h["count"],
+                 h["p50"] * 1000, h["p99"] * 1000, h["max"] * 1000))
+    return stats
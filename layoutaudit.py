@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+"""Offline validation of layouts captured on the wire
+
+Runs the layoutcheck rules over LAYOUTGET and GETDEVICEINFO replies
+taken from a pcap (such as the traces PcapEngine collects for the
+delegation and layout pipeline suites) or from any iterable of records:
+
+    ("layout", fh, loc_type, loc_body)
+    ("device", deviceid, layout_type, da_addr_body)
+
+Identical bodies are validated once, the checks run in a multiprocessing
+pool, and results are aggregated per file handle and per device.
+
+    python layoutaudit.py [-j PROCS] trace.pcap [trace.pcap ...]
+"""
+from nfs4_const import *
+from nfs4_pack import NFS4Unpacker
+from testmod import FailureException
+from layoutrules import validators
+from layoutcheck import LAYOUT_TYPES
+
+from multiprocessing import Pool
+from optparse import OptionParser
+
+import binascii
+import collections
+import json
+import struct
+import sys
+
+NFS_PORT = 2049
+NFS_PROGRAM = 100003
+NFSPROC4_COMPOUND = 1
+RPC_CALL = 0
+RPC_REPLY = 1
+
+_PCAP_MAGIC = {
+    b"\xa1\xb2\xc3\xd4": ">", b"\xd4\xc3\xb2\xa1": "<",
+    b"\xa1\xb2\x3c\x4d": ">", b"\x4d\x3c\xb2\xa1": "<",
+}
+_LINKTYPE_ETHERNET = 1
+_LINKTYPE_LINUX_SLL = 113
+_ETH_IPV4 = 0x0800
+_ETH_IPV6 = 0x86dd
+_ETH_VLAN = 0x8100
+_IPPROTO_TCP = 6
+
+_U32 = struct.Struct(">I")
+
+
+# Validation, run in the worker processes
+
+def audit_layout(lo_type, body):
+    """Return (errors, device ids) for one layout body"""
+    try:
+        kind = LAYOUT_TYPES[lo_type]
+        opaque = kind.decode(body)
+        errors = validators[lo_type].validate(opaque)
+        if errors:
+            return errors, ()
+        dev_ids = kind.dev_ids(opaque)
+    except FailureException as e:
+        return [str(e)], ()
+    except Exception as e:
+        # LayoutDecodeError, or a truncated body (EOFError, struct.error)
+        return ["Undecodable layout: %s" % e], ()
+    return [], dev_ids
+
+
+def audit_deviceaddr(lo_type, body):
+    """Return the errors found in one device address body"""
+    try:
+        kind = LAYOUT_TYPES[lo_type]
+        kind.check_deviceaddr(kind.decode_deviceaddr(body))
+    except FailureException as e:
+        return [str(e)]
+    except Exception as e:
+        return ["Undecodable device address: %s" % e]
+    return []
+
+
+def _audit_one(item):
+    kind, lo_type, body = item
+    if kind == "layout":
+        errors, dev_ids = audit_layout(lo_type, body)
+    else:
+        errors, dev_ids = audit_deviceaddr(lo_type, body), ()
+    return item, errors, dev_ids
+
+
+# Aggregation
+
+class AuditReport(object):
+    def __init__(self):
+        self.layouts = 0
+        self.failed_layouts = 0
+        self.device_replies = 0
+        self.failed_devices = 0
+        self.unique_bodies = 0
+        self.files = collections.defaultdict(
+            lambda: {"layouts": 0, "failed": 0,
+                     "errors": collections.Counter(), "devices": set()})
+        self.devices = collections.defaultdict(
+            lambda: {"layouts": 0, "addr_replies": 0, "failed": 0,
+                     "errors": collections.Counter(), "files": set()})
+
+    def add_layout(self, fh, errors, dev_ids):
+        self.layouts += 1
+        entry = self.files[fh]
+        entry["layouts"] += 1
+        if errors:
+            self.failed_layouts += 1
+            entry["failed"] += 1
+            entry["errors"].update(errors)
+        for dev_id in set(dev_ids):
+            entry["devices"].add(dev_id)
+            device = self.devices[dev_id]
+            device["layouts"] += 1
+            device["files"].add(fh)
+
+    def add_device(self, dev_id, errors):
+        self.device_replies += 1
+        device = self.devices[dev_id]
+        device["addr_replies"] += 1
+        if errors:
+            self.failed_devices += 1
+            device["failed"] += 1
+            device["errors"].update(errors)
+
+    def as_dict(self):
+        def hexkey(key):
+            if key is None:
+                return "unknown"
+            return binascii.hexlify(key).decode("ascii")
+
+        return {
+            "layouts": self.layouts,
+            "failed_layouts": self.failed_layouts,
+            "device_replies": self.device_replies,
+            "failed_devices": self.failed_devices,
+            "unique_bodies": self.unique_bodies,
+            "files": dict((hexkey(fh),
+                           {"layouts": e["layouts"], "failed": e["failed"],
+                            "errors": dict(e["errors"]),
+                            "devices": sorted(hexkey(d)
+                                              for d in e["devices"])})
+                          for fh, e in self.files.items()),
+            "devices": dict((hexkey(dev_id),
+                             {"layouts": e["layouts"],
+                              "addr_replies": e["addr_replies"],
+                              "failed": e["failed"],
+                              "errors": dict(e["errors"]),
+                              "files": len(e["files"])})
+                            for dev_id, e in self.devices.items()),
+        }
+
+
+def audit(records, processes=None, chunksize=64):
+    """Validate a stream of records in a process pool"""
+    # Servers hand out the same body many times; check each one once.
+    owners = collections.OrderedDict()
+    for kind, key, lo_type, body in records:
+        owners.setdefault((kind, lo_type, body), []).append(key)
+
+    report = AuditReport()
+    report.unique_bodies = len(owners)
+    pool = Pool(processes)
+    try:
+        for item, errors, dev_ids in pool.imap_unordered(
+                _audit_one, owners.keys(), chunksize):
+            kind = item[0]
+            for key in owners[item]:
+                if kind == "layout":
+                    report.add_layout(key, errors, dev_ids)
+                else:
+                    report.add_device(key, errors)
+    finally:
+        pool.close()
+        pool.join()
+    return report
+
+
+# pcap extraction
+
+def _pcap_packets(path):
+    """Yield the link-layer frames of a classic pcap file"""
+    f = open(path, "rb")
+    try:
+        header = f.read(24)
+        if len(header) < 24 or header[:4] not in _PCAP_MAGIC:
+            raise ValueError("%s is not a pcap file" % path)
+        endian = _PCAP_MAGIC[header[:4]]
+        linktype, = struct.unpack(endian + "I", header[20:24])
+        record = struct.Struct(endian + "IIII")
+        while True:
+            hdr = f.read(record.size)
+            if len(hdr) < record.size:
+                break
+            sec, frac, caplen, origlen = record.unpack(hdr)
+            yield linktype, f.read(caplen)
+    finally:
+        f.close()
+
+
+def _tcp_segment(linktype, frame):
+    """Return (flow, seq, payload) for a TCP frame, else None"""
+    if linktype == _LINKTYPE_ETHERNET:
+        pos = 12
+    elif linktype == _LINKTYPE_LINUX_SLL:
+        pos = 14
+    else:
+        return None
+    ethertype, = struct.unpack_from(">H", frame, pos)
+    pos += 2
+    while ethertype == _ETH_VLAN:
+        ethertype, = struct.unpack_from(">H", frame, pos + 2)
+        pos += 4
+
+    if ethertype == _ETH_IPV4:
+        ihl = (ord(frame[pos:pos + 1]) & 0x0f) * 4
+        total, = struct.unpack_from(">H", frame, pos + 2)
+        if ord(frame[pos + 9:pos + 10]) != _IPPROTO_TCP:
+            return None
+        src, dst = frame[pos + 12:pos + 16], frame[pos + 16:pos + 20]
+        end = pos + total
+        pos += ihl
+    elif ethertype == _ETH_IPV6:
+        payload_len, = struct.unpack_from(">H", frame, pos + 4)
+        if ord(frame[pos + 6:pos + 7]) != _IPPROTO_TCP:
+            return None
+        src, dst = frame[pos + 8:pos + 24], frame[pos + 24:pos + 40]
+        pos += 40
+        end = pos + payload_len
+    else:
+        return None
+
+    sport, dport, seq = struct.unpack_from(">HHI", frame, pos)
+    offset = (ord(frame[pos + 12:pos + 13]) >> 4) * 4
+    payload = frame[pos + offset:end]
+    if not payload or NFS_PORT not in (sport, dport):
+        return None
+    return (src, sport, dst, dport), seq, payload
+
+
+def _tcp_streams(path):
+    """Reassemble the NFS TCP streams of a pcap, one bytes object each"""
+    segments = collections.defaultdict(dict)
+    for linktype, frame in _pcap_packets(path):
+        try:
+            segment = _tcp_segment(linktype, frame)
+        except (struct.error, TypeError):
+            continue
+        if segment is not None:
+            flow, seq, payload = segment
+            segments[flow].setdefault(seq, payload)
+
+    for flow, by_seq in segments.items():
+        chunks = []
+        expected = None
+        for seq in sorted(by_seq):
+            payload = by_seq[seq]
+            if expected is not None and seq < expected:
+                payload = payload[expected - seq:]
+            elif expected is not None and seq > expected:
+                # Lost segment: the rest of this stream cannot be framed
+                break
+            chunks.append(payload)
+            expected = seq + len(by_seq[seq])
+        yield flow, b"".join(chunks)
+
+
+def _rpc_messages(stream):
+    """Split a stream into RPC messages using record marking"""
+    pos = 0
+    fragments = []
+    while pos + 4 <= len(stream):
+        mark, = _U32.unpack_from(stream, pos)
+        length = mark & 0x7fffffff
+        pos += 4
+        if pos + length > len(stream):
+            break
+        fragments.append(stream[pos:pos + length])
+        pos += length
+        if mark & 0x80000000:
+            yield b"".join(fragments)
+            fragments = []
+
+
+def _skip_opaque_auth(msg, pos):
+    flavor, length = struct.unpack_from(">II", msg, pos)
+    return flavor, pos + 8 + ((length + 3) & ~3)
+
+
+def _parse_call(msg):
+    """Return (xid, COMPOUND4args) of an NFSv4 COMPOUND call, else None"""
+    xid, mtype, rpcvers, prog, vers, proc = struct.unpack_from(">6I", msg)
+    if mtype != RPC_CALL or prog != NFS_PROGRAM or vers != 4 or \
+       proc != NFSPROC4_COMPOUND:
+        return None
+    flavor, pos = _skip_opaque_auth(msg, 24)
+    if flavor == RPCSEC_GSS:
+        return None
+    flavor, pos = _skip_opaque_auth(msg, pos)
+    return xid, NFS4Unpacker(msg[pos:]).unpack_COMPOUND4args()
+
+
+def _parse_reply(msg):
+    """Return (xid, body) of an accepted, successful RPC reply, else None"""
+    xid, mtype, reply_stat = struct.unpack_from(">3I", msg)
+    if mtype != RPC_REPLY or reply_stat != 0:
+        return None
+    flavor, pos = _skip_opaque_auth(msg, 12)
+    accept_stat, = _U32.unpack_from(msg, pos)
+    if accept_stat != 0:
+        return None
+    return xid, msg[pos + 4:]
+
+
+def _compound_records(args, res):
+    """Yield records for the LAYOUTGET/GETDEVICEINFO results of a compound"""
+    fh = None
+    for arg, result in zip(args.argarray, res.resarray):
+        if arg.argop == OP_PUTFH:
+            fh = arg.opputfh.object
+        elif arg.argop in (OP_PUTROOTFH, OP_PUTPUBFH, OP_LOOKUP, OP_LOOKUPP,
+                           OP_OPEN, OP_CREATE, OP_RESTOREFH):
+            fh = None
+
+        if result.resop == OP_GETFH and result.opgetfh.status == NFS4_OK:
+            fh = result.opgetfh.resok4.object
+        elif result.resop == OP_LAYOUTGET and \
+                result.oplayoutget.logr_status == NFS4_OK:
+            for layout in result.oplayoutget.logr_resok4.logr_layout:
+                yield "layout", fh, layout.loc_type, layout.loc_body
+        elif result.resop == OP_GETDEVICEINFO and \
+                result.opgetdeviceinfo.gdir_status == NFS4_OK:
+            addr = result.opgetdeviceinfo.gdir_resok4.gdir_device_addr
+            yield ("device", arg.opgetdeviceinfo.gdia_device_id,
+                   addr.da_layout_type, addr.da_addr_body)
+
+
+def records_from_pcap(path):
+    """Yield layout and device records from the NFSv4 traffic of a pcap"""
+    calls = {}
+    replies = []
+    for flow, stream in _tcp_streams(path):
+        src, sport, dst, dport = flow
+        to_server = dport == NFS_PORT
+        for msg in _rpc_messages(stream):
+            try:
+                if to_server:
+                    call = _parse_call(msg)
+                    if call is not None:
+                        calls[(src, sport, call[0])] = call[1]
+                else:
+                    reply = _parse_reply(msg)
+                    if reply is not None:
+                        replies.append(((dst, dport, reply[0]), reply[1]))
+            except Exception:
+                # Not an NFSv4 COMPOUND we can decode (callbacks, GSS...)
+                continue
+
+    for key, body in replies:
+        args = calls.get(key)
+        if args is None:
+            continue
+        try:
+            res = NFS4Unpacker(body).unpack_COMPOUND4res()
+        except Exception:
+            continue
+        for record in _compound_records(args, res):
+            yield record
+
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options] trace.pcap [trace.pcap ...]")
+    parser.add_option("-j", "--processes", type="int", default=None,
+                      help="worker processes (default: one per CPU)")
+    opts, paths = parser.parse_args(argv)
+    if not paths:
+        parser.error("no pcap files given")
+
+    def records():
+        for path in paths:
+            for record in records_from_pcap(path):
+                yield record
+
+    report = audit(records(), opts.processes)
+    json.dump(report.as_dict(), sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write("\n")
+    return 1 if report.failed_layouts or report.failed_devices else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
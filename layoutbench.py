@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""Microbenchmark of layout decoding and validation
+
+Builds synthetic layout bodies with ObjV2Packer (objects) and NFS4Packer
+(flex files), sweeping the number of components, the mirror count and the
+size of the auth blobs, and times
+
+    decode      the generated XDR unpacker over the whole body
+    view        ObjLayoutView walking every component, or decode_ff_layout
+    validate    the compiled rule table (layoutrules.validators)
+
+For flex-files layouts the components are the data servers of each
+mirror and the auth size is the length of ffds_user and ffds_group.
+
+Results are written as JSON, one entry per (layout type, components,
+mirrors, auth size), so runs can be compared over time.
+
+    python layoutbench.py [-c 1,10,100] [-m 0,1] [-a 0,64] [-o out.json]
+"""
+from nfs4_const import *
+from nfs4_type import *
+from nfs4_pack import NFS4Packer, NFS4Unpacker
+from pnfs_obj_v2_const import *
+from pnfs_obj_v2_type import *
+from obj_v2 import Packer as ObjV2Packer, Unpacker as ObjV2Unpacker
+from objlayout import ObjLayoutView
+from flexfiles import decode_ff_layout
+from layoutrules import validators
+
+from optparse import OptionParser
+
+import gc
+import json
+import platform
+import struct
+import sys
+import time
+import timeit
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+try:
+    import resource
+except ImportError:
+    resource = None
+
+COMPONENTS = (1, 10, 100, 1000, 10000)
+MIRRORS = (0, 1, 2)
+AUTH_SIZES = (0, 64, 400)
+STRIPE_UNIT = 64 * 1024
+MIN_TIME = 0.2   # seconds each measurement is repeated for
+
+
+def make_obj_body(ncomps, mirror_cnt, auth_size):
+    """Pack a RAID0 pnfs_obj_layout4 with ncomps components per mirror"""
+    total = ncomps * (mirror_cnt + 1)
+    components = []
+    for i in range(total):
+        dev_id = struct.pack(">QQ", 0, i)
+        fh = struct.pack(">QQ", 1, i)
+        auth = opaque_auth(AUTH_SYS, b"\0" * auth_size)
+        components.append(
+            pnfs_obj_object_cred4(PNFS_OBJ_NFS,
+                                  pnfs_obj_nfs_cred4(dev_id, fh, auth)))
+    lo_map = pnfs_obj_data_map4(total, STRIPE_UNIT, 0, 0, mirror_cnt,
+                                PNFS_OBJ_RAID_0)
+    p = ObjV2Packer()
+    p.pack_pnfs_obj_layout4(pnfs_obj_layout4(lo_map, 0, components))
+    return p.get_buffer()
+
+
+def make_ff_body(ncomps, mirror_cnt, auth_size):
+    """Pack an ff_layout4 of mirror_cnt + 1 mirrors of ncomps data servers"""
+    name = b"u" * auth_size
+    mirrors = []
+    for m in range(mirror_cnt + 1):
+        servers = []
+        for i in range(ncomps):
+            dev_id = struct.pack(">QQ", m, i)
+            fh = struct.pack(">QQ", 1, i)
+            servers.append(ff_data_server4(dev_id, 1, stateid4(0, b"\0" * 12),
+                                           [fh], name, name))
+        mirrors.append(ff_mirror4(servers))
+    p = NFS4Packer()
+    p.pack_ff_layout4(ff_layout4(STRIPE_UNIT, mirrors, 0, 0))
+    return p.get_buffer()
+
+
+def _decode_obj(body):
+    p = ObjV2Unpacker(body)
+    layout = p.unpack_pnfs_obj_layout4()
+    p.done()
+    return layout
+
+
+def _view_obj(body):
+    view = ObjLayoutView(body)
+    list(view.olo_components)
+    view.done()
+    return view
+
+
+def _decode_ff(body):
+    p = NFS4Unpacker(body)
+    layout = p.unpack_ff_layout4()
+    p.done()
+    return layout
+
+# lo_type -> (body maker, generated unpacker, native decoder)
+LAYOUTS = {
+    LAYOUT4_OBJECTS_V2: (make_obj_body, _decode_obj, _view_obj),
+    LAYOUT4_FLEX_FILES: (make_ff_body, _decode_ff, decode_ff_layout),
+}
+
+
+def _validator(lo_type):
+    validator = validators[lo_type]
+    view = LAYOUTS[lo_type][2]
+
+    def validate(body):
+        errors = validator.validate(view(body))
+        if errors:
+            raise ValueError("Synthetic layout is invalid: %s" % errors)
+    return validate
+
+
+def rate(func, body, min_time=MIN_TIME):
+    """Return calls per second of func(body)"""
+    timer = timeit.default_timer
+    calls = 0
+    batch = 1
+    start = timer()
+    elapsed = 0.0
+    while elapsed < min_time:
+        for i in range(batch):
+            func(body)
+        calls += batch
+        batch *= 2
+        elapsed = timer() - start
+    return calls / elapsed
+
+
+def memory(func, body):
+    """Return (peak bytes, net retained blocks) of one func(body) call
+
+    Retained blocks are those still allocated once the call returns,
+    the result's included, net of any freed; temporaries do not count.
+    """
+    if tracemalloc is None:
+        return None, None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        result = func(body)
+        after = tracemalloc.take_snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff
+                 for stat in after.compare_to(before, "filename"))
+    del result
+    return peak, blocks
+
+
+def bench(lo_type, ncomps, mirror_cnt, auth_size, min_time=MIN_TIME):
+    make_body, decode, view = LAYOUTS[lo_type]
+    body = make_body(ncomps, mirror_cnt, auth_size)
+    decode_peak, decode_blocks = memory(decode, body)
+    view_peak, view_blocks = memory(view, body)
+    return {
+        "layout_type": lo_type,
+        "components": ncomps * (mirror_cnt + 1),
+        "mirror_cnt": mirror_cnt,
+        "auth_size": auth_size,
+        "body_bytes": len(body),
+        "decodes_per_sec": rate(decode, body, min_time),
+        "views_per_sec": rate(view, body, min_time),
+        "validations_per_sec": rate(_validator(lo_type), body, min_time),
+        "decode_peak_bytes": decode_peak,
+        "decode_retained_blocks": decode_blocks,
+        "view_peak_bytes": view_peak,
+        "view_retained_blocks": view_blocks,
+    }
+
+
+def _ints(option, opt, value, parser):
+    setattr(parser.values, option.dest, [int(v) for v in value.split(",")])
+
+
+def main(argv=None):
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option("-c", "--components", action="callback", type="string",
+                      callback=_ints, default=list(COMPONENTS),
+                      help="components per mirror, comma separated")
+    parser.add_option("-m", "--mirrors", action="callback", type="string",
+                      callback=_ints, default=list(MIRRORS),
+                      help="mirror counts, comma separated")
+    parser.add_option("-a", "--auth-sizes", action="callback", type="string",
+                      callback=_ints, default=list(AUTH_SIZES),
+                      help="auth body sizes in bytes, comma separated")
+    parser.add_option("-t", "--min-time", type="float", default=MIN_TIME,
+                      help="seconds to repeat each measurement")
+    parser.add_option("-o", "--output", default=None,
+                      help="write JSON here instead of stdout")
+    opts, args = parser.parse_args(argv)
+
+    results = []
+    for lo_type in sorted(LAYOUTS):
+        for ncomps in opts.components:
+            for mirror_cnt in opts.mirrors:
+                for auth_size in opts.auth_sizes:
+                    results.append(bench(lo_type, ncomps, mirror_cnt,
+                                         auth_size, opts.min_time))
+
+    report = {"python": platform.python_version(),
+              "time": time.time(),
+              "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+              if resource is not None else None,
+              "results": results}
+    out = open(opts.output, "w") if opts.output else sys.stdout
+    try:
+        json.dump(report, out, indent=2, sort_keys=True)
+        out.write("\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
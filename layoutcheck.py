@@ -1,29 +1,318 @@
 from nfs4_const import *
 from nfs4_type import *
 from environment import check, fail
+from testmod import FailureException
 import nfs4_ops as op
 from pnfs_obj_v2_const import *
 from pnfs_obj_v2_type import *
 from obj_v2 import Unpacker as ObjV2Unpacker
+from objlayout import ObjLayoutView, LayoutDecodeError
+from flexfiles import decode_ff_layout, decode_ff_deviceaddr, \
+    ff_layout_devices
+from layoutrules import validators
+from dnscache import resolver
+from topology import topology
+from cbdispatch import add_cb_hook
+from nfs4_pack import NFS4Unpacker
+from multiprocessing.pool import ThreadPool
 
 import socket
-import math
 import threading
+import collections
+import time
+
+_clock = getattr(time, "monotonic", time.time)
+
+DEVICE_CACHE_SIZE = 4096
+LAYOUT_MEMO_SIZE = 1024
+
+NFS_PORT = 2049
+PROBE_TIMEOUT = 3.0   # seconds before a data server counts as unreachable
+PROBE_SLOW = 0.5      # connect latency above which a data server is slow
+PROBE_WORKERS = 32
+DEVICE_WORKERS = 16   # GETDEVICEINFO compounds in flight per resolve
+# Notifications asked for in GETDEVICEINFO, keeping device_cache fresh
+DEVICE_NOTIFY = (1 << NOTIFY_DEVICEID4_CHANGE) | \
+    (1 << NOTIFY_DEVICEID4_DELETE)
+
+
+class DeviceCache(object):
+    """Bounded LRU of decoded device addresses
+
+    Entries are keyed by (clientid, deviceid, layout type), so every
+    component of a layout and every later LAYOUTGET by the same client
+    shares a single GETDEVICEINFO round trip.  Only addresses the server
+    agreed to send CB_NOTIFY_DEVICEID for are kept; unnotified counts
+    the others.
+    """
+    def __init__(self, maxsize=DEVICE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.unnotified = 0
+        self.watched = set()
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                decode = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._entries[key] = decode
+            self.hits += 1
+            return decode
+
+    def put(self, key, decode, notified=True):
+        with self._lock:
+            if not notified:
+                # Nothing would tell us when it goes stale
+                self.unnotified += 1
+                return
+            self._entries.pop(key, None)
+            self._entries[key] = decode
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, clientid, dev_id, lo_type):
+        with self._lock:
+            self._entries.pop((clientid, dev_id, lo_type), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.unnotified = 0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "unnotified": self.unnotified,
+                    "size": len(self._entries)}
+
+device_cache = DeviceCache()
+
+# lo_map is the olo_map fields of an objects layout, or (ffl_stripe_unit,
+# mirror count, ffl_flags, ffl_stats_collect_hint) of a flex-files one.
+LayoutSummary = collections.namedtuple(
+    "LayoutSummary", ["lo_type", "lo_map", "comps_index", "dev_ids"])
+
+
+class LayoutMemo(object):
+    """Verdicts of layout bodies that were already validated
+
+    Servers often hand out byte-identical loc_body blobs for the same
+    file.  Entries are found by (loc_type, length, hash(loc_body)) and
+    confirmed by comparing the stored body.  They hold the failure raised
+    by decoding or the rule table (None when valid), a LayoutSummary and
+    the seconds those checks took, which are added to saved_time on
+    every hit.  Device checks depend on the client and are not memoised.
+    """
+    def __init__(self, maxsize=LAYOUT_MEMO_SIZE):
+        self.maxsize = maxsize
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self.saved_time = 0.0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(lo_type, body):
+        return lo_type, len(body), hash(body)
+
+    def get(self, lo_type, body):
+        key = self._key(lo_type, body)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] != body:
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            self.saved_time += entry[3]
+            return entry[1], entry[2]
+
+    def put(self, lo_type, body, error, summary, cost):
+        key = self._key(lo_type, body)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (body, error, summary, cost)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+            self.saved_time = 0.0
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "size": len(self._entries),
+                    "saved_seconds": self.saved_time}
+
+layout_memo = LayoutMemo()
+
+
+def cache_stats():
+    """Counters of the layout check caches, for reporting from tests"""
+    return {"devices": device_cache.stats(),
+            "layouts": layout_memo.stats(),
+            "dns": resolver.stats(),
+            "topology": topology.stats(),
+            "rules": dict((lo_type, v.stats())
+                          for lo_type, v in validators.items())}
+
+
+def _notified_devices(change):
+    """Yield (layout type, deviceid) for each entry of a notify4"""
+    mask = change.notify_mask[0] if change.notify_mask else 0
+    p = NFS4Unpacker(change.notify_vals)
+    if mask & (1 << NOTIFY_DEVICEID4_CHANGE):
+        ndc = p.unpack_notify_deviceid_change4()
+        yield ndc.ndc_layouttype, ndc.ndc_deviceid
+    if mask & (1 << NOTIFY_DEVICEID4_DELETE):
+        ndd = p.unpack_notify_deviceid_delete4()
+        yield ndd.ndd_layouttype, ndd.ndd_deviceid
+
+
+def watch_device_notify(client, cache=None):
+    """Invalidate cached addresses when client receives CB_NOTIFY_DEVICEID"""
+    if cache is None:
+        cache = device_cache
+
+    def pre_hook(arg, env):
+        for change in arg.cnda_changes:
+            for lo_type, dev_id in _notified_devices(change):
+                cache.invalidate(client.clientid, dev_id, lo_type)
+
+    add_cb_hook(client, OP_CB_NOTIFY_DEVICEID, pre_hook, internal=True)
+    cache.watched.add(client.clientid)
+
+
+def _fore_channel_max_ops(sess):
+    # One of the fore channel's operations is taken by SEQUENCE
+    return max(sess.fore_channel.attrs.ca_maxoperations - 1, 1)
+
+
+def _fore_channel_max_requests(sess):
+    return max(sess.fore_channel.attrs.ca_maxrequests, 1)
+
+
+def _decode_deviceaddr(reply, lo_type):
+    if reply.da_layout_type != lo_type:
+        fail(LAYOUT_TYPES[lo_type].wrong_device_type)
+
+    return LAYOUT_TYPES[lo_type].decode_deviceaddr(reply.da_addr_body)
+
+
+def _bitmap(value):
+    """A bitmap4 as an int, whether it came as an int or a list of words"""
+    if isinstance(value, (list, tuple)):
+        return sum(word << (32 * i) for i, word in enumerate(value))
+    return value or 0
+
+
+def _getdeviceinfo(args):
+    """Fetch one batch of device addresses, returning (decodes, failure)
+
+    decodes holds (decoded address, notified) per device, notified being
+    whether the server will send CB_NOTIFY_DEVICEID when it changes.  A
+    batch whose reply would not fit ca_maxresponsesize is split in two.
+    """
+    sess, batch, lo_type = args
+    try:
+        ops = [op.getdeviceinfo(dev_id, lo_type, 0xffffffff, DEVICE_NOTIFY)
+               for dev_id in batch]
+        res = sess.compound(ops)
+        if res.status == NFS4ERR_REP_TOO_BIG and len(batch) > 1:
+            half = len(batch) // 2
+            decodes = []
+            for part in (batch[:half], batch[half:]):
+                part_decodes, error = _getdeviceinfo((sess, part, lo_type))
+                if error is not None:
+                    return None, error
+                decodes.extend(part_decodes)
+            return decodes, None
+        check(res)
+
+        replies = [r for r in res.resarray if r.resop == OP_GETDEVICEINFO]
+        return [(_decode_deviceaddr(reply, lo_type),
+                 _bitmap(getattr(reply, "gdir_notification", 0)) &
+                 DEVICE_NOTIFY == DEVICE_NOTIFY)
+                for reply in replies], None
+    except FailureException as e:
+        return None, e
+
+
+def resolve_devices(sess, dev_ids, lo_type=LAYOUT4_OBJECTS_V2, workers=None):
+    """Return {deviceid: decoded address} for every id in dev_ids
+
+    Ids that are not cached are fetched with as many GETDEVICEINFO
+    operations per compound as the session's fore channel allows (fewer
+    when the replies would exceed its ca_maxresponsesize), and
+    up to workers (default DEVICE_WORKERS, bounded by the fore channel's
+    slots) compounds at a time.  A failure is raised for the earliest
+    failing batch, whatever order the replies arrived in.
+    """
+    clientid = sess.client.clientid
+    found = {}
+    missing = []
+    for dev_id in dev_ids:
+        if dev_id in found:
+            continue
+        decode = device_cache.get((clientid, dev_id, lo_type))
+        if decode is None:
+            missing.append(dev_id)
+        found[dev_id] = decode
+
+    if not missing:
+        return found
+
+    if clientid not in device_cache.watched:
+        watch_device_notify(sess.client)
+
+    max_ops = _fore_channel_max_ops(sess)
+    batches = [(sess, missing[i:i + max_ops], lo_type)
+               for i in range(0, len(missing), max_ops)]
+    if workers is None:
+        workers = DEVICE_WORKERS
+    workers = min(workers, _fore_channel_max_requests(sess), len(batches))
+    if workers > 1:
+        pool = ThreadPool(workers)
+        try:
+            results = pool.map(_getdeviceinfo, batches)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = []
+        for batch in batches:
+            results.append(_getdeviceinfo(batch))
+            if results[-1][1] is not None:
+                break
 
+    for (_, batch, _), (decodes, error) in zip(batches, results):
+        if error is not None:
+            raise error
+        for dev_id, (decode, notified) in zip(batch, decodes):
+            device_cache.put((clientid, dev_id, lo_type), decode, notified)
+            found[dev_id] = decode
 
-def check_devid(sess, dev_id):
-    lo_type = LAYOUT4_OBJECTS_V2
-    ops = [op.getdeviceinfo(dev_id, lo_type, 0xffffffff, 0)]
-    res = sess.compound(ops)
-    check(res)
+    return found
 
-    if res.resarray[-1].da_layout_type != LAYOUT4_OBJECTS_V2:
-        fail("Device layout is not NFSOBJ_v2")
 
-    p = ObjV2Unpacker(res.resarray[-1].da_addr_body)
-    decode = p.unpack_pnfs_obj_deviceaddr4()
-    p.done()
+def get_deviceaddr(sess, dev_id, lo_type=LAYOUT4_OBJECTS_V2):
+    """Return the decoded device address, sending GETDEVICEINFO on a miss"""
+    return resolve_devices(sess, [dev_id], lo_type)[dev_id]
+
 
+def check_deviceaddr(decode):
     if decode.oda_obj_type != PNFS_OBJ_NFS:
         fail("Device type is not OBJ_NFS")
 
@@ -34,7 +323,8 @@ def check_devid(sess, dev_id):
         if decode.oda_nfs_addr.ona_fqdn is None or \
            decode.oda_nfs_addr.ona_fqdn == "":
             fail("Device has no addresses")
-        ipaddr = socket.gethostbyname(decode.oda_nfs_addr.ona_fqdn)
+        # Raises the lookup error if the name does not resolve
+        resolver.resolve(decode.oda_nfs_addr.ona_fqdn)
     else:
         if decode.oda_nfs_addr.ona_fqdn is not None and \
            decode.oda_nfs_addr.ona_fqdn != "":
@@ -47,191 +337,311 @@ def check_devid(sess, dev_id):
                 fail("Device has no address")
 
 
-def check_layout(sess, l):
-    if l.loc_type != LAYOUT4_OBJECTS_V2:
-        fail("Bad layout type")
+def check_ff_deviceaddr(decode):
+    if not decode.ffda_netaddrs:
+        fail("Device has no addresses")
+    for addr in decode.ffda_netaddrs:
+        if addr.na_r_netid not in ("tcp", "tcp6"):
+            fail("Device defined as non-tcp")
+        if not addr.na_r_addr:
+            fail("Device has no address")
 
-    p = ObjV2Unpacker(l.loc_body)
-    opaque = p.unpack_pnfs_obj_layout4()
-    p.done()
+    if not decode.ffda_versions:
+        fail("Device has no NFS versions")
+    for version in decode.ffda_versions:
+        if version.ffdv_version not in (3, 4):
+            fail("Device offers unknown NFS version %i"
+                 % version.ffdv_version)
+        if version.ffdv_rsize == 0 or version.ffdv_wsize == 0:
+            fail("Device has zero rsize/wsize")
 
-    if opaque.olo_map is None:
-        fail("No olo_map")
-    if opaque.olo_comps_index is None:
-        fail("No olo_comps_index")
-    if opaque.olo_components is None:
-        fail("No olo_components")
-    if opaque.olo_map.odm_num_comps is None:
-        fail("No olo_map.odm_num_comps")
-    if opaque.olo_map.odm_stripe_unit is None:
-        fail("No olo_map.odm_stripe_unit")
-    if opaque.olo_map.odm_stripe_unit == 0:
-        fail("olo_map.odm_stripe_unit==0")
-    if opaque.olo_map.odm_group_width is None:
-        fail("No olo_map.odm_group_width")
-    if opaque.olo_map.odm_group_depth is None:
-        fail("No olo_map.odm_group_depth")
-    if opaque.olo_map.odm_mirror_cnt is None:
-        fail("No olo_map.odm_mirror_cnt")
-    if opaque.olo_map.odm_raid_algorithm is None:
-        fail("No olo_map.odm_raid_algorithm")
-    if opaque.olo_map.odm_raid_algorithm == PNFS_OBJ_RAID_0:
-        needed_comps = 1
-    elif opaque.olo_map.odm_raid_algorithm == PNFS_OBJ_RAID_4:
-        needed_comps = 2
-    elif opaque.olo_map.odm_raid_algorithm == PNFS_OBJ_RAID_5:
-        needed_comps = 2
-    elif opaque.olo_map.odm_raid_algorithm == PNFS_OBJ_RAID_PQ:
-        needed_comps = 3
-    else:
-        fail("Bad RAID type")
 
-    if opaque.olo_map.odm_group_width != 0 \
-       and opaque.olo_map.odm_group_width < needed_comps:
-        fail("Group width too small")
+def check_devid(sess, dev_id):
+    check_deviceaddr(get_deviceaddr(sess, dev_id, LAYOUT4_OBJECTS_V2))
+
+
+def _fqdns(devices):
+    """FQDN-only objects devices, which need a DNS lookup to be checked"""
+    return [decode.oda_nfs_addr.ona_fqdn
+            for decode in devices
+            if getattr(decode, "oda_nfs_addr", None) is not None and
+            decode.oda_nfs_addr.ona_netaddrs is None and
+            decode.oda_nfs_addr.ona_fqdn]
+
+
+def check_devices(sess, dev_ids, lo_type=LAYOUT4_OBJECTS_V2, workers=None):
+    """Resolve the devices in dev_ids concurrently and check them
+
+    Devices are checked in component order, so the failure reported is
+    always that of the first bad component.  Returns {deviceid: decoded
+    address}, as resolve_devices() does.
+    """
+    devices = resolve_devices(sess, dev_ids, lo_type, workers)
+    # Look up every FQDN-only device concurrently before checking them
+    resolver.resolve_all(_fqdns(devices.values()))
+    check_addr = LAYOUT_TYPES[lo_type].check_deviceaddr
+    checked = set()
+    for i, dev_id in enumerate(dev_ids):
+        if dev_id in checked:
+            continue
+        checked.add(dev_id)
+        try:
+            check_addr(devices[dev_id])
+        except FailureException as e:
+            fail("%s (component %i)" % (e, i))
+    return devices
+
+
+def check_opaque(opaque, lo_type):
+    """Run the compiled rule table for lo_type, failing on any violation"""
+    errors = validators[lo_type].validate(opaque)
+    if errors:
+        fail("; ".join(errors))
+
+
+def _check_body(lo_type, body, revalidate):
+    """Decode and rule-check loc_body, returning its LayoutSummary
+
+    The verdict depends on the bytes alone, so it is memoised unless
+    revalidate; a body that does not decode fails like a rule violation.
+    """
+    if layout_memo.enabled and not revalidate:
+        verdict = layout_memo.get(lo_type, body)
+        if verdict is not None:
+            error, summary = verdict
+            if error is not None:
+                raise error
+            return summary
+
+    kind = LAYOUT_TYPES[lo_type]
+    start = _clock()
+    try:
+        try:
+            opaque = kind.decode(body)
+            check_opaque(opaque, lo_type)
+            dev_ids = kind.dev_ids(opaque)
+            summary = LayoutSummary(lo_type, kind.lo_map(opaque),
+                                    kind.comps_index(opaque), dev_ids)
+        except LayoutDecodeError as e:
+            fail("Undecodable layout: %s" % e)
+    except FailureException as e:
+        if layout_memo.enabled:
+            layout_memo.put(lo_type, body, e, None, _clock() - start)
+        raise
+
+    if layout_memo.enabled:
+        layout_memo.put(lo_type, body, None, summary, _clock() - start)
+    return summary
+
+
+def _check_layout_body(sess, l, revalidate, workers=None):
+    """Validate loc_body, then check its devices for sess's client
+
+    Device checks are never memoised with the body: they go through
+    device_cache, which is per client and never holds a failure.
+    Returns the LayoutSummary and the decoded devices.
+    """
+    summary = _check_body(l.loc_type, l.loc_body, revalidate)
+    devices = check_devices(sess, summary.dev_ids, l.loc_type, workers)
+    return summary, devices
+
+
+def record_topology(fh, summary, devices):
+    """Add the components of a validated layout of fh to the topology
+
+    devices are the decoded addresses check_devices() returned for it.
+    """
+    kind = LAYOUT_TYPES[summary.lo_type]
+    addresses = dict((dev_id, kind.addresses(decode))
+                     for dev_id, decode in devices.items())
+    topology.record(fh, summary.lo_type, kind.placements(summary), addresses)
+
+
+def check_layout(sess, l, revalidate=False, fh=None, workers=None):
+    if l.loc_type != LAYOUT4_OBJECTS_V2:
+        fail("Bad layout type")
 
-    if opaque.olo_map.odm_mirror_cnt != 0:
-        needed_comps = needed_comps * (opaque.olo_map.odm_mirror_cnt + 1)
+    summary, devices = _check_layout_body(sess, l, revalidate, workers)
+    if fh is not None:
+        record_topology(fh, summary, devices)
+    return summary
 
-    olo_comps_len = len(opaque.olo_components)
 
-    if olo_comps_len == 0:
-        fail("Zero components")
+def check_devid_flex(sess, dev_id):
+    check_ff_deviceaddr(get_deviceaddr(sess, dev_id, LAYOUT4_FLEX_FILES))
 
-    if olo_comps_len < needed_comps:
-        fail("Too few components")
 
-    olo_comps_multiple = math.floor(olo_comps_len / needed_comps)
+def check_layout_flex(sess, l, revalidate=False, fh=None, workers=None):
+    if l.loc_type != LAYOUT4_FLEX_FILES:
+        fail("Bad layout type")
 
-    if olo_comps_multiple * needed_comps != olo_comps_len:
-        fail("olo_components not a multiple of (group_width*(mirror+1))")
+    summary, devices = _check_layout_body(sess, l, revalidate, workers)
+    if fh is not None:
+        record_topology(fh, summary, devices)
+    return summary
+
+
+def uaddr_to_hostport(uaddr):
+    """Split a universal address (h1.h2.h3.h4.p1.p2) into (host, port)"""
+    host, p1, p2 = uaddr.rsplit(".", 2)
+    return host, (int(p1) << 8) | int(p2)
+
+
+def _obj_endpoints(decode):
+    nfs_addr = decode.oda_nfs_addr
+    if nfs_addr.ona_netaddrs is None:
+        return [(resolver.resolve(nfs_addr.ona_fqdn), NFS_PORT)]
+    return [uaddr_to_hostport(addr.na_r_addr)
+            for addr in nfs_addr.ona_netaddrs]
+
+
+def _ff_endpoints(decode):
+    return [uaddr_to_hostport(addr.na_r_addr)
+            for addr in decode.ffda_netaddrs]
+
+
+def _probe(args):
+    dev_id, host, port, timeout = args
+    start = _clock()
+    try:
+        s = socket.create_connection((host, port), timeout)
+    except (socket.error, socket.timeout) as e:
+        return dev_id, host, port, None, str(e)
+    latency = _clock() - start
+    s.close()
+    return dev_id, host, port, latency, None
+
+
+def probe_devices(sess, layout, timeout=PROBE_TIMEOUT, slow=PROBE_SLOW):
+    """Connect to every data server address of a layout concurrently
+
+    Returns one dict per (device, address) with the TCP connect latency
+    in seconds and a status of "ok", "slow" or "unreachable".
+    """
+    kind = LAYOUT_TYPES[layout.loc_type]
+    dev_ids = kind.dev_ids(kind.decode(layout.loc_body))
+    devices = resolve_devices(sess, dev_ids, layout.loc_type)
+
+    probes = []
+    table = []
+    for dev_id in sorted(devices):
+        try:
+            endpoints = kind.endpoints(devices[dev_id])
+        except (socket.error, ValueError) as e:
+            table.append({"devid": dev_id, "host": None, "port": None,
+                          "latency": None, "status": "unreachable",
+                          "error": str(e)})
+            continue
+        probes.extend((dev_id, host, port, timeout)
+                      for host, port in endpoints)
+
+    if probes:
+        pool = ThreadPool(min(len(probes), PROBE_WORKERS))
+        try:
+            results = pool.map(_probe, probes)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = []
 
-    for comp in opaque.olo_components:
-        if comp.oc_obj_type != PNFS_OBJ_NFS:
-            fail("Bad component type")
+    for dev_id, host, port, latency, error in results:
+        if latency is None:
+            status = "unreachable"
+        elif latency > slow:
+            status = "slow"
+        else:
+            status = "ok"
+        table.append({"devid": dev_id, "host": host, "port": port,
+                      "latency": latency, "status": status, "error": error})
+    return table
 
-        devid = comp.oc_nfs_cred.onc_device_id
-        check_devid(sess, devid)
 
-        fh = comp.oc_nfs_cred.onc_fhandle
-        auth = comp.oc_nfs_cred.onc_auth
+# How each layout type is decoded and checked
+LayoutType = collections.namedtuple(
+    "LayoutType", ["decode", "dev_ids", "lo_map", "comps_index",
+                   "placements", "decode_deviceaddr", "check_deviceaddr",
+                   "endpoints", "addresses", "handles",
+                   "wrong_device_type"])
 
-        if auth.flavor not in [AUTH_NONE,
-                               AUTH_SYS,
-                               AUTH_SHORT,
-                               AUTH_DH,
-                               RPCSEC_GSS]:
-            fail("Bad authentication type")
 
-def check_devid_flex(sess, dev_id):
-    lo_type = LAYOUT4_FLEX_FILES
-    ops = [op.getdeviceinfo(dev_id, lo_type, 0xffffffff, 0)]
-    res = sess.compound(ops)
-    check(res)
+def _obj_dev_ids(opaque):
+    dev_ids = tuple(comp.oc_nfs_cred.onc_device_id
+                    for comp in opaque.olo_components)
+    opaque.done()
+    return dev_ids
 
-    if res.resarray[-1].da_layout_type != LAYOUT4_OBJECTS_V2:
-        fail("Device layout is not NFSFLEX_FILE")
 
-    p = ObjV2Unpacker(res.resarray[-1].da_addr_body)
-    decode = p.unpack_pnfs_obj_deviceaddr4()
-    p.done()
+def _obj_lo_map(opaque):
+    lo_map = opaque.olo_map
+    return (lo_map.odm_num_comps, lo_map.odm_stripe_unit,
+            lo_map.odm_group_width, lo_map.odm_group_depth,
+            lo_map.odm_mirror_cnt, lo_map.odm_raid_algorithm)
 
-    if decode.oda_obj_type != PNFS_OBJ_NFS:
-        fail("Device type is not OBJ_NFS")
 
-    if decode.oda_nfs_addr is None:
-        fail("Device does not contain NFS address")
-
-    if decode.oda_nfs_addr.ona_netaddrs is None:
-        if decode.oda_nfs_addr.ona_fqdn is None or \
-           decode.oda_nfs_addr.ona_fqdn == "":
-            fail("Device has no addresses")
-        ipaddr = socket.gethostbyname(decode.oda_nfs_addr.ona_fqdn)
-    else:
-        if decode.oda_nfs_addr.ona_fqdn is not None and \
-           decode.oda_nfs_addr.ona_fqdn != "":
-            fail("Device has both IP address and DNS")  # Must not provide both
-        for addr in decode.oda_nfs_addr.ona_netaddrs:
-            if addr.na_r_netid != "tcp":
-                fail("Device defined as non-tcp")
-            if addr.na_r_addr is None or \
-               addr.na_r_addr == "":
-                fail("Device has no address")
+def _obj_placements(summary):
+    """Yield (component, mirror, dev_id); a component's mirrors are adjacent"""
+    copies = summary.lo_map[4] + 1
+    for i, dev_id in enumerate(summary.dev_ids):
+        comp = summary.comps_index + i
+        yield comp // copies, comp % copies, dev_id
 
 
-def check_layout_flex(sess, l):
-    if l.loc_type != LAYOUT4_FLEX_FILES:
-        fail("Bad layout type")
+def _obj_addresses(decode):
+    nfs_addr = decode.oda_nfs_addr
+    if nfs_addr.ona_netaddrs is None:
+        return (nfs_addr.ona_fqdn,)
+    return tuple(addr.na_r_addr for addr in nfs_addr.ona_netaddrs)
 
-    p = ObjV2Unpacker(l.loc_body)
-    opaque = p.unpack_pnfs_obj_layout4()
-    p.done()
 
-    if opaque.olo_map is None:
-        fail("No olo_map")
-    if opaque.olo_comps_index is None:
-        fail("No olo_comps_index")
-    if opaque.olo_components is None:
-        fail("No olo_components")
-    if opaque.olo_map.odm_num_comps is None:
-        fail("No olo_map.odm_num_comps")
-    if opaque.olo_map.odm_stripe_unit is None:
-        fail("No olo_map.odm_stripe_unit")
-    if opaque.olo_map.odm_stripe_unit == 0:
-        fail("olo_map.odm_stripe_unit==0")
-    if opaque.olo_map.odm_group_width is None:
-        fail("No olo_map.odm_group_width")
-    if opaque.olo_map.odm_group_depth is None:
-        fail("No olo_map.odm_group_depth")
-    if opaque.olo_map.odm_mirror_cnt is None:
-        fail("No olo_map.odm_mirror_cnt")
-    if opaque.olo_map.odm_raid_algorithm is None:
-        fail("No olo_map.odm_raid_algorithm")
-    if opaque.olo_map.odm_raid_algorithm == PNFS_OBJ_RAID_0:
-        needed_comps = 1
-    elif opaque.olo_map.odm_raid_algorithm == PNFS_OBJ_RAID_4:
-        needed_comps = 2
-    elif opaque.olo_map.odm_raid_algorithm == PNFS_OBJ_RAID_5:
-        needed_comps = 2
-    elif opaque.olo_map.odm_raid_algorithm == PNFS_OBJ_RAID_PQ:
-        needed_comps = 3
-    else:
-        fail("Bad RAID type")
+def _obj_handles(opaque):
+    """Yield (dev_id, file handle, stateid) of every component"""
+    for comp in opaque.olo_components:
+        cred = comp.oc_nfs_cred
+        yield cred.onc_device_id, cred.onc_fhandle.tobytes(), None
+    opaque.done()
 
-    if opaque.olo_map.odm_group_width != 0 \
-       and opaque.olo_map.odm_group_width < needed_comps:
-        fail("Group width too small")
 
-    if opaque.olo_map.odm_mirror_cnt != 0:
-        needed_comps = needed_comps * (opaque.olo_map.odm_mirror_cnt + 1)
+def _obj_deviceaddr(body):
+    p = ObjV2Unpacker(body)
+    decode = p.unpack_pnfs_obj_deviceaddr4()
+    p.done()
+    return decode
 
-    olo_comps_len = len(opaque.olo_components)
 
-    if olo_comps_len == 0:
-        fail("Zero components")
+def _ff_lo_map(layout):
+    return (layout.ffl_stripe_unit, len(layout.ffl_mirrors),
+            layout.ffl_flags, layout.ffl_stats_collect_hint)
 
-    if olo_comps_len < needed_comps:
-        fail("Too few components")
 
-    olo_comps_multiple = math.floor(olo_comps_len / needed_comps)
+def _ff_placements(summary):
+    """Yield (stripe index, mirror, dev_id); dev_ids are mirror by mirror"""
+    stripes = len(summary.dev_ids) // summary.lo_map[1]
+    for i, dev_id in enumerate(summary.dev_ids):
+        yield i % stripes, i // stripes, dev_id
 
-    if olo_comps_multiple * needed_comps != olo_comps_len:
-        fail("olo_components not a multiple of (group_width*(mirror+1))")
 
-    for comp in opaque.olo_components:
-        if comp.oc_obj_type != PNFS_OBJ_NFS:
-            fail("Bad component type")
+def _ff_handles(layout):
+    """Yield (dev_id, file handle, stateid) of every data server"""
+    for mirror in layout.ffl_mirrors:
+        for ds in mirror:
+            fh = ds.ffds_fh_vers[0] if ds.ffds_fh_vers else None
+            yield ds.ffds_deviceid, fh, ds.ffds_stateid
 
-        devid = comp.oc_nfs_cred.onc_device_id
-        check_devid(sess, devid)
 
-        fh = comp.oc_nfs_cred.onc_fhandle
-        auth = comp.oc_nfs_cred.onc_auth
+def _ff_addresses(decode):
+    return tuple(addr.na_r_addr for addr in decode.ffda_netaddrs)
 
-        if auth.flavor not in [AUTH_NONE,
-                               AUTH_SYS,
-                               AUTH_SHORT,
-                               AUTH_DH,
-                               RPCSEC_GSS]:
-            fail("Bad authentication type")
 
+LAYOUT_TYPES = {
+    LAYOUT4_OBJECTS_V2: LayoutType(
+        ObjLayoutView, _obj_dev_ids, _obj_lo_map,
+        lambda opaque: opaque.olo_comps_index, _obj_placements,
+        _obj_deviceaddr, check_deviceaddr, _obj_endpoints, _obj_addresses,
+        _obj_handles, "Device layout is not NFSOBJ_v2"),
+    LAYOUT4_FLEX_FILES: LayoutType(
+        decode_ff_layout, ff_layout_devices, _ff_lo_map,
+        lambda layout: 0, _ff_placements,
+        decode_ff_deviceaddr, check_ff_deviceaddr, _ff_endpoints,
+        _ff_addresses, _ff_handles, "Device layout is not NFSFLEX_FILE"),
+}
@@ -0,0 +1,329 @@
+from nfs4_const import *
+from pnfs_obj_v2_const import *
+from flexfiles import FF_FLAGS_MASK
+
+import collections
+import operator
+import threading
+import timeit
+
+# Declarative description of a valid layout body, per layout type.
+#
+#   extract       how the facts are read from the decoded body
+#   required      top level fields that must be present
+#   map_required  olo_map fields that must be present
+#   raid_comps    RAID algorithm -> components needed per group
+#   comp_types    allowed oc_obj_type values
+#   auth_flavors  allowed onc_auth flavors
+#   map_rules     rules checked against the data map, in report order
+#   comp_rules    rules run over the components once the map is sound
+OBJ_RULES = {
+    "extract": "objects",
+    "required": ("olo_map", "olo_comps_index", "olo_components"),
+    "map_required": ("odm_num_comps", "odm_stripe_unit", "odm_group_width",
+                     "odm_group_depth", "odm_mirror_cnt",
+                     "odm_raid_algorithm"),
+    "raid_comps": {PNFS_OBJ_RAID_0: 1,
+                   PNFS_OBJ_RAID_4: 2,
+                   PNFS_OBJ_RAID_5: 2,
+                   PNFS_OBJ_RAID_PQ: 3},
+    "comp_types": (PNFS_OBJ_NFS,),
+    "auth_flavors": (AUTH_NONE, AUTH_SYS, AUTH_SHORT, AUTH_DH, RPCSEC_GSS),
+    "map_rules": ("required", "stripe_unit", "raid_algorithm",
+                  "group_width", "comps_count"),
+    "comp_rules": ("components",),
+}
+
+# Flex-files layouts (RFC 8435) carry no data map; the "map" rules look
+# at the stripe unit, flags and mirror shape, the component rules at the
+# data servers of every mirror.
+FF_RULES = {
+    "extract": "flex_files",
+    "required": ("ffl_stripe_unit", "ffl_mirrors", "ffl_flags",
+                 "ffl_stats_collect_hint"),
+    "flags_mask": FF_FLAGS_MASK,
+    "map_rules": ("required", "mirrors", "ff_stripe_unit", "flags"),
+    "comp_rules": ("data_servers",),
+}
+
+LAYOUT_RULES = {
+    LAYOUT4_OBJECTS_V2: OBJ_RULES,
+    LAYOUT4_FLEX_FILES: FF_RULES,
+}
+
+
+class _Facts(object):
+    """Every field the rules need, read from the layout exactly once"""
+    __slots__ = ("missing", "stripe_unit", "group_width", "mirror_cnt",
+                 "raid", "needed", "components", "ncomps", "flags")
+
+
+# Extractor factories: each takes the rule table and returns a function
+# of the decoded body that fills in _Facts.
+
+def _extract_objects(rules):
+    required = tuple(rules["required"])
+    get_required = operator.attrgetter(*required)
+    map_required = tuple(rules["map_required"])
+    get_map = operator.attrgetter(*map_required)
+    raid_comps = dict(rules["raid_comps"])
+
+    def extract(opaque):
+        facts = _Facts()
+        top = get_required(opaque)
+        missing = [name for name, value in zip(required, top)
+                   if value is None]
+        lo_map, comps_index, components = top
+        if lo_map is None:
+            values = (None,) * len(map_required)
+        else:
+            values = get_map(lo_map)
+            missing.extend("olo_map.%s" % name for name, value
+                           in zip(map_required, values)
+                           if value is None)
+        (num_comps, stripe_unit, group_width, group_depth, mirror_cnt,
+         raid) = values
+        facts.missing = missing
+        facts.stripe_unit = stripe_unit
+        facts.group_width = group_width
+        facts.mirror_cnt = mirror_cnt
+        facts.raid = raid
+        facts.needed = raid_comps.get(raid)
+        facts.components = components
+        facts.ncomps = None if components is None else len(components)
+        return facts
+    return extract
+
+
+def _extract_flex_files(rules):
+    required = tuple(rules["required"])
+    get_required = operator.attrgetter(*required)
+
+    def extract(layout):
+        facts = _Facts()
+        top = get_required(layout)
+        facts.missing = [name for name, value in zip(required, top)
+                         if value is None]
+        stripe_unit, mirrors, flags, hint = top
+        facts.stripe_unit = stripe_unit
+        facts.flags = flags
+        facts.components = mirrors
+        facts.ncomps = None if mirrors is None else len(mirrors)
+        facts.mirror_cnt = None if not mirrors else len(mirrors) - 1
+        return facts
+    return extract
+
+
+EXTRACTORS = {
+    "objects": _extract_objects,
+    "flex_files": _extract_flex_files,
+}
+
+
+# Rule factories: each takes the rule table and returns a function of
+# _Facts that yields violation messages.
+
+def _rule_required(rules):
+    def rule(facts):
+        return ["No %s" % name for name in facts.missing]
+    return rule
+
+
+def _rule_stripe_unit(rules):
+    def rule(facts):
+        if facts.stripe_unit == 0:
+            return ["olo_map.odm_stripe_unit==0"]
+        return ()
+    return rule
+
+
+def _rule_raid_algorithm(rules):
+    def rule(facts):
+        if facts.raid is not None and facts.needed is None:
+            return ["Bad RAID type"]
+        return ()
+    return rule
+
+
+def _rule_group_width(rules):
+    def rule(facts):
+        width = facts.group_width
+        if facts.needed is not None and width and width < facts.needed:
+            return ["Group width too small"]
+        return ()
+    return rule
+
+
+def _rule_comps_count(rules):
+    def rule(facts):
+        ncomps = facts.ncomps
+        if ncomps is None:
+            return ()
+        if ncomps == 0:
+            return ["Zero components"]
+        needed = facts.needed
+        if needed is None:
+            return ()
+        if facts.mirror_cnt:
+            needed *= facts.mirror_cnt + 1
+        if ncomps < needed:
+            return ["Too few components"]
+        if ncomps % needed:
+            return ["olo_components not a multiple of "
+                    "(group_width*(mirror+1))"]
+        return ()
+    return rule
+
+
+def _rule_components(rules):
+    comp_types = frozenset(rules["comp_types"])
+    flavors = frozenset(rules["auth_flavors"])
+
+    def rule(facts):
+        bad_type = bad_auth = None
+        for i, comp in enumerate(facts.components):
+            if comp.oc_obj_type not in comp_types:
+                if bad_type is None:
+                    bad_type = i
+                continue
+            if bad_auth is None and \
+               comp.oc_nfs_cred.onc_auth.flavor not in flavors:
+                bad_auth = i
+        errors = []
+        if bad_type is not None:
+            errors.append("Bad component type (component %i)" % bad_type)
+        if bad_auth is not None:
+            errors.append("Bad authentication type (component %i)"
+                          % bad_auth)
+        return errors
+    return rule
+
+
+def _rule_mirrors(rules):
+    def rule(facts):
+        mirrors = facts.components
+        if mirrors is None:
+            return ()
+        if not mirrors:
+            return ["Zero mirrors"]
+        empty = [i for i, mirror in enumerate(mirrors) if not mirror]
+        if empty:
+            return ["Mirror has no data servers (mirror %i)" % empty[0]]
+        if len(set(len(mirror) for mirror in mirrors)) > 1:
+            return ["Mirrors have different stripe counts"]
+        return ()
+    return rule
+
+
+def _rule_ff_stripe_unit(rules):
+    def rule(facts):
+        # Only striped mirrors (more than one data server) need a unit
+        if facts.stripe_unit == 0 and facts.components and \
+           len(facts.components[0]) > 1:
+            return ["ffl_stripe_unit==0"]
+        return ()
+    return rule
+
+
+def _rule_flags(rules):
+    mask = rules["flags_mask"]
+
+    def rule(facts):
+        if facts.flags is not None and facts.flags & ~mask:
+            return ["Unknown ffl_flags 0x%x" % (facts.flags & ~mask)]
+        return ()
+    return rule
+
+
+def _rule_data_servers(rules):
+    def rule(facts):
+        no_fh = bad_devid = None
+        for m, mirror in enumerate(facts.components):
+            for s, ds in enumerate(mirror):
+                if no_fh is None and not ds.ffds_fh_vers:
+                    no_fh = (m, s)
+                if bad_devid is None and \
+                   len(ds.ffds_deviceid) != NFS4_DEVICEID4_SIZE:
+                    bad_devid = (m, s)
+        errors = []
+        if no_fh is not None:
+            errors.append("Data server has no file handle "
+                          "(mirror %i, data server %i)" % no_fh)
+        if bad_devid is not None:
+            errors.append("Bad device id (mirror %i, data server %i)"
+                          % bad_devid)
+        return errors
+    return rule
+
+
+RULE_FACTORIES = {
+    "required": _rule_required,
+    "stripe_unit": _rule_stripe_unit,
+    "raid_algorithm": _rule_raid_algorithm,
+    "group_width": _rule_group_width,
+    "comps_count": _rule_comps_count,
+    "components": _rule_components,
+    "mirrors": _rule_mirrors,
+    "ff_stripe_unit": _rule_ff_stripe_unit,
+    "flags": _rule_flags,
+    "data_servers": _rule_data_servers,
+}
+
+
+class LayoutValidator(object):
+    """Single-pass checker compiled from one LAYOUT_RULES entry
+
+    validate() returns every violation found rather than stopping at the
+    first.  Component rules are only run once the data map is sound, so a
+    bad map is rejected without decoding any component.  With timing on,
+    calls and elapsed seconds are accumulated per rule; validate() may be
+    called from several threads at once.
+    """
+    def __init__(self, rules, timing=True):
+        self.timing = timing
+        self.calls = collections.defaultdict(int)
+        self.elapsed = collections.defaultdict(float)
+        self._lock = threading.Lock()
+        self._extract = EXTRACTORS[rules["extract"]](rules)
+        self._map_rules = self._compile(rules, rules["map_rules"])
+        self._comp_rules = self._compile(rules, rules["comp_rules"])
+
+    @staticmethod
+    def _compile(rules, names):
+        return tuple((name, RULE_FACTORIES[name](rules)) for name in names)
+
+    def _run(self, rules, facts):
+        errors = []
+        if not self.timing:
+            for name, rule in rules:
+                errors.extend(rule(facts))
+            return errors
+
+        timer = timeit.default_timer
+        times = []
+        for name, rule in rules:
+            start = timer()
+            errors.extend(rule(facts))
+            times.append((name, timer() - start))
+        with self._lock:
+            for name, seconds in times:
+                self.elapsed[name] += seconds
+                self.calls[name] += 1
+        return errors
+
+    def validate(self, opaque):
+        facts = self._extract(opaque)
+        errors = self._run(self._map_rules, facts)
+        if not errors:
+            errors = self._run(self._comp_rules, facts)
+        return errors
+
+    def stats(self):
+        with self._lock:
+            return dict((name, {"calls": self.calls[name],
+                                "seconds": self.elapsed[name]})
+                        for name in self.calls)
+
+
+validators = dict((lo_type, LayoutValidator(rules))
+                  for lo_type, rules in LAYOUT_RULES.items())
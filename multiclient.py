@@ -0,0 +1,291 @@
+from nfs4_const import *
+from nfs4_type import *
+from environment import check, checklist, fail, use_obj, close_file
+import nfs4_ops as op
+from recalltiming import RecallTimer
+from multiprocessing.pool import ThreadPool
+
+import collections
+import threading
+
+SCENARIO_WORKERS = 32
+RECALL_TIMEOUT = 60.0   # seconds to wait for every expected CB_RECALL
+
+
+# The "current stateid" of RFC 5661 section 16.2.3.1.2
+CURRENT_STATEID = stateid4(1, "\0" * 12)
+
+OpenLayout = collections.namedtuple(
+    "OpenLayout", ["fh", "stateid", "delegated", "layout_stateid", "roc",
+                   "layouts"])
+
+
+def _result(res, opnum):
+    for result in res.resarray:
+        if result.resop == opnum:
+            return result
+    fail("No result for op %i in reply" % opnum)
+
+
+def _open_ops(owner, path, access, deny, want_deleg):
+    if not want_deleg:
+        access |= OPEN4_SHARE_ACCESS_WANT_NO_DELEG
+    open_op = op.open(0, access, deny, open_owner4(0, owner),
+                      openflag4(OPEN4_NOCREATE),
+                      open_claim4(CLAIM_NULL, path[-1]))
+    return use_obj(path[:-1]) + [open_op, op.getfh()]
+
+
+def _layoutget_op(lo_type, iomode, stateid):
+    return op.layoutget(False, lo_type, iomode, 0, 0xffffffffffffffff, 0,
+                        stateid, 0xffff)
+
+
+def _listen_all(sessions, slots, what):
+    results = []
+    for i, (sess, slot) in enumerate(zip(sessions, slots)):
+        res = sess.listen(slot)
+        check(res, msg="%s from session %i" % (what, i + 1))
+        results.append(res)
+    return results
+
+
+def open_layout_fanout(sessions, owner, path, lo_type=LAYOUT4_OBJECTS_V2,
+                       access=OPEN4_SHARE_ACCESS_READ,
+                       deny=OPEN4_SHARE_DENY_NONE, want_deleg=True,
+                       iomode=LAYOUTIOMODE4_READ, current_stateid=False):
+    """OPEN path and LAYOUTGET it from every session, pipelined
+
+    Every compound is sent with compound_async before any reply is
+    awaited, so setup costs two round trips however many sessions there
+    are, or one with current_stateid, which sends LAYOUTGET in the OPEN
+    compound using the current stateid.  Returns one OpenLayout per
+    session, in order.
+    """
+    sessions = list(sessions)
+    ops = _open_ops(owner, path, access, deny, want_deleg)
+    if current_stateid:
+        ops = ops + [_layoutget_op(lo_type, iomode, CURRENT_STATEID)]
+    slots = [sess.compound_async(ops) for sess in sessions]
+    opens = _listen_all(sessions, slots, "OPEN")
+
+    fhs = [_result(res, OP_GETFH).object for res in opens]
+    stateids = [_result(res, OP_OPEN).stateid for res in opens]
+    if current_stateid:
+        layouts = opens
+    else:
+        slots = [sess.compound_async([op.putfh(fh),
+                                      _layoutget_op(lo_type, iomode, stateid)])
+                 for sess, fh, stateid in zip(sessions, fhs, stateids)]
+        layouts = _listen_all(sessions, slots, "LAYOUTGET")
+
+    result = []
+    for res, fh, stateid, lres in zip(opens, fhs, stateids, layouts):
+        lg = _result(lres, OP_LAYOUTGET)
+        delegation = _result(res, OP_OPEN).delegation
+        result.append(OpenLayout(fh, stateid,
+                                 delegation.delegation_type !=
+                                 OPEN_DELEGATE_NONE,
+                                 lg.logr_stateid, lg.logr_return_on_close,
+                                 lg.logr_layout))
+    return result
+
+
+def env_clients(env):
+    """The NFS4Client connections the test environment provides"""
+    return [c for c in (getattr(env, "c%i" % i, None) for i in range(1, 5))
+            if c is not None]
+
+
+class Participant(object):
+    """One client of a RecallScenario and the state it holds
+
+    recall is set by the CB_RECALL hook once the reply is queued;
+    recall_stateid is the stateid the server recalled.
+    """
+    def __init__(self, index, sess, writer):
+        self.index = index
+        self.sess = sess
+        self.writer = writer
+        self.fh = None
+        self.stateid = None
+        self.delegated = False
+        self.layout_stateid = None
+        self.roc = None
+        self.closed = False
+        self.recall = threading.Event()
+        self.recall_stateid = None
+
+    def _pre_hook(self, arg, env):
+        # NOTE this must be done before set()
+        self.recall_stateid = arg.stateid
+        # This is called after compound sent to queue
+        env.notify = self.recall.set
+
+    def _post_hook(self, arg, env, res):
+        return res
+
+
+class RecallScenario(object):
+    """Delegation and layout recall fan-out over N clients
+
+    Sessions are spread round-robin over env.c1..c4, each with its own
+    CB_RECALL hooks; cbdispatch routes every callback on a shared
+    connection to the client it was sent to.  The first `writers`
+    participants open for write, the rest for read with a read
+    delegation; all of them open and LAYOUTGET in a pipelined fan-out.
+    conflict() then sends the conflicting OPEN from the last participant
+    while the others' recalls are answered.
+    Every recall is timed by self.timer.
+    """
+    def __init__(self, env, name, nclients, writers=0,
+                 lo_type=LAYOUT4_OBJECTS_V2, return_body="",
+                 workers=SCENARIO_WORKERS):
+        if not 0 <= writers <= nclients:
+            fail("Bad reader/writer mix: %i writers of %i clients"
+                 % (writers, nclients))
+        self.env = env
+        self.name = name
+        self.lo_type = lo_type
+        self.return_body = return_body
+        self.workers = min(workers, nclients)
+        self.owner = "owner_%s" % name
+        self.file_name = name
+        self.path = None
+        self.timer = RecallTimer(name)
+
+        connections = env_clients(env)
+        if not connections:
+            fail("Environment provides no clients")
+        self.participants = self._map(
+            lambda i: self._join(connections[i % len(connections)], i,
+                                 i < writers),
+            range(nclients))
+
+    def _map(self, func, items):
+        items = list(items)
+        if len(items) < 2:
+            return [func(item) for item in items]
+        pool = ThreadPool(min(self.workers, len(items)))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _join(self, connection, index, writer):
+        sess = connection.new_client_session("%s%i" % (self.name, index + 1),
+                                             flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+        part = Participant(index, sess, writer)
+        self.timer.hook(sess.client, OP_CB_RECALL,
+                        part._pre_hook, part._post_hook)
+        self.timer.hook(sess.client, OP_CB_LAYOUTRECALL)
+        return part
+
+    def create(self, seed):
+        """Create the shared file from the first client with seed()"""
+        sess = self.participants[0].sess
+        self.path = sess.c.homedir + [self.file_name]
+        seed(sess, self.owner, self.path)
+
+    def _open_group(self, participants, **kwargs):
+        opened = open_layout_fanout([part.sess for part in participants],
+                                    self.owner, self.path, self.lo_type,
+                                    **kwargs)
+        for part, o in zip(participants, opened):
+            part.fh = o.fh
+            part.stateid = o.stateid
+            part.delegated = o.delegated
+            part.layout_stateid = o.layout_stateid
+            part.roc = o.roc
+
+    def open_all(self):
+        """Open the file and get a layout from every client"""
+        writers = [part for part in self.participants if part.writer]
+        readers = [part for part in self.participants if not part.writer]
+        if writers:
+            self._open_group(writers, access=OPEN4_SHARE_ACCESS_WRITE,
+                             want_deleg=False, iomode=LAYOUTIOMODE4_RW)
+        if readers:
+            self._open_group(readers)
+
+    @property
+    def conflicting(self):
+        return self.participants[-1]
+
+    def conflict(self, access=OPEN4_SHARE_ACCESS_WRITE):
+        """Send the conflicting OPEN; returns the slot to listen() on"""
+        claim = open_claim4(CLAIM_NULL, self.file_name)
+        owner = open_owner4(0, self.owner)
+        how = openflag4(OPEN4_NOCREATE)
+        open_op = op.open(0, access, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+        self.timer.open_sent()
+        return self.conflicting.sess.compound_async(self.env.home + [open_op])
+
+    def expected_recalls(self):
+        return [part for part in self.participants if part.delegated]
+
+    def wait_recalls(self, timeout=RECALL_TIMEOUT):
+        """Wait until every delegation holder has queued its CB_RECALL reply"""
+        missing = []
+        for part in self.expected_recalls():
+            if not part.recall.wait(timeout):
+                missing.append(part.index + 1)
+        if missing:
+            fail("No CB_RECALL for client(s) %s after %.0fs"
+                 % (", ".join(map(str, missing)), timeout))
+
+    def _delegreturn(self, part):
+        res = part.sess.compound([op.putfh(part.fh),
+                                  op.delegreturn(part.recall_stateid)])
+        check(res)
+        self.timer.returned(part.sess.client)
+
+    def return_delegations(self):
+        """DELEGRETURN every recalled delegation concurrently"""
+        self._map(self._delegreturn,
+                  [part for part in self.participants
+                   if part.recall.is_set()])
+
+    def finish_conflict(self, slot, expect=(NFS4_OK, NFS4ERR_DELAY)):
+        res = self.conflicting.sess.listen(slot)
+        checklist(res, list(expect))
+        if res.status == NFS4_OK:
+            self.conflicting.stateid = res.resarray[-1].stateid
+        return res
+
+    def recall(self, timeout=RECALL_TIMEOUT):
+        """Drive one conflicting OPEN through the whole recall fan-out"""
+        slot = self.conflict()
+        self.wait_recalls(timeout)
+        self.return_delegations()
+        return self.finish_conflict(slot)
+
+    def _close(self, part):
+        res = close_file(part.sess, part.fh, part.stateid)
+        check(res)
+        part.closed = True
+
+    def close_all(self, participants=None):
+        if participants is None:
+            participants = self.participants
+        self._map(self._close, participants)
+
+    def _layoutreturn(self, part):
+        ops = [op.putfh(part.fh),
+               op.layoutreturn(False, self.lo_type, LAYOUTIOMODE4_ANY,
+                               layoutreturn4(LAYOUTRETURN4_FILE,
+                                             layoutreturn_file4(
+                                                 0, 0xffffffffffffffff,
+                                                 part.layout_stateid,
+                                                 self.return_body)))]
+        res = part.sess.compound(ops)
+        self.timer.returned(part.sess.client, OP_CB_LAYOUTRECALL)
+        # A closed file's return-on-close layout is already gone
+        if part.closed and part.roc:
+            check(res, NFS4ERR_BAD_STATEID)
+        else:
+            check(res)
+
+    def return_layouts(self):
+        self._map(self._layoutreturn, self.participants)
@@ -0,0 +1,187 @@
+from nfs4_const import NFS4_DEVICEID4_SIZE
+from pnfs_obj_v2_const import PNFS_OBJ_NFS
+
+import struct
+
+# Lazy view of an objects-v2 layout body.  The wire format walked here is
+#
+#   struct pnfs_obj_data_map4 {
+#       uint32_t        odm_num_comps;
+#       length4         odm_stripe_unit;
+#       uint32_t        odm_group_width;
+#       uint32_t        odm_group_depth;
+#       uint32_t        odm_mirror_cnt;
+#       uint32_t        odm_raid_algorithm;
+#   };
+#
+#   union pnfs_obj_object_cred4 switch (pnfs_obj_type4 oc_obj_type) {
+#   case PNFS_OBJ_NFS:
+#       pnfs_obj_nfs_cred4     oc_nfs_cred;  /* deviceid4 onc_device_id;
+#                                               nfs_fh4 onc_fhandle;
+#                                               opaque_auth onc_auth; */
+#   };
+#
+#   struct pnfs_obj_layout4 {
+#       pnfs_obj_data_map4     olo_map;
+#       uint32_t               olo_comps_index;
+#       pnfs_obj_object_cred4  olo_components<>;
+#   };
+#
+# olo_map is decoded up front; components are only decoded when accessed,
+# and their file handles and auth bodies are memoryview slices of loc_body.
+
+_DATA_MAP = struct.Struct(">IQIIII")
+_UINT2 = struct.Struct(">II")
+_UINT = struct.Struct(">I")
+
+
+class LayoutDecodeError(ValueError):
+    pass
+
+
+def _pad(n):
+    return (n + 3) & ~3
+
+
+class ObjDataMap(object):
+    __slots__ = ("odm_num_comps", "odm_stripe_unit", "odm_group_width",
+                 "odm_group_depth", "odm_mirror_cnt", "odm_raid_algorithm")
+
+    def __init__(self, num_comps, stripe_unit, group_width, group_depth,
+                 mirror_cnt, raid_algorithm):
+        self.odm_num_comps = num_comps
+        self.odm_stripe_unit = stripe_unit
+        self.odm_group_width = group_width
+        self.odm_group_depth = group_depth
+        self.odm_mirror_cnt = mirror_cnt
+        self.odm_raid_algorithm = raid_algorithm
+
+
+class ObjAuth(object):
+    __slots__ = ("flavor", "body")
+
+    def __init__(self, flavor, body):
+        self.flavor = flavor
+        self.body = body
+
+
+class ObjNfsCred(object):
+    __slots__ = ("onc_device_id", "onc_fhandle", "onc_auth")
+
+    def __init__(self, device_id, fhandle, auth):
+        self.onc_device_id = device_id
+        self.onc_fhandle = fhandle
+        self.onc_auth = auth
+
+
+class ObjComponent(object):
+    __slots__ = ("oc_obj_type", "oc_nfs_cred")
+
+    def __init__(self, obj_type, nfs_cred):
+        self.oc_obj_type = obj_type
+        self.oc_nfs_cred = nfs_cred
+
+
+class _Components(object):
+    """Sequence of components, decoded on access"""
+    def __init__(self, view):
+        self._view = view
+
+    def __len__(self):
+        return self._view.comps_count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._view.comps_count
+        if not 0 <= index < self._view.comps_count:
+            raise IndexError(index)
+        return self._view.component(index)
+
+    def __iter__(self):
+        for i in range(self._view.comps_count):
+            yield self._view.component(i)
+
+
+class ObjLayoutView(object):
+    """Read-only view of a pnfs_obj_layout4 body"""
+    def __init__(self, body):
+        buf = memoryview(body)
+        if len(buf) < _DATA_MAP.size + _UINT2.size:
+            raise LayoutDecodeError("Layout body too short (%i bytes)"
+                                    % len(buf))
+        self.olo_map = ObjDataMap(*_DATA_MAP.unpack_from(buf, 0))
+        self.olo_comps_index, self.comps_count = \
+            _UINT2.unpack_from(buf, _DATA_MAP.size)
+        self.olo_components = _Components(self)
+        self._buf = buf
+        # _offsets[i] is where component i starts; grown as components
+        # are walked.
+        self._offsets = [_DATA_MAP.size + _UINT2.size]
+        self._cache = {}
+
+    def _check_bounds(self, pos):
+        if pos > len(self._buf):
+            raise LayoutDecodeError("Layout body truncated at offset %i" % pos)
+
+    def _skip(self, pos):
+        """Return the offset of the component following the one at pos"""
+        buf = self._buf
+        self._check_bounds(pos + 4)
+        obj_type, = _UINT.unpack_from(buf, pos)
+        if obj_type != PNFS_OBJ_NFS:
+            # No arm but PNFS_OBJ_NFS has a body; as component() reads it,
+            # so that the rules can report the type of every component
+            return pos + 4
+        pos += 4 + NFS4_DEVICEID4_SIZE
+        self._check_bounds(pos + 4)
+        fh_len, = _UINT.unpack_from(buf, pos)
+        pos += 4 + _pad(fh_len)
+        self._check_bounds(pos + 8)
+        flavor, body_len = _UINT2.unpack_from(buf, pos)
+        pos += 8 + _pad(body_len)
+        self._check_bounds(pos)
+        return pos
+
+    def _offset(self, index):
+        offsets = self._offsets
+        while len(offsets) <= index:
+            offsets.append(self._skip(offsets[-1]))
+        return offsets[index]
+
+    def component(self, index):
+        try:
+            return self._cache[index]
+        except KeyError:
+            pass
+
+        buf = self._buf
+        pos = self._offset(index)
+        self._check_bounds(pos + 4)
+        obj_type, = _UINT.unpack_from(buf, pos)
+        if obj_type != PNFS_OBJ_NFS:
+            comp = ObjComponent(obj_type, None)
+        else:
+            pos += 4
+            self._check_bounds(pos + NFS4_DEVICEID4_SIZE + 4)
+            device_id = buf[pos:pos + NFS4_DEVICEID4_SIZE].tobytes()
+            pos += NFS4_DEVICEID4_SIZE
+            fh_len, = _UINT.unpack_from(buf, pos)
+            pos += 4
+            self._check_bounds(pos + _pad(fh_len) + 8)
+            fhandle = buf[pos:pos + fh_len]
+            pos += _pad(fh_len)
+            flavor, body_len = _UINT2.unpack_from(buf, pos)
+            pos += 8
+            self._check_bounds(pos + _pad(body_len))
+            auth = ObjAuth(flavor, buf[pos:pos + body_len])
+            comp = ObjComponent(obj_type, ObjNfsCred(device_id, fhandle, auth))
+
+        self._cache[index] = comp
+        return comp
+
+    def done(self):
+        """Walk every component and raise if the body has trailing data"""
+        end = self._offset(self.comps_count)
+        if end != len(self._buf):
+            raise LayoutDecodeError("Unextracted data remains (%i bytes)"
+                                    % (len(self._buf) - end))
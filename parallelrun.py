@@ -0,0 +1,228 @@
+"""Run independent st_nfs_obj / st_nfs_ff tests concurrently
+
+runtests() takes the place of testmod.runtests() for a list of pynfs
+Test objects.  Up to `workers` tests run at once, each in a thread of
+its own; a test starts only once every test it DEPENDs on has finished,
+so Test.run() sees their results as it would in a serial run.
+
+Tests already keep to client owners and file names of their own (both
+derive from env.testname(t)), and the session pool is switched to
+concurrent use so that a test only ever releases its own leases.  What
+cannot be isolated runs alone, with no other test in flight:
+
+    tests reaching LAYOUTRETURN4_ALL or LAYOUTRETURN4_FSID, which give
+    back layouts beyond the files of the test, found by following the
+    names the test function uses through the functions and classes of
+    the test directory;
+
+    tests reaching cb_pre_hook or cb_post_hook, whose hooks would replace
+    those of every other client on the shared env.c1..c4 connections
+    (hooks set through cbdispatch are per client and need not wait);
+
+    tests with a benchmark or scale FLAG, whose numbers would otherwise
+    measure their neighbours.
+
+    import parallelrun
+    parallelrun.runtests(tests, options, env, workers=8)
+"""
+from sessionpool import session_pool
+
+import inspect
+import os
+import sys
+import threading
+import time
+
+_clock = getattr(time, "monotonic", time.time)
+
+WORKERS = 8
+SERIAL_NAMES = frozenset(["LAYOUTRETURN4_ALL", "LAYOUTRETURN4_FSID",
+                          "cb_pre_hook", "cb_post_hook"])
+SERIAL_FLAGS = frozenset(["nfs-obj-bench", "nfs-ff-bench", "nfs-obj-scale",
+                          "nfs-ff-scale"])
+# Modules whose use of SERIAL_NAMES only touches one test's own client
+PER_TEST_MODULES = frozenset(["sessionpool", "cbdispatch"])
+
+
+def _names(code):
+    for name in code.co_names:
+        yield name
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            # A nested function or class body
+            for name in _names(const):
+                yield name
+
+
+def _functions(obj):
+    if inspect.isfunction(obj):
+        return [obj]
+    functions = []
+    for value in vars(obj).values():
+        if isinstance(value, property):
+            value = value.fget
+        value = getattr(value, "__func__", value)
+        if inspect.isfunction(value):
+            functions.append(value)
+    return functions
+
+
+def touches_global_state(function, serial_names=SERIAL_NAMES):
+    """Whether function uses one of serial_names, directly or through a
+    function or class of the test directory that it names
+    """
+    home = os.path.dirname(os.path.abspath(inspect.getfile(function)))
+
+    def local(obj):
+        if not (inspect.isfunction(obj) or inspect.isclass(obj)):
+            return False
+        if obj.__module__ in PER_TEST_MODULES:
+            return False
+        module = sys.modules.get(obj.__module__)
+        path = getattr(module, "__file__", None)
+        return path is not None and \
+            os.path.dirname(os.path.abspath(path)) == home
+
+    seen = set()
+    todo = [function]
+    while todo:
+        obj = todo.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        for f in _functions(obj):
+            for name in _names(f.__code__):
+                if name in serial_names:
+                    return True
+                value = f.__globals__.get(name)
+                if value is not None and id(value) not in seen and \
+                   local(value):
+                    todo.append(value)
+    return False
+
+
+def _flags(t):
+    flags = getattr(t, "flags_list", None)
+    if flags is None:
+        flags = getattr(t, "flags", "")
+    if isinstance(flags, str):
+        flags = flags.split()
+    return set(flags)
+
+
+def runs_alone(t):
+    """Whether test t must run with no other test in flight"""
+    return bool(_flags(t) & SERIAL_FLAGS) or touches_global_state(t.runtest)
+
+
+class _Run(object):
+    """Scheduler state shared by the worker threads"""
+    def __init__(self, tests, workers):
+        self.workers = max(workers, 1)
+        self.waiting = list(tests)
+        self.members = set(id(t) for t in tests)
+        self.done = set()
+        self.running = 0
+        self.alone = False      # a runs_alone() test is in flight
+        self.cond = threading.Condition()
+        self.timings = {}
+        self._serial = dict((id(t), runs_alone(t)) for t in tests)
+
+    def _ready(self, t):
+        return all(id(dep) in self.done
+                   for dep in getattr(t, "dependencies", ())
+                   if id(dep) in self.members)
+
+    def next_test(self):
+        """Block until a test may start; None once all have started"""
+        with self.cond:
+            while True:
+                if not self.waiting:
+                    return None
+                t = self._pick()
+                if t is not None:
+                    self.waiting.remove(t)
+                    self.running += 1
+                    self.alone = self._serial[id(t)]
+                    return t
+                if not self.running:
+                    # Nothing in flight can free the rest: run them anyway
+                    # and let Test.run() report the missing dependencies
+                    t = self.waiting.pop(0)
+                    self.running += 1
+                    self.alone = self._serial[id(t)]
+                    return t
+                self.cond.wait()
+
+    def _pick(self):
+        if self.alone or self.running >= self.workers:
+            return None
+        for t in self.waiting:
+            if not self._ready(t):
+                continue
+            if self._serial[id(t)]:
+                # Wait for the others to drain; nothing overtakes it
+                return t if not self.running else None
+            return t
+        return None
+
+    def finished(self, t, elapsed):
+        with self.cond:
+            self.running -= 1
+            self.alone = False
+            self.done.add(id(t))
+            self.timings[id(t)] = elapsed
+            self.cond.notify_all()
+
+
+def runtests(tests, options, environment, workers=None):
+    """Run tests, in order as far as DEPEND allows, on up to workers
+    threads.  Returns {tests, workers, serial, seconds, test_seconds}.
+    """
+    if workers is None:
+        workers = getattr(options, "workers", None) or WORKERS
+    verbose = getattr(options, "verbose", False)
+    pool = session_pool(environment)
+    run = _Run(tests, workers)
+
+    def work():
+        while True:
+            t = run.next_test()
+            if t is None:
+                return
+            start = _clock()
+            try:
+                t.run(environment, verbose)
+            finally:
+                pool.release(environment.testname(t))
+                run.finished(t, _clock() - start)
+
+    concurrent = pool.concurrent
+    pool.concurrent = True
+    environment.init()
+    start = _clock()
+    try:
+        threads = [threading.Thread(target=work)
+                   for i in range(min(run.workers, len(tests)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        elapsed = _clock() - start
+        pool.concurrent = concurrent
+        environment.finish()
+    return {"tests": len(tests), "workers": run.workers,
+            "serial": sum(run._serial.values()), "seconds": elapsed,
+            "test_seconds": sum(run.timings.values())}
+
+
+def report(name, stats):
+    speedup = stats["test_seconds"] / stats["seconds"] \
+        if stats["seconds"] else 0.0
+    print("%s: %i tests (%i run alone) on %i workers in %.1fs, %.1fs of "
+          "test time, x%.1f"
+          % (name, stats["tests"], stats["serial"], stats["workers"],
+             stats["seconds"], stats["test_seconds"], speedup))
+    return stats
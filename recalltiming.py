@@ -0,0 +1,134 @@
+from nfs4_const import *
+from cbdispatch import add_cb_hook
+
+import collections
+import math
+import threading
+import time
+
+_clock = getattr(time, "monotonic", time.time)
+
+OPEN_SENT = "open_sent"
+CB_RECEIVED = "cb_received"
+REPLY_QUEUED = "reply_queued"
+RETURNED = "returned"
+
+# metric -> (from event, to event); the conflicting OPEN is one event
+# for the whole recall, the others are per callback
+METRICS = collections.OrderedDict([
+    ("dispatch", (OPEN_SENT, CB_RECEIVED)),
+    ("turnaround", (CB_RECEIVED, REPLY_QUEUED)),
+    ("return", (REPLY_QUEUED, RETURNED)),
+    ("stall", (OPEN_SENT, RETURNED)),
+])
+
+CB_NAMES = {
+    OP_CB_RECALL: "CB_RECALL",
+    OP_CB_LAYOUTRECALL: "CB_LAYOUTRECALL",
+}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a sorted list"""
+    rank = int(math.ceil(pct / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+class RecallTimer(object):
+    """Timestamps of one test's recalls, from conflicting OPEN to return
+
+    hook() wraps a client's callback hooks so that receiving the callback
+    and queueing its reply (env.notify) are stamped; the test stamps the
+    conflicting OPEN with open_sent() and the DELEGRETURN/LAYOUTRETURN
+    with returned().  Callbacks are keyed by (callback op, clientid); each
+    is timed from the open_sent() stamp current when it was received.
+    """
+    def __init__(self, name):
+        self.name = name
+        self._opened = None
+        self._events = collections.defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def _mark(self, key, event):
+        now = _clock()
+        with self._lock:
+            events = self._events[key]
+            events[event] = now
+            if event == CB_RECEIVED:
+                # The OPEN that caused this callback, in tests with several
+                events[OPEN_SENT] = self._opened
+
+    def open_sent(self):
+        with self._lock:
+            self._opened = _clock()
+
+    def returned(self, client, cb_op=OP_CB_RECALL):
+        """Stamp the return of a recalled delegation or layout"""
+        key = (cb_op, client.clientid)
+        now = _clock()
+        with self._lock:
+            # Returning state that was never recalled is not a recall
+            if key in self._events:
+                self._events[key][RETURNED] = now
+
+    def hook(self, client, cb_op, pre_hook=None, post_hook=None):
+        """Register timed hooks for the cb_op callbacks sent to client"""
+        key = (cb_op, client.clientid)
+
+        def timed_pre_hook(arg, env):
+            self._mark(key, CB_RECEIVED)
+            if pre_hook is not None:
+                pre_hook(arg, env)
+            notify = getattr(env, "notify", None)
+
+            def timed_notify():
+                self._mark(key, REPLY_QUEUED)
+                if notify is not None:
+                    notify()
+            env.notify = timed_notify
+
+        def timed_post_hook(arg, env, res):
+            if post_hook is not None:
+                return post_hook(arg, env, res)
+            return res
+
+        add_cb_hook(client, cb_op, timed_pre_hook, timed_post_hook)
+
+    def latencies(self):
+        """Return {(callback name, metric): [seconds, ...]}"""
+        result = collections.defaultdict(list)
+        with self._lock:
+            for (cb_op, clientid), events in self._events.items():
+                events = dict(events)
+                if events.get(OPEN_SENT) is None:
+                    events[OPEN_SENT] = self._opened
+                cb_name = CB_NAMES.get(cb_op, str(cb_op))
+                for metric, (start, end) in METRICS.items():
+                    if events.get(start) is not None and \
+                       events.get(end) is not None:
+                        result[cb_name, metric].append(
+                            events[end] - events[start])
+        return result
+
+    def summary(self):
+        """Return {callback name: {metric: {count, p50, p99, max}}}"""
+        summary = collections.defaultdict(dict)
+        for (cb_name, metric), values in self.latencies().items():
+            values.sort()
+            summary[cb_name][metric] = {"count": len(values),
+                                        "p50": percentile(values, 50),
+                                        "p99": percentile(values, 99),
+                                        "max": values[-1]}
+        return dict(summary)
+
+    def report(self):
+        summary = self.summary()
+        for cb_name in sorted(summary):
+            for metric in METRICS:
+                if metric not in summary[cb_name]:
+                    continue
+                h = summary[cb_name][metric]
+                print("%s %s %s: n=%i p50=%.1fms p99=%.1fms max=%.1fms"
+                      % (self.name, cb_name, metric, h["count"],
+                         h["p50"] * 1000, h["p99"] * 1000, h["max"] * 1000))
+        return summary
@@ -0,0 +1,210 @@
+from nfs4_const import *
+from nfs4_type import *
+from environment import check, fail
+import nfs4_ops as op
+from recalltiming import percentile
+
+import collections
+import random
+import time
+
+_clock = getattr(time, "monotonic", time.time)
+
+RETURN_UNIT = 4096          # bytes per returned range
+FRAGMENT_RETURNS = 4096     # LAYOUTRETURN4_FILE ranges per pattern
+FRAGMENT_FILES = 4
+PATTERNS = ("sequential", "interleaved", "overlapping", "random")
+MIX_ROUNDS = 8
+MIX_RETURNS = 512           # range returns before each FSID/ALL return
+NFS4_LENGTH_ALL = 0xffffffffffffffff
+
+
+def _pattern(name, n, seed=0):
+    """(first unit, units) of n range returns over units 0..n-1"""
+    if name == "sequential":
+        return [(i, 1) for i in range(n)]
+    if name == "interleaved":
+        # Every other unit first: the held layout ends up in n/2 pieces
+        return [(i, 1) for i in range(0, n, 2)] + \
+               [(i, 1) for i in range(1, n, 2)]
+    if name == "overlapping":
+        # Then three units around each hole, two of them already returned;
+        # the last hole has no unit after it when n is even
+        return [(i, 1) for i in range(0, n, 2)] + \
+               [(i - 1, min(3, n - i + 1)) for i in range(1, n, 2)]
+    if name == "random":
+        ranges = [(i, 1) for i in range(n)]
+        random.Random(seed).shuffle(ranges)
+        return ranges
+    fail("Unknown return pattern %r" % name)
+
+
+class _HeldLayout(object):
+    """One file's layout and the pieces of it still held
+
+    units[i] is whether unit i is still held; the range past the last
+    unit is never returned, so it always ends the last piece.  Returning
+    a unit splits, shortens or removes a piece, tracked in O(1).
+    """
+    def __init__(self, fh, open_stateid):
+        self.fh = fh
+        self.open_stateid = open_stateid
+        self.stateid = None
+        self.units = []
+        self.segments = 0
+
+    def got(self, stateid, nunits):
+        self.stateid = stateid
+        self.units = [True] * nunits
+        self.segments = 1
+
+    def returned(self, first, count):
+        for i in range(first, min(first + count, len(self.units))):
+            if not self.units[i]:
+                continue
+            self.units[i] = False
+            before = i > 0 and self.units[i - 1]
+            after = i + 1 >= len(self.units) or self.units[i + 1]
+            self.segments += (before and after) - (not before and not after)
+
+    def dropped(self):
+        self.units = []
+        self.segments = 0
+
+
+class ReturnBench(object):
+    """Fragment full-file layouts with LAYOUTRETURN4_FILE ranges
+
+    Each file holds a LAYOUTGET of its whole range; fragment() then
+    returns RETURN_UNIT-sized ranges following a pattern, round-robin
+    over the files, and times every return against the number of layout
+    pieces the client still holds.  mix() alternates fragmenting with
+    returning everything by LAYOUTRETURN4_FSID or LAYOUTRETURN4_ALL.
+    """
+    def __init__(self, sess, files, lo_type, return_body="",
+                 unit=RETURN_UNIT):
+        self.sess = sess
+        self.lo_type = lo_type
+        self.return_body = return_body
+        self.unit = unit
+        self.layouts = [_HeldLayout(fh, stateid) for fh, stateid in files]
+        self.samples = collections.defaultdict(list)
+
+    def _held(self):
+        return sum(lo.segments for lo in self.layouts)
+
+    def layoutget(self, nunits):
+        stateids = []
+        for lo in self.layouts:
+            ops = [op.putfh(lo.fh),
+                   op.layoutget(False, self.lo_type, LAYOUTIOMODE4_RW,
+                                0, NFS4_LENGTH_ALL, 0, lo.open_stateid,
+                                0xffff)]
+            res = self.sess.compound(ops)
+            check(res)
+            lg = res.resarray[-1]
+            for layout in lg.logr_layout:
+                if layout.lo_offset != 0:
+                    fail("Asked for the whole file, got a layout at %i"
+                         % layout.lo_offset)
+                if layout.lo_length < nunits * self.unit:
+                    nunits = layout.lo_length // self.unit
+            stateids.append(lg.logr_stateid)
+        if nunits < 1:
+            fail("Layout shorter than one %i byte unit" % self.unit)
+        for lo, stateid in zip(self.layouts, stateids):
+            lo.got(stateid, nunits)
+        return nunits
+
+    def _return(self, kind, lo, returntype, body=None):
+        ops = [op.putfh(lo.fh),
+               op.layoutreturn(False, self.lo_type, LAYOUTIOMODE4_ANY,
+                               layoutreturn4(returntype, body))]
+        held = self._held()
+        start = _clock()
+        res = self.sess.compound(ops)
+        latency = _clock() - start
+        check(res, msg="%s LAYOUTRETURN with %i pieces held" % (kind, held))
+        self.samples[kind].append((held, latency))
+        return res.resarray[-1]
+
+    def return_range(self, lo, first, count, kind):
+        """Return count units from first, cut short at the last held unit
+
+        The range past the units is kept so that it ends the last piece.
+        """
+        count = min(count, len(lo.units) - first)
+        body = layoutreturn_file4(first * self.unit, count * self.unit,
+                                  lo.stateid, self.return_body)
+        reply = self._return(kind, lo, LAYOUTRETURN4_FILE, body)
+        if getattr(reply, "lrs_present", True) and reply.lrs_stateid:
+            lo.stateid = reply.lrs_stateid
+        lo.returned(first, count)
+
+    def fragment(self, pattern, returns=FRAGMENT_RETURNS):
+        """Return `returns` ranges spread over the files per pattern"""
+        per_file = max(returns // len(self.layouts), 1)
+        nunits = self.layoutget(per_file)
+        ranges = _pattern(pattern, nunits)
+        for first, count in ranges:
+            for lo in self.layouts:
+                self.return_range(lo, first, count, pattern)
+        self.return_all(LAYOUTRETURN4_FSID, "%s_rest" % pattern)
+
+    def return_all(self, returntype, kind):
+        """Give back every layout with LAYOUTRETURN4_FSID or _ALL"""
+        self._return(kind, self.layouts[0], returntype)
+        for lo in self.layouts:
+            lo.dropped()
+
+    def mix(self, rounds=MIX_ROUNDS, returns=MIX_RETURNS, seed=0):
+        """Rounds of random range returns, each ending in FSID or ALL"""
+        rnd = random.Random(seed)
+        per_file = max(returns // len(self.layouts), 1)
+        for r in range(rounds):
+            nunits = self.layoutget(per_file)
+            for i in range(returns):
+                lo = self.layouts[i % len(self.layouts)]
+                self.return_range(lo, rnd.randrange(nunits),
+                                  rnd.randint(1, 4), "mix_file")
+            if r % 2:
+                self.return_all(LAYOUTRETURN4_ALL, "mix_all")
+            else:
+                self.return_all(LAYOUTRETURN4_FSID, "mix_fsid")
+
+    def summary(self):
+        """Return {kind: {"buckets": [...], "growth": p50 last/first}}
+
+        Returns are bucketed by pieces held (1, 2-3, 4-7, ...); growth
+        far above 1 means a return costs more the more pieces are held.
+        """
+        summary = {}
+        for kind, samples in self.samples.items():
+            buckets = collections.defaultdict(list)
+            for held, latency in samples:
+                buckets[max(held, 1).bit_length() - 1].append(latency)
+            rows = []
+            for b in sorted(buckets):
+                values = sorted(buckets[b])
+                rows.append({"held": 1 << b, "count": len(values),
+                             "p50": percentile(values, 50),
+                             "p99": percentile(values, 99),
+                             "max": values[-1]})
+            growth = None
+            if len(rows) > 1 and rows[0]["p50"]:
+                growth = rows[-1]["p50"] / rows[0]["p50"]
+            summary[kind] = {"buckets": rows, "growth": growth}
+        return summary
+
+
+def report(name, summary):
+    for kind in sorted(summary):
+        for row in summary[kind]["buckets"]:
+            print("%s %s held>=%i: n=%i p50=%.2fms p99=%.2fms max=%.2fms"
+                  % (name, kind, row["held"], row["count"],
+                     row["p50"] * 1000, row["p99"] * 1000,
+                     row["max"] * 1000))
+        if summary[kind]["growth"] is not None:
+            print("%s %s: p50 grows x%.1f from fewest to most pieces held"
+                  % (name, kind, summary[kind]["growth"]))
+    return summary
@@ -0,0 +1,195 @@
+from nfs4_const import *
+from nfs4_type import *
+from environment import check, fail, open_create_file_op
+import nfs4_ops as op
+
+import collections
+import random
+import zlib
+
+SEED_CHUNK = 1 << 20       # largest WRITE/READ payload per compound
+COMPOUND_OVERHEAD = 1024   # room left for the rest of a compound
+PATTERN_SIZE = 1 << 16
+
+# The "current stateid" of RFC 5661 section 16.2.3.1.2
+CURRENT_STATEID = stateid4(1, "\0" * 12)
+
+SeedResult = collections.namedtuple(
+    "SeedResult", ["fh", "stateid", "size", "crc", "compounds"])
+
+
+def _find(res, opnum, last=False):
+    found = [r for r in res.resarray if r.resop == opnum]
+    if not found:
+        fail("No result for op %i in reply" % opnum)
+    return found[-1] if last else found[0]
+
+
+class Pattern(object):
+    """size bytes of repeating pseudo-random data, built slice by slice
+
+    Stands in for a string payload of seed_file() without holding it in
+    memory, so gigabyte seeds cost only the chunks in flight.
+    """
+    def __init__(self, size, seed=0):
+        self.size = size
+        rnd = random.Random(seed)
+        self.block = bytes(bytearray(rnd.getrandbits(8)
+                                     for i in range(PATTERN_SIZE)))
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        start, stop, step = index.indices(self.size)
+        count = max(stop - start, 0)
+        first = start % PATTERN_SIZE
+        reps = (first + count) // PATTERN_SIZE + 1
+        return (self.block * reps)[first:first + count]
+
+
+def _chunks(data, offset, size, start=0):
+    # One size-byte slice at a time, so a Pattern is never built whole
+    for pos in range(start, len(data), size):
+        yield offset + pos, data[pos:pos + size]
+
+
+def _crc(data, crc=0):
+    for pos, chunk in _chunks(data, 0, SEED_CHUNK):
+        crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _zeros_crc(count, crc=0):
+    zeros = b"\0" * min(count, SEED_CHUNK)
+    while count:
+        n = min(count, len(zeros))
+        crc = zlib.crc32(zeros[:n], crc)
+        count -= n
+    return crc
+
+
+class _Pipeline(object):
+    """Keep up to window compounds in flight on one session"""
+    def __init__(self, sess, window):
+        self.sess = sess
+        self.window = max(window, 1)
+        self.pending = collections.deque()
+        self.sent = 0
+
+    def send(self, ops, tag=None):
+        done = None
+        if len(self.pending) >= self.window:
+            done = self.next()
+        self.pending.append((self.sess.compound_async(ops), tag))
+        self.sent += 1
+        return done
+
+    def next(self):
+        slot, tag = self.pending.popleft()
+        res = self.sess.listen(slot)
+        check(res)
+        return tag, res
+
+    def drain(self):
+        while self.pending:
+            yield self.next()
+
+
+def seed_file(sess, owner, path, data="write test data", offset=0,
+              attrs={FATTR4_MODE: 0o644}, access=OPEN4_SHARE_ACCESS_BOTH,
+              want_deleg=False, stable=FILE_SYNC4, chunk_size=SEED_CHUNK,
+              verify=True, close=True):
+    """Create path, write data (a string or Pattern) at offset, read it back
+
+    A payload that fits in one request is created, written, read and
+    closed in a single compound using the current stateid.  Larger ones
+    are split into WRITE and READ compounds of at most chunk_size bytes
+    (and what the fore channel accepts), kept in flight on all of the
+    session's slots.  The read back is verified against a running CRC32
+    of the expected contents, with the leading `offset` bytes zero, and
+    must end at EOF.
+    """
+    attrs_fc = sess.fore_channel.attrs
+    wsize = min(chunk_size, attrs_fc.ca_maxrequestsize - COMPOUND_OVERHEAD)
+    rsize = min(chunk_size, attrs_fc.ca_maxresponsesize - COMPOUND_OVERHEAD)
+    total = offset + len(data)
+    expected = _crc(data, _zeros_crc(offset)) if verify else None
+
+    ops = open_create_file_op(sess, owner, path, attrs=attrs, access=access,
+                              want_deleg=want_deleg)
+    single = len(data) <= wsize and total + 1 <= rsize
+    if single:
+        ops += [op.write(CURRENT_STATEID, offset, stable, data[0:len(data)])]
+        if verify:
+            ops += [op.read(CURRENT_STATEID, 0, total + 1)]
+        if close:
+            ops += [op.close(0, CURRENT_STATEID)]
+    elif data:
+        ops += [op.write(CURRENT_STATEID, offset, stable, data[:wsize])]
+    res = sess.compound(ops)
+    check(res)
+    compounds = 1
+    fh = _find(res, OP_GETFH).object
+    stateid = _find(res, OP_OPEN).stateid
+    writes = [_find(res, OP_WRITE)] if data else []
+
+    if single:
+        if writes[0].count != len(data):
+            fail("Short write: %i of %i bytes" % (writes[0].count, len(data)))
+        if verify:
+            _verify([_find(res, OP_READ)], expected, total)
+        if close:
+            stateid = _find(res, OP_CLOSE).stateid
+        return SeedResult(fh, stateid, total, expected, compounds)
+
+    pipe = _Pipeline(sess, attrs_fc.ca_maxrequests)
+    # Writes: the first chunk went with the OPEN
+    for pos, chunk in _chunks(data, offset, wsize, start=wsize):
+        done = pipe.send([op.putfh(fh), op.write(stateid, pos, stable, chunk)],
+                         len(chunk))
+        if done is not None:
+            writes.append(_find(done[1], OP_WRITE))
+    writes.extend(_find(r, OP_WRITE) for tag, r in pipe.drain())
+    written = sum(w.count for w in writes)
+    if written != len(data):
+        fail("Short write: %i of %i bytes" % (written, len(data)))
+    if stable != FILE_SYNC4:
+        res = sess.compound([op.putfh(fh), op.commit(0, 0)])
+        check(res)
+        compounds += 1
+
+    if verify:
+        reads = []
+        # Ask for one byte past the end so the last read reports EOF
+        for pos in range(0, total + 1, rsize):
+            count = min(rsize, total + 1 - pos)
+            done = pipe.send([op.putfh(fh), op.read(stateid, pos, count)])
+            if done is not None:
+                reads.append(_find(done[1], OP_READ))
+        reads.extend(_find(r, OP_READ) for tag, r in pipe.drain())
+        _verify(reads, expected, total)
+    compounds += pipe.sent
+
+    if close:
+        res = sess.compound([op.putfh(fh), op.close(0, stateid)])
+        check(res)
+        compounds += 1
+        stateid = _find(res, OP_CLOSE).stateid
+    return SeedResult(fh, stateid, total, expected, compounds)
+
+
+def _verify(reads, expected, total):
+    crc = 0
+    size = 0
+    for r in reads:
+        crc = zlib.crc32(r.data, crc)
+        size += len(r.data)
+    if not reads[-1].eof:
+        fail("EOF not set on read")
+    if size != total:
+        fail("Expected %i bytes, read back %i" % (total, size))
+    if crc != expected:
+        fail("Data read back does not match what was written "
+             "(crc32 %08x, expected %08x)"
+             % (crc & 0xffffffff, expected & 0xffffffff))
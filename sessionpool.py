@@ -0,0 +1,329 @@
+from nfs4_const import *
+from nfs4_type import *
+import nfs4_ops as op
+from teardown import on_finish
+from cbdispatch import is_dispatcher, remove_cb_hooks
+
+import collections
+import itertools
+import threading
+
+POOL_MAX_USES = 50      # tests a pooled client serves before it is replaced
+
+# Statuses a reset tolerates: the test already returned or closed the state
+RESET_OK = (NFS4_OK, NFS4ERR_BAD_STATEID, NFS4ERR_OLD_STATEID)
+
+# The "current stateid" of RFC 5661 section 16.2.3.1.2
+CURRENT_STATEID = stateid4(1, "\0" * 12)
+
+_env_lock = threading.Lock()
+
+
+def destroy_session(sess):
+    """DESTROY_SESSION, then DESTROY_CLIENTID; True if both worked
+
+    Both go out without a SEQUENCE, on the connection.  A client that
+    still holds state it could not give back answers NFS4ERR_CLIENTID_BUSY
+    and is left for its lease to expire.
+    """
+    remove_cb_hooks(sess.client, internal=True)
+    connection = sess.c
+    res = connection.compound([op.destroy_session(sess.sessionid)])
+    if res.status != NFS4_OK:
+        return False
+    res = connection.compound([op.destroy_clientid(sess.client.clientid)])
+    return res.status == NFS4_OK
+
+
+def _is_current(stateid):
+    return (stateid.seqid, stateid.other) == \
+        (CURRENT_STATEID.seqid, CURRENT_STATEID.other)
+
+
+class _PooledClient(object):
+    """The client of a PooledSession
+
+    A callback hook set on the connection directly makes the session
+    unpoolable; the per-client hooks of cbdispatch do not, as reset()
+    removes them.
+    """
+    def __init__(self, pooled, client):
+        self._pooled = pooled
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def cb_pre_hook(self, cb_op, hook, *args, **kwargs):
+        if not is_dispatcher(hook):
+            self._pooled.dirty = True
+        return self._client.cb_pre_hook(cb_op, hook, *args, **kwargs)
+
+    def cb_post_hook(self, cb_op, hook, *args, **kwargs):
+        if not is_dispatcher(hook):
+            self._pooled.dirty = True
+        return self._client.cb_post_hook(cb_op, hook, *args, **kwargs)
+
+
+class PooledSession(object):
+    """A session lent to one test, recording the state the test takes
+
+    Anything other than compound(), compound_async(), listen() and client
+    goes to the pynfs session.  Opens, delegations and layout types seen
+    in replies are remembered so that the pool can give them back before
+    lending the session to the next test; state it cannot account for
+    (an OPEN without a GETFH, a callback hook set around cbdispatch)
+    marks the session dirty, and a dirty session is replaced instead of
+    reused.
+    """
+    def __init__(self, key, sess):
+        self.key = key
+        self.uses = 0
+        self.dirty = False
+        self._sess = sess
+        self._opens = {}            # open stateid.other -> (fh, stateid)
+        self._delegations = {}      # deleg stateid.other -> (fh, stateid)
+        self._layout_types = set()
+        self._pending = {}          # compound_async slot -> ops
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._sess, name)
+
+    @property
+    def client(self):
+        return _PooledClient(self, self._sess.client)
+
+    def compound(self, ops, *args, **kwargs):
+        res = self._sess.compound(ops, *args, **kwargs)
+        self._track(ops, res)
+        return res
+
+    def compound_async(self, ops, *args, **kwargs):
+        slot = self._sess.compound_async(ops, *args, **kwargs)
+        with self._lock:
+            self._pending[slot] = ops
+        return slot
+
+    def listen(self, slot, *args, **kwargs):
+        res = self._sess.listen(slot, *args, **kwargs)
+        with self._lock:
+            ops = self._pending.pop(slot, None)
+        if ops is not None:
+            self._track(ops, res)
+        return res
+
+    def _track(self, ops, res):
+        try:
+            self._track_results(ops, res)
+        except AttributeError:
+            # Not a reply we understand; don't trust what we recorded
+            self.dirty = True
+
+    def _track_results(self, ops, res):
+        results = list(res.resarray)
+        if results and results[0].resop == OP_SEQUENCE and \
+           (not ops or ops[0].argop != OP_SEQUENCE):
+            results = results[1:]
+        if res.status != NFS4_OK:
+            results = results[:-1]
+        opened = []         # (stateid, delegation stateid) awaiting a GETFH
+        current = None
+        with self._lock:
+            for arg, r in zip(ops, results):
+                if r.resop == OP_OPEN:
+                    current = r.stateid
+                    deleg = r.delegation
+                    if deleg.delegation_type == OPEN_DELEGATE_READ:
+                        opened.append((r.stateid, deleg.read.stateid))
+                    elif deleg.delegation_type == OPEN_DELEGATE_WRITE:
+                        opened.append((r.stateid, deleg.write.stateid))
+                    else:
+                        opened.append((r.stateid, None))
+                elif r.resop == OP_GETFH:
+                    for stateid, deleg in opened:
+                        self._opens[stateid.other] = (r.object, stateid)
+                        if deleg is not None:
+                            self._delegations[deleg.other] = (r.object, deleg)
+                    opened = []
+                elif r.resop == OP_CLOSE:
+                    stateid = arg.opclose.open_stateid
+                    if _is_current(stateid) and current is not None:
+                        stateid = current
+                    self._opens.pop(stateid.other, None)
+                elif r.resop == OP_DELEGRETURN:
+                    stateid = arg.opdelegreturn.deleg_stateid
+                    self._delegations.pop(stateid.other, None)
+                elif r.resop == OP_LAYOUTGET:
+                    self._layout_types.add(arg.oplayoutget.loga_layout_type)
+            if opened:
+                self.dirty = True
+
+    def _reset_compounds(self):
+        compounds = [[op.putrootfh(),
+                      op.layoutreturn(False, lo_type, LAYOUTIOMODE4_ANY,
+                                      layoutreturn4(LAYOUTRETURN4_ALL))]
+                     for lo_type in sorted(self._layout_types)]
+        compounds += [[op.putfh(fh), op.delegreturn(stateid)]
+                      for fh, stateid in self._delegations.values()]
+        # seqid 0: whatever the current seqid of the open is
+        compounds += [[op.putfh(fh), op.close(0, stateid4(0, stateid.other))]
+                      for fh, stateid in self._opens.values()]
+        return compounds
+
+    def reset(self):
+        """Give back everything the last test left; True if that worked
+
+        The returns are pipelined over the session's slots, so a reset
+        costs one round trip for as many opens as fit in the slot table.
+        The test's cbdispatch hooks go; internal ones, such as the device
+        notification watch of layoutcheck, stay with the client.
+        """
+        if self.dirty:
+            return False
+        remove_cb_hooks(self._sess.client)
+        compounds = self._reset_compounds()
+        window = max(self._sess.fore_channel.attrs.ca_maxrequests, 1)
+        ok = True
+        for i in range(0, len(compounds), window):
+            slots = [self._sess.compound_async(ops)
+                     for ops in compounds[i:i + window]]
+            for slot in slots:
+                res = self._sess.listen(slot)
+                ok = ok and res.status in RESET_OK
+        self._opens.clear()
+        self._delegations.clear()
+        self._layout_types.clear()
+        return ok
+
+    def destroy(self):
+        return destroy_session(self._sess)
+
+
+class SessionPool(object):
+    """Established sessions shared by the tests of one environment
+
+    acquire() lends an idle session with the right connection and
+    EXCHANGE_ID flags, or establishes one; release() resets the sessions
+    a test borrowed and keeps those that reset cleanly.  A session that
+    cannot be reset, or has served max_uses tests, is destroyed and a
+    new client owner takes its place, so no test sees another's state.
+    Unless concurrent is set, asking for a session on behalf of a test
+    releases whatever earlier tests still hold; close() releases the
+    rest and destroys every session the pool still has.
+    """
+    def __init__(self, env, max_uses=POOL_MAX_USES):
+        self.env = env
+        self.max_uses = max_uses
+        self.concurrent = False
+        self._idle = collections.defaultdict(list)
+        self._leases = collections.defaultdict(list)
+        self._serial = itertools.count(1)
+        self._counts = {"created": 0, "reused": 0, "rotated": 0,
+                        "destroyed": 0}
+        self._lock = threading.Lock()
+
+    def _establish(self, key):
+        connection, flags = key
+        with self._lock:
+            name = "pool%x_%i" % (flags, next(self._serial))
+            self._counts["created"] += 1
+        return PooledSession(key, connection.new_client_session(name,
+                                                                flags=flags))
+
+    def acquire(self, test, connection=None, flags=EXCHGID4_FLAG_USE_PNFS_MDS,
+                fresh=False):
+        """Lend a session to test; fresh=True for a new client identity"""
+        if connection is None:
+            connection = self.env.c1
+        key = (connection, flags)
+        pooled = None
+        with self._lock:
+            if not fresh and self._idle[key]:
+                pooled = self._idle[key].pop()
+                self._counts["reused"] += 1
+        if pooled is None:
+            pooled = self._establish(key)
+        pooled.uses += 1
+        with self._lock:
+            self._leases[test].append(pooled)
+        return pooled
+
+    def release(self, test):
+        """Reset and take back every session lent to test"""
+        with self._lock:
+            lent = self._leases.pop(test, [])
+        for pooled in lent:
+            keep = pooled.uses < self.max_uses and pooled.reset()
+            with self._lock:
+                if keep:
+                    self._idle[pooled.key].append(pooled)
+                else:
+                    self._counts["rotated"] += 1
+            if not keep:
+                self._destroy(pooled)
+
+    def _destroy(self, pooled):
+        try:
+            destroyed = pooled.destroy()
+        except Exception:
+            # The connection may be gone; the lease expires regardless
+            destroyed = False
+        if destroyed:
+            with self._lock:
+                self._counts["destroyed"] += 1
+
+    def release_others(self, test):
+        with self._lock:
+            others = [name for name in self._leases if name != test]
+        for name in others:
+            self.release(name)
+
+    def release_all(self):
+        self.release_others(None)
+
+    def close(self):
+        """Release every lease, then destroy the idle sessions"""
+        self.release_all()
+        with self._lock:
+            idle = [pooled for sessions in self._idle.values()
+                    for pooled in sessions]
+            self._idle.clear()
+        for pooled in idle:
+            self._destroy(pooled)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counts)
+            stats["idle"] = sum(len(idle) for idle in self._idle.values())
+            stats["lent"] = sum(len(lent) for lent in self._leases.values())
+        return stats
+
+
+def session_pool(env):
+    """The SessionPool of env, created on first use
+
+    The pool is closed when env finishes, so the leases of the last test
+    are given back and no pooled client outlives the run.
+    """
+    with _env_lock:
+        pool = getattr(env, "session_pool", None)
+        if pool is None:
+            pool = env.session_pool = SessionPool(env)
+            on_finish(env, pool.close)
+    return pool
+
+
+def pooled_session(env, t, flags=EXCHGID4_FLAG_USE_PNFS_MDS,
+                   connection=None, fresh=False):
+    """A session for test t from env's pool, instead of new_client_session()
+
+    Use fresh=True when the test needs a client identity of its own;
+    tests that set callback hooks other than through cbdispatch get a
+    session that is not reused.
+    """
+    pool = session_pool(env)
+    name = env.testname(t)
+    if not pool.concurrent:
+        pool.release_others(name)
+    return pool.acquire(name, connection, flags, fresh)
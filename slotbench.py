@@ -0,0 +1,236 @@
+from nfs4_const import *
+from nfs4_type import *
+from environment import check, open_create_file_op
+import nfs4_ops as op
+from recalltiming import percentile
+from sessionpool import destroy_session
+
+import collections
+import time
+
+_clock = getattr(time, "monotonic", time.time)
+
+SLOT_COUNTS = (1, 2, 4, 8, 16, 32, 64)
+BENCH_DURATION = 5.0    # seconds per (slot count, concurrency) level
+BENCH_MAXSIZE = 1 << 20
+BENCH_MAXOPS = 32
+SATURATION_GAIN = 0.1   # throughput gain below which a level is saturated
+
+# One cycle of a lane: every stage is one compound
+STAGES = ("OPEN", "LAYOUTGET", "LAYOUTCOMMIT", "LAYOUTRETURN", "CLOSE")
+
+
+def bench_session(env, name, slots, flags=EXCHGID4_FLAG_USE_PNFS_MDS):
+    """A new client and session asking for `slots` fore channel slots
+
+    The server may grant fewer; see sess.fore_channel.attrs.ca_maxrequests.
+    Give it back with sessionpool.destroy_session() once done.
+    """
+    c = env.c1.new_client(name, flags=flags)
+    attrs = channel_attrs4(0, BENCH_MAXSIZE, BENCH_MAXSIZE, 8192,
+                           BENCH_MAXOPS, slots, [])
+    sess = c.create_session(fore_attrs=attrs)
+    res = sess.compound([op.reclaim_complete(FALSE)])
+    check(res)
+    return sess
+
+
+def _levels(maximum):
+    level = 1
+    while level < maximum:
+        yield level
+        level *= 2
+    yield maximum
+
+
+class _Lane(object):
+    def __init__(self, index, path):
+        self.index = index
+        self.path = path
+        self.stage = 0
+        self.fh = None
+        self.open_stateid = None
+        self.layout_stateid = None
+
+
+class SlotBench(object):
+    """Drive OPEN/LAYOUTGET/LAYOUTCOMMIT/LAYOUTRETURN/CLOSE on one session
+
+    run(concurrency) keeps that many lanes busy, each cycling through
+    STAGES on a file of its own, with one compound per lane in flight
+    through compound_async.  Once the duration is up, lanes finish their
+    cycle so no state is left behind, and lane i always uses the same
+    file, so later runs reuse the files of earlier ones.
+    """
+    def __init__(self, sess, owner, lo_type, update_body="", return_body=""):
+        self.sess = sess
+        self.owner = owner
+        self.lo_type = lo_type
+        self.update_body = update_body
+        self.return_body = return_body
+
+    def _ops(self, lane):
+        stage = STAGES[lane.stage]
+        if stage == "OPEN":
+            return open_create_file_op(self.sess, self.owner, lane.path,
+                                       mode=UNCHECKED4)
+        ops = [op.putfh(lane.fh)]
+        if stage == "LAYOUTGET":
+            ops.append(op.layoutget(False, self.lo_type, LAYOUTIOMODE4_RW,
+                                    0, 0xffffffffffffffff, 0,
+                                    lane.open_stateid, 0xffff))
+        elif stage == "LAYOUTCOMMIT":
+            ops.append(op.layoutcommit(0, 0xffffffffffffffff, False,
+                                       lane.layout_stateid,
+                                       newoffset4(True, 0), newtime4(False),
+                                       layoutupdate4(self.lo_type,
+                                                     self.update_body)))
+        elif stage == "LAYOUTRETURN":
+            ops.append(op.layoutreturn(False, self.lo_type, LAYOUTIOMODE4_ANY,
+                                       layoutreturn4(LAYOUTRETURN4_FILE,
+                                                     layoutreturn_file4(
+                                                         0,
+                                                         0xffffffffffffffff,
+                                                         lane.layout_stateid,
+                                                         self.return_body))))
+        else:
+            ops.append(op.close(0, lane.open_stateid))
+        return ops
+
+    def _advance(self, lane, res):
+        stage = STAGES[lane.stage]
+        check(res, msg="%s from lane %i" % (stage, lane.index))
+        if stage == "OPEN":
+            for r in res.resarray:
+                if r.resop == OP_OPEN:
+                    lane.open_stateid = r.stateid
+                elif r.resop == OP_GETFH:
+                    lane.fh = r.object
+        elif stage == "LAYOUTGET":
+            lane.layout_stateid = res.resarray[-1].logr_stateid
+        lane.stage = (lane.stage + 1) % len(STAGES)
+        return stage
+
+    def run(self, concurrency, duration=BENCH_DURATION):
+        """Return {concurrency, compounds, cycles, seconds, ops_per_s,
+        cycles_per_s, p50, p99, ops: {stage: {count, p50, p99, max}}}
+        """
+        homedir = self.sess.c.homedir
+        lanes = [_Lane(i, homedir + ["%s_%i" % (self.owner, i)])
+                 for i in range(concurrency)]
+        latencies = collections.defaultdict(list)
+        pending = collections.deque()
+        cycles = 0
+        compounds = 0
+
+        start = _clock()
+        deadline = start + duration
+        for lane in lanes:
+            pending.append((self.sess.compound_async(self._ops(lane)), lane,
+                            _clock()))
+        while pending:
+            slot, lane, sent = pending.popleft()
+            res = self.sess.listen(slot)
+            latencies[self._advance(lane, res)].append(_clock() - sent)
+            compounds += 1
+            if lane.stage == 0:
+                cycles += 1
+                if _clock() >= deadline:
+                    continue
+            pending.append((self.sess.compound_async(self._ops(lane)), lane,
+                            _clock()))
+        elapsed = _clock() - start
+
+        result = {"concurrency": concurrency, "compounds": compounds,
+                  "cycles": cycles, "seconds": elapsed,
+                  "ops_per_s": compounds / elapsed,
+                  "cycles_per_s": cycles / elapsed, "ops": {}}
+        every = []
+        for stage in STAGES:
+            values = sorted(latencies[stage])
+            every.extend(values)
+            if values:
+                result["ops"][stage] = {"count": len(values),
+                                        "p50": percentile(values, 50),
+                                        "p99": percentile(values, 99),
+                                        "max": values[-1]}
+        every.sort()
+        result["p50"] = percentile(every, 50)
+        result["p99"] = percentile(every, 99)
+        return result
+
+
+def slot_scaling(env, name, lo_type, update_body="", return_body="",
+                 slot_counts=SLOT_COUNTS, duration=BENCH_DURATION):
+    """Sweep fore channel slot counts and, for each, concurrency 1..slots
+
+    Returns the scaling curve: one SlotBench.run() result per level,
+    with "slots" (what the server granted) and "requested" added.  Each
+    slot count gets a session of its own, destroyed after its levels.
+    """
+    curve = []
+    for requested in slot_counts:
+        sess = bench_session(env, "%s_%i" % (name, requested), requested)
+        try:
+            granted = sess.fore_channel.attrs.ca_maxrequests
+            bench = SlotBench(sess, "owner_%s" % name, lo_type, update_body,
+                              return_body)
+            for concurrency in _levels(granted):
+                point = bench.run(concurrency, duration)
+                point["slots"] = granted
+                point["requested"] = requested
+                curve.append(point)
+        finally:
+            destroy_session(sess)
+        if granted < requested:
+            # Asking for more would only repeat this session's levels
+            break
+    return curve
+
+
+def saturation(curve, gain=SATURATION_GAIN):
+    """The last level before more in-flight compounds stop paying off
+
+    Levels are compared by their best throughput over all slot counts;
+    the result is the point after which one more level adds less than
+    gain of throughput, or None if throughput grew all the way.
+    """
+    best = {}
+    for point in curve:
+        level = point["concurrency"]
+        if level not in best or point["ops_per_s"] > best[level]["ops_per_s"]:
+            best[level] = point
+    previous = None
+    for level in sorted(best):
+        point = best[level]
+        if previous is not None and \
+           point["ops_per_s"] < previous["ops_per_s"] * (1 + gain):
+            return previous
+        previous = point
+    return None
+
+
+def report(name, curve):
+    for point in curve:
+        print("%s slots=%i concurrency=%i: %.0f compounds/s %.1f cycles/s "
+              "p50=%.1fms p99=%.1fms"
+              % (name, point["slots"], point["concurrency"],
+                 point["ops_per_s"], point["cycles_per_s"],
+                 point["p50"] * 1000, point["p99"] * 1000))
+        for stage in STAGES:
+            h = point["ops"].get(stage)
+            if h is not None:
+                print("%s slots=%i concurrency=%i %s: n=%i p50=%.1fms "
+                      "p99=%.1fms max=%.1fms"
+                      % (name, point["slots"], point["concurrency"], stage,
+                         h["count"], h["p50"] * 1000, h["p99"] * 1000,
+                         h["max"] * 1000))
+    knee = saturation(curve)
+    if knee is None:
+        print("%s: throughput still growing at %i in flight"
+              % (name, max(p["concurrency"] for p in curve)))
+    else:
+        print("%s: saturates at %i in flight (%i slots), %.0f compounds/s"
+              % (name, knee["concurrency"], knee["slots"],
+                 knee["ops_per_s"]))
+    return curve
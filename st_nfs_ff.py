@@ -7,6 +7,19 @@ from pnfs_obj_v2_const import *
 from pnfs_obj_v2_type import *
 from obj_v2 import Packer as ObjV2Packer, Unpacker as ObjV2Unpacker
 from layoutcheck import check_layout, check_devid, check_devid_flex, check_devid_flex
+from multiclient import RecallScenario, open_layout_fanout
+from waits import wait_event, wait_reply_sent
+from seeding import seed_file
+from sessionpool import pooled_session
+from iothroughput import run_io, mds_target, ds_target, close_target, \
+    report, IO_SPAN
+from slotbench import slot_scaling, report as slot_report
+from commitstress import CommitStress, report as commit_report
+from returnbench import ReturnBench, PATTERNS, FRAGMENT_FILES, \
+    report as return_report
+from stateidmodel import LayoutStateidModel, CheckedSession, \
+    watch_layout_recalls, random_layouts, WALK_WINDOW
+from recalltiming import RecallTimer
 
 import socket
 import math
@@ -15,26 +28,11 @@ import threading
 def createWriteReadCloseClient1(sess1, fileOwner, filePath):
 
 #    print "***** createWriteReadCloseClient1: Creating file '%s', with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = create_file(sess1, fileOwner, filePath, attrs={FATTR4_MODE: 0777}, want_deleg=True, access=OPEN4_SHARE_ACCESS_WANT_ANY_DELEG | OPEN4_SHARE_ACCESS_BOTH)
-    check(res)
-    fh = res.resarray[-1].object
-    stateid = res.resarray[-2].stateid
-    data = "write test data"
-    res = sess1.compound([op.putfh(fh),
-                          op.write(stateid, 5, FILE_SYNC4, data)])
-    check(res)
-    res = sess1.compound([op.putfh(fh),
-                          op.read(stateid, 0, 1000)])
-    check(res)
-    if not res.resarray[-1].eof:
-        fail("EOF not set on read")
-    desired = "\0" * 5 + data
-    if res.resarray[-1].data != desired:
-        fail("Expected %r, got %r" % (desired, res.resarray[-1].data))
-    else:
-        print "Written file data read back OK"
-    res = close_file(sess1, fh, stateid=stateid)
-    check(res)
+    # OPEN, WRITE, READ and CLOSE go in one compound
+    seed_file(sess1, fileOwner, filePath, "write test data", offset=5,
+              attrs={FATTR4_MODE: 0777}, want_deleg=True,
+              access=OPEN4_SHARE_ACCESS_WANT_ANY_DELEG | OPEN4_SHARE_ACCESS_BOTH)
+    print "Written file data read back OK"
 
 
 def test_FLEXFILE1(t, env):
@@ -43,8 +41,7 @@ def test_FLEXFILE1(t, env):
     FLAGS: nfs-ff
     CODE: FLEXFILE1
     """
-    sess1 = env.c1.new_client_session("1_%s" % env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess1 = pooled_session(env, t)
 
     res = create_file(sess1, env.testname(t))
     check(res)
@@ -278,6 +275,7 @@ def testFLEXFILE3 (t, env):
     FLAGS: nfs-ff
     CODE: FLEXFILE3
     """
+    timer = RecallTimer(env.testname(t))
     recall = threading.Event()
 
     def pre_hook(arg, env):
@@ -302,8 +300,7 @@ def testFLEXFILE3 (t, env):
     #print "***** Create - Client2Read *************************** "
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook, post_hook)
 
     #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
     res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
@@ -328,15 +325,16 @@ def testFLEXFILE3 (t, env):
     owner = open_owner4(0, fileOwner)
     how = openflag4(OPEN4_NOCREATE)
     open_op = op.open(0, OPEN4_SHARE_ACCESS_WRITE, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+    timer.open_sent()
     slot = sess2.compound_async(env.home + [open_op])
 
     #print "*************res from openClient2Write ===========", res
     #print "************* Wait for recall, and return delegation "
-    recall.wait()  # STUB - deal with timeout
-    #print "************* Getting here means CB_RECALL reply is in the send queue."
-    #print "************* Give it a moment to actually be sent"
-    env.sleep(.1)
+    wait_event(recall, what="CB_RECALL")
+    # Getting here means CB_RECALL reply is in the send queue.
+    wait_reply_sent(sess2)
     res = sess2.compound([op.putfh(fh2), op.delegreturn(recall.stateid)])
+    timer.returned(sess2.client)
     check(res)
 
     #print "************* Now get OPEN reply*"
@@ -399,6 +397,7 @@ def testFLEXFILE3 (t, env):
         state = NFS4_OK
 
     check(res, state)
+    timer.report()
 
 
 
@@ -410,6 +409,7 @@ def testFLEXFILE4(t, env):
     FLAGS: nfs-ff
     CODE: FLEXFILE4
     """
+    timer = RecallTimer(env.testname(t))
     recall = threading.Event()
 
     def pre_hook(arg, env):
@@ -434,8 +434,7 @@ def testFLEXFILE4(t, env):
     #print "***** Create - Client2 *************************** "
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook, post_hook)
 
     #print "write data to the file1 from client2Write"
     res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_WRITE,
@@ -464,6 +463,7 @@ def testFLEXFILE4(t, env):
     sessionName = env.testname(t) + "3"
     sess3 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
     #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
+    timer.open_sent()
     res = open_file(sess3, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
         deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
     #print "***********res from openClient2 Read=", res
@@ -487,8 +487,7 @@ def testFLEXFILE4(t, env):
     #print "***** Create - Client3 *************************** "
     sessionName = env.testname(t) + "4"
     sess4 = env.c3.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess4.client.cb_pre_hook(OP_CB_RECALL, pre_hook)
-    sess4.client.cb_post_hook(OP_CB_RECALL, post_hook)
+    timer.hook(sess4.client, OP_CB_RECALL, pre_hook, post_hook)
 
     #print "***** Open same fail for Read client3*************************** "
     claim = open_claim4(CLAIM_NULL, fileName)
@@ -548,6 +547,7 @@ def testFLEXFILE4(t, env):
         state = NFS4_OK
 
     check(res, state)
+    timer.report()
 
 
 def testFLEXFILE5(t, env):
@@ -557,6 +557,7 @@ def testFLEXFILE5(t, env):
     FLAGS: nfs-ff
     CODE: FLEXFILE5
     """
+    timer = RecallTimer(env.testname(t))
     recall = threading.Event()
 
     def pre_hook(arg, env):
@@ -581,8 +582,7 @@ def testFLEXFILE5(t, env):
     #print "***** Create - Client2Read *************************** "
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook, post_hook)
 
     #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
     res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
@@ -607,15 +607,16 @@ def testFLEXFILE5(t, env):
     owner = open_owner4(0, fileOwner)
     how = openflag4(OPEN4_NOCREATE)
     open_op = op.open(0, OPEN4_SHARE_ACCESS_WRITE, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+    timer.open_sent()
     slot = sess2.compound_async(env.home + [open_op])
 
     #print "*************res from openClient3Write ===========", res
     #print "************* Wait for recall, and return delegation "
-    recall.wait()  # STUB - deal with timeout
-    #print "************* Getting here means CB_RECALL reply is in the send queue."
-    #print "************* Give it a moment to actually be sent"
-    env.sleep(.1)
+    wait_event(recall, what="CB_RECALL")
+    # Getting here means CB_RECALL reply is in the send queue.
+    wait_reply_sent(sess2)
     res = sess2.compound([op.putfh(fh2), op.delegreturn(recall.stateid)])
+    timer.returned(sess2.client)
     check(res)
 
     #print "************* Now get OPEN reply*"
@@ -694,6 +695,7 @@ def testFLEXFILE5(t, env):
         state = NFS4_OK
 
     check(res, state)
+    timer.report()
 
 def testFLEXFILE6(t, env):
     """Create a file1, open_r it from client2, open_w from client2, expected result is nfs4err_delay until file closed from  .
@@ -701,6 +703,7 @@ def testFLEXFILE6(t, env):
     FLAGS: nfs-ff
     CODE: FLEXFILE6
     """
+    timer = RecallTimer(env.testname(t))
     recall = threading.Event()
 
     def pre_hook(arg, env):
@@ -725,8 +728,7 @@ def testFLEXFILE6(t, env):
     #print "***** Create - Client2Read *************************** "
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook, post_hook)
 
     #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
     res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
@@ -751,14 +753,15 @@ def testFLEXFILE6(t, env):
     owner = open_owner4(0, fileOwner)
     how = openflag4(OPEN4_NOCREATE)
     open_op = op.open(0, OPEN4_SHARE_ACCESS_WRITE, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+    timer.open_sent()
     slot = sess2.compound_async(env.home + [open_op])
 
     #print "************* Wait for recall, and return delegation "
-    recall.wait()  # STUB - deal with timeout
-    #print "************* Getting here means CB_RECALL reply is in the send queue."
-    #print "************* Give it a moment to actually be sent"
-    env.sleep(.1)
+    wait_event(recall, what="CB_RECALL")
+    # Getting here means CB_RECALL reply is in the send queue.
+    wait_reply_sent(sess2)
     res = sess2.compound([op.putfh(fh2), op.delegreturn(recall.stateid)])
+    timer.returned(sess2.client)
     check(res)
 
 #print "************* Now get OPEN reply*"
@@ -801,8 +804,7 @@ def testFLEXFILE6(t, env):
     #print "***** Create - Client3Wrie*************************** "
     sessionName = env.testname(t) + "3"
     sess3 = env.c3.new_client_session(sessionName)
-    sess3.client.cb_pre_hook(OP_CB_RECALL, pre_hook)
-    sess3.client.cb_post_hook(OP_CB_RECALL, post_hook)
+    timer.hook(sess3.client, OP_CB_RECALL, pre_hook, post_hook)
 
     res = open_file(sess3, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_WRITE,
                     deleg_type=OPEN_DELEGATE_WRITE, want_deleg=True)
@@ -862,6 +864,7 @@ def testFLEXFILE6(t, env):
         state = NFS4_OK
 
     check(res, state)
+    timer.report()
 
 def testFLEXFILE7(t, env):
 
@@ -871,6 +874,7 @@ def testFLEXFILE7(t, env):
     FLAGS: nfs-ff
     CODE: FLEXFILE7
     """
+    timer = RecallTimer(env.testname(t))
     recall1 = threading.Event()
     recall2 = threading.Event()
     recall3 = threading.Event()
@@ -912,8 +916,7 @@ def testFLEXFILE7(t, env):
     #print "Create sess1 and client1"
     sessionName = env.testname(t) + "1"
     sess1 = env.c1.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess1.client.cb_pre_hook(OP_CB_RECALL, pre_hook1)
-    sess1.client.cb_post_hook(OP_CB_RECALL, post_hook1)
+    timer.hook(sess1.client, OP_CB_RECALL, pre_hook1, post_hook1)
 
     fileOwner = "owner_%s" % sessionName
     fileName = env.testname(t)
@@ -921,122 +924,60 @@ def testFLEXFILE7(t, env):
 
     #print "********************* Creating a file with NO deleg"
     createWriteReadCloseClient1(sess1, fileOwner, filePath)
-    env.sleep(1)
-    res = open_file(sess1, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
 
-    fh1 = res.resarray[-1].object
-    stateid1 = res.resarray[-2].stateid
-    ops = [op.putfh(fh1),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid1, 0xffff)]
-    res = sess1.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid1 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client2Read *************************** "
+    #print "***** Create - Client2Read, Client3Read, Client4 *****"
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook2)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook2)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook2, post_hook2)
 
-    #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh2 = res.resarray[-1].object
-    stateid2 = res.resarray[-2].stateid
-    ops = [op.putfh(fh2),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid2, 0xffff)]
-    res = sess2.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid2 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client3Read *************************** "
     sessionName = env.testname(t) + "3"
     sess3 = env.c3.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess3.client.cb_pre_hook(OP_CB_RECALL, pre_hook3)
-    sess3.client.cb_post_hook(OP_CB_RECALL, post_hook3)
-
-    #print "***** openClient3Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess3, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh3 = res.resarray[-1].object
-    stateid3 = res.resarray[-2].stateid
-    ops = [op.putfh(fh3),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid3, 0xffff)]
-    res = sess3.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid3 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
+    timer.hook(sess3.client, OP_CB_RECALL, pre_hook3, post_hook3)
 
-    #print "***** Create - Client4 *************************** "
     sessionName = env.testname(t) + "4"
     sess4 = env.c4.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess4.client.cb_pre_hook(OP_CB_RECALL, pre_hook4)
-    sess4.client.cb_post_hook(OP_CB_RECALL, post_hook4)
+    timer.hook(sess4.client, OP_CB_RECALL, pre_hook4, post_hook4)
 
-    #print "***** openClient4 READ   file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess4, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient4Read", res
-    check(res)
-
-    fh4 = res.resarray[-1].object
-    stateid4 = res.resarray[-2].stateid
-    ops = [op.putfh(fh4),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid4, 0xffff)]
-    res = sess4.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid4 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
+    #print "***** Open for READ and get a read layout from all four clients"
+    opened = open_layout_fanout([sess1, sess2, sess3, sess4], fileOwner,
+                                filePath, LAYOUT4_FLEX_FILES)
+    fh1, fh2, fh3, fh4 = [o.fh for o in opened]
+    stateid1, stateid2, stateid3, stateid4 = [o.stateid for o in opened]
+    layout_stateid1, layout_stateid2, layout_stateid3, layout_stateid4 = \
+        [o.layout_stateid for o in opened]
+    roc = opened[-1].roc
 
     #print "***** Open some fail for Write Client4Write *************************** "
     claim = open_claim4(CLAIM_NULL, fileName)
     owner = open_owner4(0, fileOwner)
     how = openflag4(OPEN4_NOCREATE)
     open_op = op.open(0, OPEN4_SHARE_ACCESS_WRITE, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+    timer.open_sent()
     slot = sess4.compound_async(env.home + [open_op])
 
     #print "*************res from openClient4Write ===========", res
     #print "************* Wait for recall, and return delegation "
-    recall1.wait()  # STUB - deal with timeout
-    recall2.wait()  # STUB - deal with timeout
-    recall3.wait()  # STUB - deal with timeout
-    recall4.wait()  # STUB - deal with timeout
+    wait_event(recall1, what="CB_RECALL")
+    wait_event(recall2, what="CB_RECALL")
+    wait_event(recall3, what="CB_RECALL")
+    wait_event(recall4, what="CB_RECALL")
     #print "************* Getting here means CB_RECALL reply is in the send queue."
     #print "************* Give it a moment to actually be sent"
 
     res = sess1.compound([op.putfh(fh1), op.delegreturn(recall1.stateid1)])
+    timer.returned(sess1.client)
     check(res)
 
     res = sess2.compound([op.putfh(fh2), op.delegreturn(recall2.stateid2)])
+    timer.returned(sess2.client)
     check(res)
 
     res = sess3.compound([op.putfh(fh3), op.delegreturn(recall3.stateid3)])
+    timer.returned(sess3.client)
     check(res)
 
     res = sess4.compound([op.putfh(fh4), op.delegreturn(recall4.stateid4)])
+    timer.returned(sess4.client)
     check(res)
 
     res = sess4.listen(slot)
@@ -1166,6 +1107,7 @@ def testFLEXFILE7(t, env):
         state = NFS4ERR_BAD_STATEID
 
     check(res, state)
+    timer.report()
 
 
 def testFLEXFILE8(t, env):
@@ -1176,6 +1118,7 @@ def testFLEXFILE8(t, env):
     FLAGS: nfs-ff
     CODE: FLEXFILE8
     """
+    timer = RecallTimer(env.testname(t))
     recall1 = threading.Event()
     recall2 = threading.Event()
     recall3 = threading.Event()
@@ -1217,8 +1160,7 @@ def testFLEXFILE8(t, env):
     #print "Create sess1 and client1"
     sessionName = env.testname(t) + "1"
     sess1 = env.c1.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess1.client.cb_pre_hook(OP_CB_RECALL, pre_hook1)
-    sess1.client.cb_post_hook(OP_CB_RECALL, post_hook1)
+    timer.hook(sess1.client, OP_CB_RECALL, pre_hook1, post_hook1)
 
     fileOwner = "owner_%s" % sessionName
     fileName = env.testname(t)
@@ -1226,122 +1168,60 @@ def testFLEXFILE8(t, env):
 
     #print "********************* Creating a file with NO deleg"
     createWriteReadCloseClient1(sess1, fileOwner, filePath)
-    env.sleep(1)
-    res = open_file(sess1, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh1 = res.resarray[-1].object
-    stateid1 = res.resarray[-2].stateid
-    ops = [op.putfh(fh1),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid1, 0xffff)]
-    res = sess1.compound(ops)
-    check(res)
 
-    #print "***** Return read layout  *********"
-    layout_stateid1 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client2Read *************************** "
+    #print "***** Create - Client2Read, Client3Read, Client4 *****"
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook2)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook2)
-
-    #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook2, post_hook2)
 
-    fh2 = res.resarray[-1].object
-    stateid2 = res.resarray[-2].stateid
-    ops = [op.putfh(fh2),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid2, 0xffff)]
-    res = sess2.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid2 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client3Read *************************** "
     sessionName = env.testname(t) + "3"
     sess3 = env.c3.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess3.client.cb_pre_hook(OP_CB_RECALL, pre_hook3)
-    sess3.client.cb_post_hook(OP_CB_RECALL, post_hook3)
+    timer.hook(sess3.client, OP_CB_RECALL, pre_hook3, post_hook3)
 
-    #print "***** openClient3Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess3, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh3 = res.resarray[-1].object
-    stateid3 = res.resarray[-2].stateid
-    ops = [op.putfh(fh3),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid3, 0xffff)]
-    res = sess3.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid3 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client4 *************************** "
     sessionName = env.testname(t) + "4"
     sess4 = env.c4.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess4.client.cb_pre_hook(OP_CB_RECALL, pre_hook4)
-    sess4.client.cb_post_hook(OP_CB_RECALL, post_hook4)
+    timer.hook(sess4.client, OP_CB_RECALL, pre_hook4, post_hook4)
 
-    #print "***** openClient4 READ   file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess4, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient4Read", res
-    check(res)
-
-    fh4 = res.resarray[-1].object
-    stateid4 = res.resarray[-2].stateid
-    ops = [op.putfh(fh4),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid4, 0xffff)]
-    res = sess4.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid4 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
+    #print "***** Open for READ and get a read layout from all four clients"
+    opened = open_layout_fanout([sess1, sess2, sess3, sess4], fileOwner,
+                                filePath, LAYOUT4_FLEX_FILES)
+    fh1, fh2, fh3, fh4 = [o.fh for o in opened]
+    stateid1, stateid2, stateid3, stateid4 = [o.stateid for o in opened]
+    layout_stateid1, layout_stateid2, layout_stateid3, layout_stateid4 = \
+        [o.layout_stateid for o in opened]
+    roc = opened[-1].roc
 
     #print "***** Open some fail for Write Client4Write *************************** "
     claim = open_claim4(CLAIM_NULL, fileName)
     owner = open_owner4(0, fileOwner)
     how = openflag4(OPEN4_NOCREATE)
     open_op = op.open(0, OPEN4_SHARE_ACCESS_WRITE, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+    timer.open_sent()
     slot = sess4.compound_async(env.home + [open_op])
 
     #print "*************res from openClient4Write ===========", res
     #print "************* Wait for recall, and return delegation "
-    recall1.wait()  # STUB - deal with timeout
-    recall2.wait()  # STUB - deal with timeout
-    recall3.wait()  # STUB - deal with timeout
-    recall4.wait()  # STUB - deal with timeout
+    wait_event(recall1, what="CB_RECALL")
+    wait_event(recall2, what="CB_RECALL")
+    wait_event(recall3, what="CB_RECALL")
+    wait_event(recall4, what="CB_RECALL")
     #print "************* Getting here means CB_RECALL reply is in the send queue."
     #print "************* Give it a moment to actually be sent"
 
     res = sess1.compound([op.putfh(fh1), op.delegreturn(recall1.stateid1)])
+    timer.returned(sess1.client)
     check(res)
 
     res = sess2.compound([op.putfh(fh2), op.delegreturn(recall2.stateid2)])
+    timer.returned(sess2.client)
     check(res)
 
     res = sess3.compound([op.putfh(fh3), op.delegreturn(recall3.stateid3)])
+    timer.returned(sess3.client)
     check(res)
 
     res = sess4.compound([op.putfh(fh4), op.delegreturn(recall4.stateid4)])
+    timer.returned(sess4.client)
     check(res)
 
     res = sess4.listen(slot)
@@ -1486,6 +1366,7 @@ def testFLEXFILE8(t, env):
         state = NFS4_OK
 
     check(res, state)
+    timer.report()
 
 
 def testFLEXFILE9(t, env):
@@ -1497,6 +1378,7 @@ def testFLEXFILE9(t, env):
     FLAGS: nfs-ff
     CODE: FLEXFILE9
     """
+    timer = RecallTimer(env.testname(t))
     recall1 = threading.Event()
     recall2 = threading.Event()
     recall3 = threading.Event()
@@ -1538,8 +1420,7 @@ def testFLEXFILE9(t, env):
     #print "Create sess1 and client1"
     sessionName = env.testname(t) + "1"
     sess1 = env.c1.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess1.client.cb_pre_hook(OP_CB_RECALL, pre_hook1)
-    sess1.client.cb_post_hook(OP_CB_RECALL, post_hook1)
+    timer.hook(sess1.client, OP_CB_RECALL, pre_hook1, post_hook1)
 
     fileOwner = "owner_%s" % sessionName
     fileName = env.testname(t)
@@ -1547,95 +1428,28 @@ def testFLEXFILE9(t, env):
 
     #print "********************* Creating a file with NO deleg"
     createWriteReadCloseClient1(sess1, fileOwner, filePath)
-    env.sleep(1)
-    res = open_file(sess1, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh1 = res.resarray[-1].object
-    stateid1 = res.resarray[-2].stateid
-    ops = [op.putfh(fh1),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid1, 0xffff)]
-    res = sess1.compound(ops)
-    check(res)
 
-    #print "***** Return read layout  *********"
-    layout_stateid1 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client2Read *************************** "
+    #print "***** Create - Client2Read, Client3Read, Client4 *****"
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook2)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook2)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook2, post_hook2)
 
-    #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh2 = res.resarray[-1].object
-    stateid2 = res.resarray[-2].stateid
-    ops = [op.putfh(fh2),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid2, 0xffff)]
-    res = sess2.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid2 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client3Read *************************** "
     sessionName = env.testname(t) + "3"
     sess3 = env.c3.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess3.client.cb_pre_hook(OP_CB_RECALL, pre_hook3)
-    sess3.client.cb_post_hook(OP_CB_RECALL, post_hook3)
-
-    #print "***** openClient3Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess3, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
+    timer.hook(sess3.client, OP_CB_RECALL, pre_hook3, post_hook3)
 
-    fh3 = res.resarray[-1].object
-    stateid3 = res.resarray[-2].stateid
-    ops = [op.putfh(fh3),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid3, 0xffff)]
-    res = sess3.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid3 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client4 *************************** "
     sessionName = env.testname(t) + "4"
     sess4 = env.c4.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess4.client.cb_pre_hook(OP_CB_RECALL, pre_hook4)
-    sess4.client.cb_post_hook(OP_CB_RECALL, post_hook4)
-
-    #print "***** openClient4 READ   file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess4, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient4Read", res
-    check(res)
-
-    fh4 = res.resarray[-1].object
-    stateid4 = res.resarray[-2].stateid
-    ops = [op.putfh(fh4),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid4, 0xffff)]
-    res = sess4.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid4 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
+    timer.hook(sess4.client, OP_CB_RECALL, pre_hook4, post_hook4)
+
+    #print "***** Open for READ and get a read layout from all four clients"
+    opened = open_layout_fanout([sess1, sess2, sess3, sess4], fileOwner,
+                                filePath, LAYOUT4_FLEX_FILES)
+    fh1, fh2, fh3, fh4 = [o.fh for o in opened]
+    stateid1, stateid2, stateid3, stateid4 = [o.stateid for o in opened]
+    layout_stateid1, layout_stateid2, layout_stateid3, layout_stateid4 = \
+        [o.layout_stateid for o in opened]
+    roc = opened[-1].roc
     #print "***** read_state4  *********"
     res = sess4.compound([op.putfh(fh4),
                           op.read(stateid4, 0, 1000)])
@@ -1645,27 +1459,32 @@ def testFLEXFILE9(t, env):
     owner = open_owner4(0, fileOwner)
     how = openflag4(OPEN4_NOCREATE)
     open_op = op.open(0, OPEN4_SHARE_ACCESS_WRITE, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+    timer.open_sent()
     slot = sess4.compound_async(env.home + [open_op])
 
     #print "*************res from openClient4Write ===========", res
     #print "************* Wait for recall, and return delegation "
-    recall1.wait()  # STUB - deal with timeout
-    recall2.wait()  # STUB - deal with timeout
-    recall3.wait()  # STUB - deal with timeout
-    recall4.wait()  # STUB - deal with timeout
+    wait_event(recall1, what="CB_RECALL")
+    wait_event(recall2, what="CB_RECALL")
+    wait_event(recall3, what="CB_RECALL")
+    wait_event(recall4, what="CB_RECALL")
     #print "************* Getting here means CB_RECALL reply is in the send queue."
     #print "************* Give it a moment to actually be sent"
 
     res = sess1.compound([op.putfh(fh1), op.delegreturn(recall1.stateid1)])
+    timer.returned(sess1.client)
     check(res)
 
     res = sess2.compound([op.putfh(fh2), op.delegreturn(recall2.stateid2)])
+    timer.returned(sess2.client)
     check(res)
 
     res = sess3.compound([op.putfh(fh3), op.delegreturn(recall3.stateid3)])
+    timer.returned(sess3.client)
     check(res)
 
     res = sess4.compound([op.putfh(fh4), op.delegreturn(recall4.stateid4)])
+    timer.returned(sess4.client)
     check(res)
 
     res = sess4.listen(slot)
@@ -1801,6 +1620,7 @@ def testFLEXFILE9(t, env):
         state = NFS4_OK
 
     check(res, state)
+    timer.report()
 
 
 
@@ -1812,6 +1632,7 @@ def testFLEXFILE10(t, env):
     FLAGS: nfs-ff
     CODE: FLEXFILE10
     """
+    timer = RecallTimer(env.testname(t))
     recall1 = threading.Event()
     recall2 = threading.Event()
     recall3 = threading.Event()
@@ -1852,8 +1673,7 @@ def testFLEXFILE10(t, env):
     #print "Create sess1 and client1"
     sessionName = env.testname(t) + "1"
     sess1 = env.c1.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess1.client.cb_pre_hook(OP_CB_RECALL, pre_hook1)
-    sess1.client.cb_post_hook(OP_CB_RECALL, post_hook1)
+    timer.hook(sess1.client, OP_CB_RECALL, pre_hook1, post_hook1)
 
     fileOwner = "owner_%s" % sessionName
     fileName = env.testname(t)
@@ -1861,122 +1681,60 @@ def testFLEXFILE10(t, env):
 
     #print "********************* Creating a file with NO deleg"
     createWriteReadCloseClient1(sess1, fileOwner, filePath)
-    env.sleep(1)
-    res = open_file(sess1, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
 
-    fh1 = res.resarray[-1].object
-    stateid1 = res.resarray[-2].stateid
-    ops = [op.putfh(fh1),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid1, 0xffff)]
-    res = sess1.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid1 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client2Read *************************** "
+    #print "***** Create - Client2Read, Client3Read, Client4 *****"
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook2)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook2)
-
-    #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh2 = res.resarray[-1].object
-    stateid2 = res.resarray[-2].stateid
-    ops = [op.putfh(fh2),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid2, 0xffff)]
-    res = sess2.compound(ops)
-    check(res)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook2, post_hook2)
 
-    #print "***** Return read layout  *********"
-    layout_stateid2 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client3Read *************************** "
     sessionName = env.testname(t) + "3"
     sess3 = env.c3.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess3.client.cb_pre_hook(OP_CB_RECALL, pre_hook3)
-    sess3.client.cb_post_hook(OP_CB_RECALL, post_hook3)
+    timer.hook(sess3.client, OP_CB_RECALL, pre_hook3, post_hook3)
 
-    #print "***** openClient3Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess3, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh3 = res.resarray[-1].object
-    stateid3 = res.resarray[-2].stateid
-    ops = [op.putfh(fh3),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid3, 0xffff)]
-    res = sess3.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid3 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client4 *************************** "
     sessionName = env.testname(t) + "4"
     sess4 = env.c4.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess4.client.cb_pre_hook(OP_CB_RECALL, pre_hook4)
-    sess4.client.cb_post_hook(OP_CB_RECALL, post_hook4)
+    timer.hook(sess4.client, OP_CB_RECALL, pre_hook4, post_hook4)
 
-    #print "***** openClient4 READ   file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess4, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient4Read", res
-    check(res)
-
-    fh4 = res.resarray[-1].object
-    stateid4 = res.resarray[-2].stateid
-    ops = [op.putfh(fh4),
-           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid4, 0xffff)]
-    res = sess4.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid4 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
+    #print "***** Open for READ and get a read layout from all four clients"
+    opened = open_layout_fanout([sess1, sess2, sess3, sess4], fileOwner,
+                                filePath, LAYOUT4_FLEX_FILES)
+    fh1, fh2, fh3, fh4 = [o.fh for o in opened]
+    stateid1, stateid2, stateid3, stateid4 = [o.stateid for o in opened]
+    layout_stateid1, layout_stateid2, layout_stateid3, layout_stateid4 = \
+        [o.layout_stateid for o in opened]
+    roc = opened[-1].roc
 
     #print "***** Open some fail for Write Client4Write *************************** "
     claim = open_claim4(CLAIM_NULL, fileName)
     owner = open_owner4(0, fileOwner)
     how = openflag4(OPEN4_NOCREATE)
     open_op = op.open(0, OPEN4_SHARE_ACCESS_WRITE, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+    timer.open_sent()
     slot = sess4.compound_async(env.home + [open_op])
 
     #print "*************res from openClient4Write ===========", res
     #print "************* Wait for recall, and return delegation "
-    recall1.wait()  # STUB - deal with timeout
-    recall2.wait()  # STUB - deal with timeout
-    recall3.wait()  # STUB - deal with timeout
-    recall4.wait()  # STUB - deal with timeout
+    wait_event(recall1, what="CB_RECALL")
+    wait_event(recall2, what="CB_RECALL")
+    wait_event(recall3, what="CB_RECALL")
+    wait_event(recall4, what="CB_RECALL")
     #print "************* Getting here means CB_RECALL reply is in the send queue."
     #print "************* Give it a moment to actually be sent"
 
     res = sess1.compound([op.putfh(fh1), op.delegreturn(recall1.stateid1)])
+    timer.returned(sess1.client)
     check(res)
 
     res = sess2.compound([op.putfh(fh2), op.delegreturn(recall2.stateid2)])
+    timer.returned(sess2.client)
     check(res)
 
     res = sess3.compound([op.putfh(fh3), op.delegreturn(recall3.stateid3)])
+    timer.returned(sess3.client)
     check(res)
 
     res = sess4.compound([op.putfh(fh4), op.delegreturn(recall4.stateid4)])
+    timer.returned(sess4.client)
     check(res)
 
     res = sess4.listen(slot)
@@ -2128,4 +1886,217 @@ def testFLEXFILE10(t, env):
         state = NFS4_OK
 
     check(res, state)
+    timer.report()
+
+
+def recallFanout(t, env, nclients, writers=0):
+    """Open from nclients clients, recall them with one conflicting OPEN,
+    then close and return every layout.
+    """
+    p = ObjV2Packer()
+    p.pack_pnfs_obj_layoutupdate4(
+        pnfs_obj_layoutupdate4(pnfs_obj_deltaspaceused4(True, 0), False))
+    scenario = RecallScenario(env, env.testname(t), nclients, writers,
+                              LAYOUT4_FLEX_FILES, p.get_buffer())
+    scenario.create(createWriteReadCloseClient1)
+    scenario.open_all()
+    scenario.recall()
+    scenario.close_all()
+    scenario.return_layouts()
+    scenario.timer.report()
+
+
+def testFLEXFILEFanout32(t, env):
+    """Multiopen to read from 32 clients, open_write from the last one.
+       All read delegations are recalled and returned, every client closes
+       and returns its layout.
+
+    FLAGS: nfs-ff-scale
+    CODE: FLEXFILEFAN32
+    """
+    recallFanout(t, env, 32)
+
+
+def testFLEXFILEFanout64(t, env):
+    """Multiopen to read from 64 clients, open_write from the last one.
+
+    FLAGS: nfs-ff-scale
+    CODE: FLEXFILEFAN64
+    """
+    recallFanout(t, env, 64)
+
+
+def testFLEXFILEFanout128(t, env):
+    """Multiopen to read from 128 clients, open_write from the last one.
+
+    FLAGS: nfs-ff-scale
+    CODE: FLEXFILEFAN128
+    """
+    recallFanout(t, env, 128)
+
+
+def testFLEXFILEFanoutMixed64(t, env):
+    """Multiopen from 64 clients, 8 of them for write, open_write from the
+       last one.
+
+    FLAGS: nfs-ff-scale
+    CODE: FLEXFILEFANMIX64
+    """
+    recallFanout(t, env, 64, writers=8)
+
+
+def ioThroughput(t, env, target):
+    """Keep every slot busy with WRITEs for IO_DURATION seconds, then with
+    READs of what was written; closes target.
+    """
+    name = env.testname(t)
+    try:
+        written = report(name, run_io(target, "write"))
+        report(name, run_io(target, "read", span=min(written["bytes"], IO_SPAN)))
+    finally:
+        close_target(target)
+
+
+def testFLEXFILEThroughputMDS(t, env):
+    """Slot-parallel WRITE and READ throughput through the MDS
 
+    FLAGS: nfs-ff-bench
+    CODE: FLEXFILEIO1
+    """
+    sess = pooled_session(env, t)
+    res = create_file(sess, env.testname(t))
+    check(res)
+    fh = res.resarray[-1].object
+    stateid = res.resarray[-2].stateid
+
+    ioThroughput(t, env, mds_target(sess, fh, stateid))
+
+    res = close_file(sess, fh, stateid=stateid)
+    check(res)
+
+
+def testFLEXFILEThroughputDS(t, env):
+    """Slot-parallel WRITE and READ throughput straight to the first data
+       server of a RW layout
+
+    FLAGS: nfs-ff-bench
+    CODE: FLEXFILEIO2
+    """
+    sess = pooled_session(env, t)
+    res = create_file(sess, env.testname(t))
+    check(res)
+    fh = res.resarray[-1].object
+    stateid = res.resarray[-2].stateid
+
+    ops = [op.putfh(fh),
+           op.layoutget(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_RW,
+                        0, 0xffffffffffffffff, 0, stateid, 0xffff)]
+    res = sess.compound(ops)
+    check(res)
+    layout_stateid = res.resarray[-1].logr_stateid
+    layout = res.resarray[-1].logr_layout[0]
+
+    ioThroughput(t, env, ds_target(sess, layout, "%s_ds" % env.testname(t)))
+
+    ops = [op.putfh(fh),
+           op.layoutreturn(False, LAYOUT4_FLEX_FILES, LAYOUTIOMODE4_ANY,
+                           layoutreturn4(LAYOUTRETURN4_FILE,
+                                         layoutreturn_file4(0,
+                                                            0xffffffffffffffff,
+                                                            layout_stateid,
+                                                            "")))]
+    res = sess.compound(ops)
+    check(res)
+    res = close_file(sess, fh, stateid=stateid)
+    check(res)
+
+
+def testFLEXFILESlotScaling(t, env):
+    """OPEN/LAYOUTGET/LAYOUTCOMMIT/LAYOUTRETURN/CLOSE throughput and tail
+       latency as fore channel slots and compounds in flight grow
+
+    FLAGS: nfs-ff-bench
+    CODE: FLEXFILESLOTS1
+    """
+    name = env.testname(t)
+    slot_report(name, slot_scaling(env, name, LAYOUT4_FLEX_FILES))
+
+
+def testFLEXFILELayoutCommitStress(t, env):
+    """Sustained LAYOUTCOMMIT rate, latency and size visibility lag
+
+    FLAGS: nfs-ff-bench
+    CODE: FLEXFILECOMMIT1
+    """
+    name = env.testname(t)
+    stress = CommitStress(env, name, LAYOUT4_FLEX_FILES)
+    try:
+        commit_report(name, stress.run())
+    finally:
+        stress.finish()
+
+
+def layoutReturnFragments(t, env, return_body=""):
+    """Create FRAGMENT_FILES files and fragment their layouts with every
+       pattern, then in rounds ending in FSID and ALL returns.
+    """
+    sess = pooled_session(env, t)
+    files = []
+    for i in range(FRAGMENT_FILES):
+        res = create_file(sess, "%s_%i" % (env.testname(t), i))
+        check(res)
+        files.append((res.resarray[-1].object, res.resarray[-2].stateid))
+
+    bench = ReturnBench(sess, files, LAYOUT4_FLEX_FILES, return_body)
+    for pattern in PATTERNS:
+        bench.fragment(pattern)
+    bench.mix()
+    return_report(env.testname(t), bench.summary())
+
+    for fh, stateid in files:
+        res = close_file(sess, fh, stateid=stateid)
+        check(res)
+
+
+def testFLEXFILELayoutReturnFragments(t, env):
+    """LAYOUTRETURN latency as thousands of range returns fragment
+       full-file layouts, mixed with FSID and ALL returns
+
+    FLAGS: nfs-ff-bench
+    CODE: FLEXFILERETFRAG
+    """
+    layoutReturnFragments(t, env)
+
+
+def layoutStateidWalk(t, env, lo_type, return_body=""):
+    """Check every layout stateid of a long random LAYOUTGET/LAYOUTRETURN
+       walk over several files against the layout stateid model, then
+       close the files, dropping return-on-close layouts.
+    """
+    model = LayoutStateidModel()
+    sess = CheckedSession(pooled_session(env, t), model)
+    watch_layout_recalls(sess.client, model)
+    files = []
+    for i in range(WALK_WINDOW):
+        res = create_file(sess, "%s_%i" % (env.testname(t), i))
+        check(res)
+        files.append((res.resarray[-1].object, res.resarray[-2].stateid))
+
+    stats = random_layouts(sess, files, lo_type, return_body)
+    for fh, stateid in files:
+        res = close_file(sess, fh, stateid=stateid)
+        check(res)
+    model.quiesce()
+    stats.update(model.stats())
+    print "%s: %i ops checked in %.1fs (%.0f ops/s), window max %i" % \
+        (env.testname(t), stats["checked"], stats["seconds"],
+         stats["ops_per_s"], stats["window_max"])
+
+
+def testFLEXFILELayoutStateidModel(t, env):
+    """Layout stateid seqids of a long random walk follow RFC 5661 12.5.3
+
+    FLAGS: nfs-ff-bench
+    CODE: FLEXFILESTATEIDMODEL
+    """
+    layoutStateidWalk(t, env, LAYOUT4_FLEX_FILES)
@@ -7,6 +7,19 @@ from pnfs_obj_v2_const import *
 from pnfs_obj_v2_type import *
 from obj_v2 import Packer as ObjV2Packer, Unpacker as ObjV2Unpacker
 from layoutcheck import check_layout, check_devid, check_devid_flex, check_devid_flex
+from multiclient import RecallScenario, open_layout_fanout
+from waits import wait_event, wait_reply_sent
+from seeding import seed_file
+from sessionpool import pooled_session, session_pool
+from iothroughput import run_io, mds_target, ds_target, close_target, \
+    report, IO_SPAN
+from slotbench import slot_scaling, report as slot_report
+from commitstress import CommitStress, report as commit_report
+from returnbench import ReturnBench, PATTERNS, FRAGMENT_FILES, \
+    report as return_report
+from stateidmodel import LayoutStateidModel, CheckedSession, \
+    watch_layout_recalls, random_layouts, WALK_WINDOW
+from recalltiming import RecallTimer
 
 import socket
 import math
@@ -52,8 +65,7 @@ def testGetNfsObjDevList(t, env):
     DEPEND: NFSOBJ
     CODE: GETNFSOBJDLIST1
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
     # Send GETDEVICELIST
     ops = use_obj(env.opts.path) + \
         [op.getdevicelist(LAYOUT4_OBJECTS_V2,  # gdla_layout_type
@@ -99,8 +111,7 @@ def testGetNfsObjLayout(t, env):
     DEPEND: NFSOBJ
     CODE: GETNFSOBJLAYOUT1
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
     # Create the file
     res = create_file(sess, env.testname(t))
     check(res)
@@ -123,9 +134,40 @@ def testGetNfsObjLayout(t, env):
     check(res)
 
     # Parse opaque
+    for layout in res.resarray[-1].logr_layout:
+        check_layout(sess, layout, fh=fh)
+
+
+def testPooledLayoutSession(t, env):
+    """A pooled session that checked a layout is lent again
+
+    check_layout() watches device notifications for the client; that
+    must not keep the pool from reusing the session.
+
+    FLAGS: nfs-obj
+    DEPEND: GETNFSOBJLAYOUT1
+    CODE: NFSOBJPOOL1
+    """
+    sess = pooled_session(env, t, fresh=True)
+    res = create_file(sess, env.testname(t))
+    check(res)
+    fh = res.resarray[-1].object
+    open_stateid = res.resarray[-2].stateid
+
+    ops = [op.putfh(fh),
+           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
+                        0, 0xffffffffffffffff, 0, open_stateid, 0xffff)]
+    res = sess.compound(ops)
+    check(res)
     for layout in res.resarray[-1].logr_layout:
         check_layout(sess, layout)
 
+    if sess.dirty:
+        fail("check_layout() made the pooled session unusable")
+    session_pool(env).release(env.testname(t))
+    if pooled_session(env, t) is not sess:
+        fail("Session that ran check_layout() was not reused")
+
 
 def testGetNfsObjWriteLayout(t, env):
     """Verify layout handling
@@ -136,8 +178,7 @@ def testGetNfsObjWriteLayout(t, env):
     DEPEND: NFSOBJ
     CODE: GETNFSOBJLAYOUT2
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -155,7 +196,7 @@ def testGetNfsObjWriteLayout(t, env):
 
     # Parse opaque
     for layout in  res.resarray[-1].logr_layout:
-        check_layout(sess, layout)
+        check_layout(sess, layout, fh=fh)
 
 
 def testGetNFSOBJLayout3(t, env):
@@ -171,8 +212,7 @@ def testGetNFSOBJLayout3(t, env):
     DEPEND: NFSOBJ
     CODE: NFSOBJOPENSTATEID
     '''
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -190,7 +230,7 @@ def testGetNFSOBJLayout3(t, env):
 
     # Parse opaque
     for layout in  res.resarray[-1].logr_layout:
-        check_layout(sess, layout)
+        check_layout(sess, layout, fh=fh)
 
     # TODO: catch the error should be raise due to duplicate open stateid
     # and treat as PASS
@@ -216,8 +256,7 @@ def testGetNFSOBJLayout4(t, env):
     CODE: NFSOBJDELEGSTATEID
     '''
     # c1 - create a file and open for RW
-    sess = env.c1.new_client_session(env.testname(t),
-                           flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     res = create_file(sess, env.testname(t),
                       access=OPEN4_SHARE_ACCESS_READ |
@@ -235,7 +274,7 @@ def testGetNFSOBJLayout4(t, env):
 #
     # Parse opaque
     for layout in res.resarray[-1].logr_layout:
-        check_layout(sess, layout)
+        check_layout(sess, layout, fh=fh)
 
     # return delegation
     res = sess.compound([op.putfh(fh), op.delegreturn(deleg.stateid)])
@@ -256,8 +295,7 @@ def testNfsObjROC1(t, env):
     DEPEND: GETNFSOBJLAYOUT1
     CODE: NFSOBJROC
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -312,8 +350,7 @@ def testNfsObjROC2(t, env):
     DEPEND: GETNFSOBJLAYOUT1
     CODE: NFSOBJROC2
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -382,8 +419,7 @@ def testNfsObjLayoutReturnFile(t, env):
     DEPEND: GETNFSOBJLAYOUT1
     CODE: NFSOBJLAYOUTRET1
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -425,8 +461,7 @@ def testNfsObjLayoutReturnFsid(t, env):
     DEPEND: GETNFSOBJLAYOUT1
     CODE: NFSOBJLAYOUTRET2
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -461,8 +496,7 @@ def testNfsObjLayoutReturnAll(t, env):
     DEPEND: GETNFSOBJLAYOUT1
     CODE: NFSOBJLAYOUTRET3
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -486,6 +520,42 @@ def testNfsObjLayoutReturnAll(t, env):
     check(res)
 
 
+def layoutReturnFragments(t, env, return_body=""):
+    """Create FRAGMENT_FILES files and fragment their layouts with every
+       pattern, then in rounds ending in FSID and ALL returns.
+    """
+    sess = pooled_session(env, t)
+    files = []
+    for i in range(FRAGMENT_FILES):
+        res = create_file(sess, "%s_%i" % (env.testname(t), i))
+        check(res)
+        files.append((res.resarray[-1].object, res.resarray[-2].stateid))
+
+    bench = ReturnBench(sess, files, LAYOUT4_OBJECTS_V2, return_body)
+    for pattern in PATTERNS:
+        bench.fragment(pattern)
+    bench.mix()
+    return_report(env.testname(t), bench.summary())
+
+    for fh, stateid in files:
+        res = close_file(sess, fh, stateid=stateid)
+        check(res)
+
+
+def testNfsObjLayoutReturnFragments(t, env):
+    """LAYOUTRETURN latency as thousands of range returns fragment
+       full-file layouts, mixed with FSID and ALL returns
+
+    FLAGS: nfs-obj-bench
+    DEPEND: GETNFSOBJLAYOUT1
+    CODE: NFSOBJLAYOUTRETFRAG
+    """
+    p = ObjV2Packer()
+    p.pack_pnfs_obj_layoutreturn4(
+        pnfs_obj_layoutreturn4(pnfs_obj_ioerr4("", 0, 0, True, 0)))
+    layoutReturnFragments(t, env, p.get_buffer())
+
+
 def testNfsObjLayoutReturnFile2(t, env):
     """
     Return a file's layout with return data
@@ -496,8 +566,7 @@ def testNfsObjLayoutReturnFile2(t, env):
     DEPEND: NFSOBJ
     CODE: NFSOBJLAYOUTRET1a
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -547,8 +616,7 @@ def testNFSOBJLayoutReturnSEQID(t, env):
     DEPEND: NFSOBJ
     CODE: NFSOBJLAYOUTRET4
     '''
-    sess = env.c1.new_client_session(env.testname(t),
-                                    flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -619,8 +687,7 @@ def testNfsObjLayoutDoubleReturn(t, env):
     DEPEND: NFSOBJ
     CODE: NFSOBJLAYOUTRETD1
     """
-    sess = env.c1.new_client_session("1_%s" % env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -675,8 +742,7 @@ def testNfsObjLayoutFalseReturn(t, env):
     DEPEND: NFSOBJ
     CODE: NFSOBJLAYOUTRETF1
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -711,8 +777,7 @@ def testNfsObjLayoutCommitAfterReturn(t, env):
     DEPEND: NFSOBJ
     CODE: NFSOBJLAYOUTRETD2
     """
-    sess = env.c1.new_client_session("1_%s" % env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -779,8 +844,7 @@ def testNfsObjLayoutReturnOtherClient(t, env):
     DEPEND: NFSOBJ
     CODE: NFSOBJLAYOUTRETD3
     """
-    sess = env.c1.new_client_session("1_%s" % env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -831,8 +895,7 @@ def testLayoutStateid1(t, env):
     DEPEND: NFSOBJ
     CODE: NFS-OBJ1
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                        flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -883,8 +946,7 @@ def testLayoutStateid2(t, env):
     DEPEND: NFSOBJ
     CODE: NFS-OBJ2
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -948,8 +1010,7 @@ def testLayoutStateid3(t, env):
     DEPEND: NFSOBJ
     CODE: NFSOBJSTATEID3
     '''
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -994,8 +1055,7 @@ def testNfsObjLayoutCommit(t, env):
     DEPEND: NFSOBJ
     CODE: NFSOBJLAYOUTCOMMIT1
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Test that fs handles nfs-obj layouts
     ops = use_obj(env.opts.path) + [op.getattr(1 << FATTR4_LAYOUT_BLKSIZE)]
@@ -1052,8 +1112,7 @@ def testEmptyCommit(t, env):
     DEPEND: NFSOBJ
     CODE: NFS-OBJ3
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                    flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -1112,8 +1171,7 @@ def testSplitCommit(t, env):
     DEPEND: NFSOBJ
     CODE: NFS-OBJ4
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                        flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -1160,6 +1218,41 @@ def testSplitCommit(t, env):
     check(res)
 
 
+def layoutCommitStress(t, env, **kwargs):
+    """Keep one file under WRITE + LAYOUTCOMMIT from many sessions"""
+    p = ObjV2Packer()
+    p.pack_pnfs_obj_layoutupdate4(
+        pnfs_obj_layoutupdate4(pnfs_obj_deltaspaceused4(True, 0), False))
+    name = env.testname(t)
+    stress = CommitStress(env, name, LAYOUT4_OBJECTS_V2, p.get_buffer(),
+                          **kwargs)
+    try:
+        commit_report(name, stress.run())
+    finally:
+        stress.finish()
+
+
+def testNfsObjLayoutCommitStress(t, env):
+    """Sustained LAYOUTCOMMIT rate, latency and size visibility lag
+
+    FLAGS: nfs-obj-bench
+    DEPEND: NFSOBJ
+    CODE: NFSOBJCOMMIT1
+    """
+    layoutCommitStress(t, env)
+
+
+def testSplitCommitStress(t, env):
+    """As NFSOBJCOMMIT1, committing every extent in four disjoint
+       LAYOUTCOMMITs
+
+    FLAGS: nfs-obj-bench
+    DEPEND: NFSOBJ
+    CODE: NFSOBJCOMMIT2
+    """
+    layoutCommitStress(t, env, splits=4)
+
+
 def testNfsObjLayoutRecall1(t, env):
     """Verify layout recall
        Server should recall layouts for a file upon receiving an IO error
@@ -1170,6 +1263,7 @@ def testNfsObjLayoutRecall1(t, env):
     DEPEND: NFSOBJ
     CODE: NFSOBJLAYOUTRECALL1
     """
+    timer = RecallTimer(env.testname(t))
     recall = threading.Event()
 
     def pre_hook(arg, env):
@@ -1242,10 +1336,10 @@ def testNfsObjLayoutRecall1(t, env):
                                                             layout_stateid1,
                                                             p.get_buffer())))]
 
-    c2.cb_pre_hook(OP_CB_LAYOUTRECALL, pre_hook)
-    c2.cb_post_hook(OP_CB_LAYOUTRECALL, post_hook)
+    timer.hook(c2, OP_CB_LAYOUTRECALL, pre_hook, post_hook)
 
     recall.happened = False
+    timer.open_sent()
     slot1 = sess1.compound_async(ops)
     recall.wait(1)
 
@@ -1270,8 +1364,8 @@ def testNfsObjLayoutRecall1(t, env):
         fail("Did not get recall callback")
 
     # Getting here means CB_LAYOUTRECALL reply is in the send queue.
-    # Give it a moment to actually be sent
-    env.sleep(1)
+    # Wait until it has actually been sent
+    wait_reply_sent(sess2)
     ops = [op.putfh(fh2),
            op.layoutreturn(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_ANY,
                            layoutreturn4(LAYOUTRETURN4_FILE,
@@ -1280,7 +1374,9 @@ def testNfsObjLayoutRecall1(t, env):
                                                             layout_stateid2,
                                                             "")))]
     res = sess2.compound(ops)
+    timer.returned(c2, OP_CB_LAYOUTRECALL)
     check(res)
+    timer.report()
 
 
 def testNfsObjLayoutRecall2(t, env):
@@ -1293,6 +1389,7 @@ def testNfsObjLayoutRecall2(t, env):
     DEPEND: NFSOBJ
     CODE: NFSOBJLAYOUTRECALL2
     """
+    timer = RecallTimer(env.testname(t))
     recall = threading.Event()
 
     def pre_hook(arg, env):
@@ -1361,10 +1458,10 @@ def testNfsObjLayoutRecall2(t, env):
                            newoffset4(True, 0), newtime4(True, get_nfstime()),
                            layoutupdate4(LAYOUT4_OBJECTS_V2, p.get_buffer()))]
 
-    c2.cb_pre_hook(OP_CB_LAYOUTRECALL, pre_hook)
-    c2.cb_post_hook(OP_CB_LAYOUTRECALL, post_hook)
+    timer.hook(c2, OP_CB_LAYOUTRECALL, pre_hook, post_hook)
 
     recall.happened = False
+    timer.open_sent()
     slot1 = sess1.compound_async(ops)
     recall.wait(1)
 
@@ -1389,8 +1486,8 @@ def testNfsObjLayoutRecall2(t, env):
         fail("Did not get recall callback")
 
     # Getting here means CB_LAYOUTRECALL reply is in the send queue.
-    # Give it a moment to actually be sent
-    env.sleep(1)
+    # Wait until it has actually been sent
+    wait_reply_sent(sess2)
     ops = [op.putfh(fh2),
            op.layoutreturn(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_ANY,
                            layoutreturn4(LAYOUTRETURN4_FILE,
@@ -1399,7 +1496,9 @@ def testNfsObjLayoutRecall2(t, env):
                                                             layout_stateid2,
                                                             "")))]
     res = sess2.compound(ops)
+    timer.returned(c2, OP_CB_LAYOUTRECALL)
     check(res)
+    timer.report()
 
 
 def testNfsObjLayoutRecallBadClient(t, env):
@@ -1418,6 +1517,7 @@ def testNfsObjLayoutRecallBadClient(t, env):
     DEPEND: NFSOBJ
     CODE: NFSOBJLAYOUTRECALL3
     """
+    timer = RecallTimer(env.testname(t))
     recall = threading.Event()
 
     def pre_hook(arg, env):
@@ -1465,10 +1565,10 @@ def testNfsObjLayoutRecallBadClient(t, env):
                                                             layout_stateid,
                                                             p.get_buffer())))]
 
-    c1.cb_pre_hook(OP_CB_LAYOUTRECALL, pre_hook)
-    c1.cb_post_hook(OP_CB_LAYOUTRECALL, post_hook)
+    timer.hook(c1, OP_CB_LAYOUTRECALL, pre_hook, post_hook)
 
     recall.happened = False
+    timer.open_sent()
     slot1 = sess.compound_async(ops)
     recall.wait(1)
 
@@ -1493,8 +1593,8 @@ def testNfsObjLayoutRecallBadClient(t, env):
         fail("Did not get recall callback")
 
     # Getting here means CB_LAYOUTRECALL reply is in the send queue.
-    # Give it a moment to actually be sent
-    env.sleep(1)
+    # Wait until it has actually been sent
+    wait_reply_sent(sess)
     ops = [op.putfh(fh),
            op.layoutreturn(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_ANY,
                            layoutreturn4(LAYOUTRETURN4_FILE,
@@ -1503,7 +1603,9 @@ def testNfsObjLayoutRecallBadClient(t, env):
                                                             layout_stateid,
                                                             "")))]
     res = sess.compound(ops)
+    timer.returned(c1, OP_CB_LAYOUTRECALL)
     check(res)
+    timer.report()
 
 
 def testNfsObjLayoutRecallChmod(t, env):
@@ -1517,6 +1619,7 @@ def testNfsObjLayoutRecallChmod(t, env):
     DEPEND: NFSOBJ
     CODE: NFSOBJLAYOUTRECALL4
     """
+    timer = RecallTimer(env.testname(t))
     recall = threading.Event()
 
     def pre_hook(arg, env):
@@ -1571,10 +1674,10 @@ def testNfsObjLayoutRecallChmod(t, env):
     check(res)
 
     # Turn file read-only
-    c2.cb_pre_hook(OP_CB_LAYOUTRECALL, pre_hook)
-    c2.cb_post_hook(OP_CB_LAYOUTRECALL, post_hook)
+    timer.hook(c2, OP_CB_LAYOUTRECALL, pre_hook, post_hook)
 
     recall.happened = False
+    timer.open_sent()
     slot1 = sess1.compound_async([op.putfh(fh),
                                   op.setattr(stateid, {FATTR4_MODE:MODE4_RUSR})])
 
@@ -1624,8 +1727,8 @@ def testNfsObjLayoutRecallChmod(t, env):
         fail("Did not get recall callback")
 
     # Getting here means CB_LAYOUTRECALL reply is in the send queue.
-    # Give it a moment to actually be sent
-    env.sleep(1)
+    # Wait until it has actually been sent
+    wait_reply_sent(sess2)
     ops = [op.putfh(fh2),
            op.layoutreturn(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_ANY,
                            layoutreturn4(LAYOUTRETURN4_FILE,
@@ -1634,6 +1737,7 @@ def testNfsObjLayoutRecallChmod(t, env):
                                                             layout_stateid2,
                                                             "")))]
     res = sess2.compound(ops)
+    timer.returned(c2, OP_CB_LAYOUTRECALL)
     check(res)
 
     # Now get SETATTR reply
@@ -1645,6 +1749,7 @@ def testNfsObjLayoutRecallChmod(t, env):
         res = sess1.compound([op.putfh(fh),
                               op.setattr(stateid, {FATTR4_MODE:MODE4_RUSR})])
         check(res)
+    timer.report()
 
 
 def testReturnStateid1(t, env):
@@ -1656,8 +1761,7 @@ def testReturnStateid1(t, env):
     DEPEND: NFSOBJ
     CODE: NFS-OBJ5
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -1713,8 +1817,7 @@ def testReturnStateid2(t, env):
     DEPEND: NFSOBJ
     CODE: NFS-OBJ6
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -1759,8 +1862,7 @@ def testReturnStateid3(t, env):
     DEPEND: NFSOBJ
     CODE: NFS-OBJ7
     """
-    sess = env.c1.new_client_session(env.testname(t),
-                                     flags=EXCHGID4_FLAG_USE_PNFS_MDS)
+    sess = pooled_session(env, t)
 
     # Create the file
     res = create_file(sess, env.testname(t))
@@ -1805,29 +1907,52 @@ def testReturnStateid3(t, env):
         res = sess.compound(ops)
         check(res, NFS4ERR_BAD_STATEID)
 
+
+def layoutStateidWalk(t, env, lo_type, return_body=""):
+    """Check every layout stateid of a long random LAYOUTGET/LAYOUTRETURN
+       walk over several files against the layout stateid model, then
+       close the files, dropping return-on-close layouts.
+    """
+    model = LayoutStateidModel()
+    sess = CheckedSession(pooled_session(env, t), model)
+    watch_layout_recalls(sess.client, model)
+    files = []
+    for i in range(WALK_WINDOW):
+        res = create_file(sess, "%s_%i" % (env.testname(t), i))
+        check(res)
+        files.append((res.resarray[-1].object, res.resarray[-2].stateid))
+
+    stats = random_layouts(sess, files, lo_type, return_body)
+    for fh, stateid in files:
+        res = close_file(sess, fh, stateid=stateid)
+        check(res)
+    model.quiesce()
+    stats.update(model.stats())
+    print "%s: %i ops checked in %.1fs (%.0f ops/s), window max %i" % \
+        (env.testname(t), stats["checked"], stats["seconds"],
+         stats["ops_per_s"], stats["window_max"])
+
+
+def testLayoutStateidModel(t, env):
+    """Layout stateid seqids of a long random walk follow RFC 5661 12.5.3
+
+    FLAGS: nfs-obj-bench
+    DEPEND: GETNFSOBJLAYOUT1
+    CODE: NFSOBJSTATEIDMODEL
+    """
+    p = ObjV2Packer()
+    p.pack_pnfs_obj_layoutreturn4(
+        pnfs_obj_layoutreturn4(pnfs_obj_ioerr4("", 0, 0, True, 0)))
+    layoutStateidWalk(t, env, LAYOUT4_OBJECTS_V2, p.get_buffer())
+
 def createWriteReadCloseClient1(sess1, fileOwner, filePath):
 
 #    print "***** createWriteReadCloseClient1: Creating file '%s', with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = create_file(sess1, fileOwner, filePath, attrs={FATTR4_MODE: 0777}, want_deleg=True, access=OPEN4_SHARE_ACCESS_WANT_ANY_DELEG | OPEN4_SHARE_ACCESS_BOTH)
-    check(res)
-    fh = res.resarray[-1].object
-    stateid = res.resarray[-2].stateid
-    data = "write test data"
-    res = sess1.compound([op.putfh(fh),
-                          op.write(stateid, 5, FILE_SYNC4, data)])
-    check(res)
-    res = sess1.compound([op.putfh(fh),
-                          op.read(stateid, 0, 1000)])
-    check(res)
-    if not res.resarray[-1].eof:
-        fail("EOF not set on read")
-    desired = "\0" * 5 + data
-    if res.resarray[-1].data != desired:
-        fail("Expected %r, got %r" % (desired, res.resarray[-1].data))
-    else:
-        print "Written file data read back OK"
-    res = close_file(sess1, fh, stateid=stateid)
-    check(res)
+    # OPEN, WRITE, READ and CLOSE go in one compound
+    seed_file(sess1, fileOwner, filePath, "write test data", offset=5,
+              attrs={FATTR4_MODE: 0777}, want_deleg=True,
+              access=OPEN4_SHARE_ACCESS_WANT_ANY_DELEG | OPEN4_SHARE_ACCESS_BOTH)
+    print "Written file data read back OK"
 
 
 def testROC1(t, env):
@@ -2104,6 +2229,7 @@ def testROC3(t, env):
     FLAGS: nfs-obj
     CODE: ROC3
     """
+    timer = RecallTimer(env.testname(t))
     recall = threading.Event()
 
     def pre_hook(arg, env):
@@ -2129,8 +2255,7 @@ def testROC3(t, env):
     #print "***** Create - Client2Read *************************** "
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook, post_hook)
 
     #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
     res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
@@ -2155,15 +2280,16 @@ def testROC3(t, env):
     owner = open_owner4(0, fileOwner)
     how = openflag4(OPEN4_NOCREATE)
     open_op = op.open(0, OPEN4_SHARE_ACCESS_WRITE, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+    timer.open_sent()
     slot = sess2.compound_async(env.home + [open_op])
 
     #print "*************res from openClient2Write ===========", res
     #print "************* Wait for recall, and return delegation "
-    recall.wait()  # STUB - deal with timeout
-    #print "************* Getting here means CB_RECALL reply is in the send queue."
-    #print "************* Give it a moment to actually be sent"
-    env.sleep(.1)
+    wait_event(recall, what="CB_RECALL")
+    # Getting here means CB_RECALL reply is in the send queue.
+    wait_reply_sent(sess2)
     res = sess2.compound([op.putfh(fh2), op.delegreturn(recall.stateid)])
+    timer.returned(sess2.client)
     check(res)
 
     #print "************* Now get OPEN reply*"
@@ -2227,6 +2353,7 @@ def testROC3(t, env):
         state = NFS4_OK
 
     check(res, state)
+    timer.report()
 
 
 def testROC4(t, env):
@@ -2236,6 +2363,7 @@ def testROC4(t, env):
     FLAGS: nfs-obj
     CODE: ROC4
     """
+    timer = RecallTimer(env.testname(t))
     recall = threading.Event()
 
     def pre_hook(arg, env):
@@ -2260,8 +2388,7 @@ def testROC4(t, env):
     #print "***** Create - Client2 *************************** "
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook, post_hook)
 
     #print "write data to the file1 from client2Write"
     res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_WRITE,
@@ -2290,6 +2417,7 @@ def testROC4(t, env):
     sessionName = env.testname(t) + "3"
     sess3 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
     #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
+    timer.open_sent()
     res = open_file(sess3, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
         deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
     #print "***********res from openClient2 Read=", res
@@ -2313,8 +2441,7 @@ def testROC4(t, env):
     #print "***** Create - Client3 *************************** "
     sessionName = env.testname(t) + "4"
     sess4 = env.c3.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess4.client.cb_pre_hook(OP_CB_RECALL, pre_hook)
-    sess4.client.cb_post_hook(OP_CB_RECALL, post_hook)
+    timer.hook(sess4.client, OP_CB_RECALL, pre_hook, post_hook)
 
     #print "***** Open same fail for Read client3*************************** "
     claim = open_claim4(CLAIM_NULL, fileName)
@@ -2374,6 +2501,7 @@ def testROC4(t, env):
         state = NFS4_OK
 
     check(res, state)
+    timer.report()
 
 
 def testROC5(t, env):
@@ -2383,6 +2511,7 @@ def testROC5(t, env):
     FLAGS: nfs-obj
     CODE: ROC5
     """
+    timer = RecallTimer(env.testname(t))
     recall = threading.Event()
 
     def pre_hook(arg, env):
@@ -2407,8 +2536,7 @@ def testROC5(t, env):
     #print "***** Create - Client2Read *************************** "
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook, post_hook)
 
     #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
     res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
@@ -2433,15 +2561,16 @@ def testROC5(t, env):
     owner = open_owner4(0, fileOwner)
     how = openflag4(OPEN4_NOCREATE)
     open_op = op.open(0, OPEN4_SHARE_ACCESS_WRITE, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+    timer.open_sent()
     slot = sess2.compound_async(env.home + [open_op])
 
     #print "*************res from openClient3Write ===========", res
     #print "************* Wait for recall, and return delegation "
-    recall.wait()  # STUB - deal with timeout
-    #print "************* Getting here means CB_RECALL reply is in the send queue."
-    #print "************* Give it a moment to actually be sent"
-    env.sleep(.1)
+    wait_event(recall, what="CB_RECALL")
+    # Getting here means CB_RECALL reply is in the send queue.
+    wait_reply_sent(sess2)
     res = sess2.compound([op.putfh(fh2), op.delegreturn(recall.stateid)])
+    timer.returned(sess2.client)
     check(res)
 
     #print "************* Now get OPEN reply*"
@@ -2520,6 +2649,7 @@ def testROC5(t, env):
         state = NFS4_OK
 
     check(res, state)
+    timer.report()
 
 
 def testROC6(t, env):
@@ -2528,6 +2658,7 @@ def testROC6(t, env):
     FLAGS: nfs-obj
     CODE: ROC6
     """
+    timer = RecallTimer(env.testname(t))
     recall = threading.Event()
 
     def pre_hook(arg, env):
@@ -2552,8 +2683,7 @@ def testROC6(t, env):
     #print "***** Create - Client2Read *************************** "
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook, post_hook)
 
     #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
     res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
@@ -2578,14 +2708,15 @@ def testROC6(t, env):
     owner = open_owner4(0, fileOwner)
     how = openflag4(OPEN4_NOCREATE)
     open_op = op.open(0, OPEN4_SHARE_ACCESS_WRITE, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+    timer.open_sent()
     slot = sess2.compound_async(env.home + [open_op])
 
     #print "************* Wait for recall, and return delegation "
-    recall.wait()  # STUB - deal with timeout
-    #print "************* Getting here means CB_RECALL reply is in the send queue."
-    #print "************* Give it a moment to actually be sent"
-    env.sleep(.1)
+    wait_event(recall, what="CB_RECALL")
+    # Getting here means CB_RECALL reply is in the send queue.
+    wait_reply_sent(sess2)
     res = sess2.compound([op.putfh(fh2), op.delegreturn(recall.stateid)])
+    timer.returned(sess2.client)
     check(res)
 
 #print "************* Now get OPEN reply*"
@@ -2628,8 +2759,7 @@ def testROC6(t, env):
     #print "***** Create - Client3Wrie*************************** "
     sessionName = env.testname(t) + "3"
     sess3 = env.c3.new_client_session(sessionName)
-    sess3.client.cb_pre_hook(OP_CB_RECALL, pre_hook)
-    sess3.client.cb_post_hook(OP_CB_RECALL, post_hook)
+    timer.hook(sess3.client, OP_CB_RECALL, pre_hook, post_hook)
 
     res = open_file(sess3, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_WRITE,
                     deleg_type=OPEN_DELEGATE_WRITE, want_deleg=True)
@@ -2689,6 +2819,7 @@ def testROC6(t, env):
         state = NFS4_OK
 
     check(res, state)
+    timer.report()
 
 
 def testROC7(t, env):
@@ -2699,6 +2830,7 @@ def testROC7(t, env):
     FLAGS: nfs-obj
     CODE: ROC7
     """
+    timer = RecallTimer(env.testname(t))
     recall1 = threading.Event()
     recall2 = threading.Event()
     recall3 = threading.Event()
@@ -2740,8 +2872,7 @@ def testROC7(t, env):
     #print "Create sess1 and client1"
     sessionName = env.testname(t) + "1"
     sess1 = env.c1.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess1.client.cb_pre_hook(OP_CB_RECALL, pre_hook1)
-    sess1.client.cb_post_hook(OP_CB_RECALL, post_hook1)
+    timer.hook(sess1.client, OP_CB_RECALL, pre_hook1, post_hook1)
 
     fileOwner = "owner_%s" % sessionName
     fileName = env.testname(t)
@@ -2749,122 +2880,60 @@ def testROC7(t, env):
 
     #print "********************* Creating a file with NO deleg"
     createWriteReadCloseClient1(sess1, fileOwner, filePath)
-    env.sleep(1)
-    res = open_file(sess1, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
 
-    fh1 = res.resarray[-1].object
-    stateid1 = res.resarray[-2].stateid
-    ops = [op.putfh(fh1),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid1, 0xffff)]
-    res = sess1.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid1 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client2Read *************************** "
+    #print "***** Create - Client2Read, Client3Read, Client4 *****"
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook2)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook2)
-
-    #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh2 = res.resarray[-1].object
-    stateid2 = res.resarray[-2].stateid
-    ops = [op.putfh(fh2),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid2, 0xffff)]
-    res = sess2.compound(ops)
-    check(res)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook2, post_hook2)
 
-    #print "***** Return read layout  *********"
-    layout_stateid2 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client3Read *************************** "
     sessionName = env.testname(t) + "3"
     sess3 = env.c3.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess3.client.cb_pre_hook(OP_CB_RECALL, pre_hook3)
-    sess3.client.cb_post_hook(OP_CB_RECALL, post_hook3)
-
-    #print "***** openClient3Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess3, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh3 = res.resarray[-1].object
-    stateid3 = res.resarray[-2].stateid
-    ops = [op.putfh(fh3),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid3, 0xffff)]
-    res = sess3.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid3 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
+    timer.hook(sess3.client, OP_CB_RECALL, pre_hook3, post_hook3)
 
-    #print "***** Create - Client4 *************************** "
     sessionName = env.testname(t) + "4"
     sess4 = env.c4.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess4.client.cb_pre_hook(OP_CB_RECALL, pre_hook4)
-    sess4.client.cb_post_hook(OP_CB_RECALL, post_hook4)
+    timer.hook(sess4.client, OP_CB_RECALL, pre_hook4, post_hook4)
 
-    #print "***** openClient4 READ   file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess4, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient4Read", res
-    check(res)
-
-    fh4 = res.resarray[-1].object
-    stateid4 = res.resarray[-2].stateid
-    ops = [op.putfh(fh4),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid4, 0xffff)]
-    res = sess4.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid4 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
+    #print "***** Open for READ and get a read layout from all four clients"
+    opened = open_layout_fanout([sess1, sess2, sess3, sess4], fileOwner,
+                                filePath, LAYOUT4_OBJECTS_V2)
+    fh1, fh2, fh3, fh4 = [o.fh for o in opened]
+    stateid1, stateid2, stateid3, stateid4 = [o.stateid for o in opened]
+    layout_stateid1, layout_stateid2, layout_stateid3, layout_stateid4 = \
+        [o.layout_stateid for o in opened]
+    roc = opened[-1].roc
 
     #print "***** Open some fail for Write Client4Write *************************** "
     claim = open_claim4(CLAIM_NULL, fileName)
     owner = open_owner4(0, fileOwner)
     how = openflag4(OPEN4_NOCREATE)
     open_op = op.open(0, OPEN4_SHARE_ACCESS_WRITE, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+    timer.open_sent()
     slot = sess4.compound_async(env.home + [open_op])
 
     #print "*************res from openClient4Write ===========", res
     #print "************* Wait for recall, and return delegation "
-    recall1.wait()  # STUB - deal with timeout
-    recall2.wait()  # STUB - deal with timeout
-    recall3.wait()  # STUB - deal with timeout
-    recall4.wait()  # STUB - deal with timeout
+    wait_event(recall1, what="CB_RECALL")
+    wait_event(recall2, what="CB_RECALL")
+    wait_event(recall3, what="CB_RECALL")
+    wait_event(recall4, what="CB_RECALL")
     #print "************* Getting here means CB_RECALL reply is in the send queue."
     #print "************* Give it a moment to actually be sent"
 
     res = sess1.compound([op.putfh(fh1), op.delegreturn(recall1.stateid1)])
+    timer.returned(sess1.client)
     check(res)
 
     res = sess2.compound([op.putfh(fh2), op.delegreturn(recall2.stateid2)])
+    timer.returned(sess2.client)
     check(res)
 
     res = sess3.compound([op.putfh(fh3), op.delegreturn(recall3.stateid3)])
+    timer.returned(sess3.client)
     check(res)
 
     res = sess4.compound([op.putfh(fh4), op.delegreturn(recall4.stateid4)])
+    timer.returned(sess4.client)
     check(res)
 
     res = sess4.listen(slot)
@@ -2994,6 +3063,7 @@ def testROC7(t, env):
         state = NFS4ERR_BAD_STATEID
 
     check(res, state)
+    timer.report()
 
 def testROC8(t, env):
 
@@ -3003,6 +3073,7 @@ def testROC8(t, env):
     FLAGS: nfs-obj
     CODE: ROC8
     """
+    timer = RecallTimer(env.testname(t))
     recall1 = threading.Event()
     recall2 = threading.Event()
     recall3 = threading.Event()
@@ -3044,8 +3115,7 @@ def testROC8(t, env):
     #print "Create sess1 and client1"
     sessionName = env.testname(t) + "1"
     sess1 = env.c1.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess1.client.cb_pre_hook(OP_CB_RECALL, pre_hook1)
-    sess1.client.cb_post_hook(OP_CB_RECALL, post_hook1)
+    timer.hook(sess1.client, OP_CB_RECALL, pre_hook1, post_hook1)
 
     fileOwner = "owner_%s" % sessionName
     fileName = env.testname(t)
@@ -3053,122 +3123,60 @@ def testROC8(t, env):
 
     #print "********************* Creating a file with NO deleg"
     createWriteReadCloseClient1(sess1, fileOwner, filePath)
-    env.sleep(1)
-    res = open_file(sess1, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh1 = res.resarray[-1].object
-    stateid1 = res.resarray[-2].stateid
-    ops = [op.putfh(fh1),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid1, 0xffff)]
-    res = sess1.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid1 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
 
-    #print "***** Create - Client2Read *************************** "
+    #print "***** Create - Client2Read, Client3Read, Client4 *****"
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook2)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook2)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook2, post_hook2)
 
-    #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh2 = res.resarray[-1].object
-    stateid2 = res.resarray[-2].stateid
-    ops = [op.putfh(fh2),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid2, 0xffff)]
-    res = sess2.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid2 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client3Read *************************** "
     sessionName = env.testname(t) + "3"
     sess3 = env.c3.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess3.client.cb_pre_hook(OP_CB_RECALL, pre_hook3)
-    sess3.client.cb_post_hook(OP_CB_RECALL, post_hook3)
-
-    #print "***** openClient3Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess3, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
+    timer.hook(sess3.client, OP_CB_RECALL, pre_hook3, post_hook3)
 
-    fh3 = res.resarray[-1].object
-    stateid3 = res.resarray[-2].stateid
-    ops = [op.putfh(fh3),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid3, 0xffff)]
-    res = sess3.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid3 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client4 *************************** "
     sessionName = env.testname(t) + "4"
     sess4 = env.c4.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess4.client.cb_pre_hook(OP_CB_RECALL, pre_hook4)
-    sess4.client.cb_post_hook(OP_CB_RECALL, post_hook4)
+    timer.hook(sess4.client, OP_CB_RECALL, pre_hook4, post_hook4)
 
-    #print "***** openClient4 READ   file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess4, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient4Read", res
-    check(res)
-
-    fh4 = res.resarray[-1].object
-    stateid4 = res.resarray[-2].stateid
-    ops = [op.putfh(fh4),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid4, 0xffff)]
-    res = sess4.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid4 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
+    #print "***** Open for READ and get a read layout from all four clients"
+    opened = open_layout_fanout([sess1, sess2, sess3, sess4], fileOwner,
+                                filePath, LAYOUT4_OBJECTS_V2)
+    fh1, fh2, fh3, fh4 = [o.fh for o in opened]
+    stateid1, stateid2, stateid3, stateid4 = [o.stateid for o in opened]
+    layout_stateid1, layout_stateid2, layout_stateid3, layout_stateid4 = \
+        [o.layout_stateid for o in opened]
+    roc = opened[-1].roc
 
     #print "***** Open some fail for Write Client4Write *************************** "
     claim = open_claim4(CLAIM_NULL, fileName)
     owner = open_owner4(0, fileOwner)
     how = openflag4(OPEN4_NOCREATE)
     open_op = op.open(0, OPEN4_SHARE_ACCESS_WRITE, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+    timer.open_sent()
     slot = sess4.compound_async(env.home + [open_op])
 
     #print "*************res from openClient4Write ===========", res
     #print "************* Wait for recall, and return delegation "
-    recall1.wait()  # STUB - deal with timeout
-    recall2.wait()  # STUB - deal with timeout
-    recall3.wait()  # STUB - deal with timeout
-    recall4.wait()  # STUB - deal with timeout
+    wait_event(recall1, what="CB_RECALL")
+    wait_event(recall2, what="CB_RECALL")
+    wait_event(recall3, what="CB_RECALL")
+    wait_event(recall4, what="CB_RECALL")
     #print "************* Getting here means CB_RECALL reply is in the send queue."
     #print "************* Give it a moment to actually be sent"
 
     res = sess1.compound([op.putfh(fh1), op.delegreturn(recall1.stateid1)])
+    timer.returned(sess1.client)
     check(res)
 
     res = sess2.compound([op.putfh(fh2), op.delegreturn(recall2.stateid2)])
+    timer.returned(sess2.client)
     check(res)
 
     res = sess3.compound([op.putfh(fh3), op.delegreturn(recall3.stateid3)])
+    timer.returned(sess3.client)
     check(res)
 
     res = sess4.compound([op.putfh(fh4), op.delegreturn(recall4.stateid4)])
+    timer.returned(sess4.client)
     check(res)
 
     res = sess4.listen(slot)
@@ -3313,6 +3321,7 @@ def testROC8(t, env):
         state = NFS4_OK
 
     check(res, state)
+    timer.report()
 
 
 def testROC9(t, env):
@@ -3324,6 +3333,7 @@ def testROC9(t, env):
     FLAGS: nfs-obj
     CODE: ROC9
     """
+    timer = RecallTimer(env.testname(t))
     recall1 = threading.Event()
     recall2 = threading.Event()
     recall3 = threading.Event()
@@ -3365,8 +3375,7 @@ def testROC9(t, env):
     #print "Create sess1 and client1"
     sessionName = env.testname(t) + "1"
     sess1 = env.c1.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess1.client.cb_pre_hook(OP_CB_RECALL, pre_hook1)
-    sess1.client.cb_post_hook(OP_CB_RECALL, post_hook1)
+    timer.hook(sess1.client, OP_CB_RECALL, pre_hook1, post_hook1)
 
     fileOwner = "owner_%s" % sessionName
     fileName = env.testname(t)
@@ -3374,95 +3383,28 @@ def testROC9(t, env):
 
     #print "********************* Creating a file with NO deleg"
     createWriteReadCloseClient1(sess1, fileOwner, filePath)
-    env.sleep(1)
-    res = open_file(sess1, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh1 = res.resarray[-1].object
-    stateid1 = res.resarray[-2].stateid
-    ops = [op.putfh(fh1),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid1, 0xffff)]
-    res = sess1.compound(ops)
-    check(res)
 
-    #print "***** Return read layout  *********"
-    layout_stateid1 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client2Read *************************** "
+    #print "***** Create - Client2Read, Client3Read, Client4 *****"
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook2)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook2)
-
-    #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook2, post_hook2)
 
-    fh2 = res.resarray[-1].object
-    stateid2 = res.resarray[-2].stateid
-    ops = [op.putfh(fh2),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid2, 0xffff)]
-    res = sess2.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid2 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client3Read *************************** "
     sessionName = env.testname(t) + "3"
     sess3 = env.c3.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess3.client.cb_pre_hook(OP_CB_RECALL, pre_hook3)
-    sess3.client.cb_post_hook(OP_CB_RECALL, post_hook3)
+    timer.hook(sess3.client, OP_CB_RECALL, pre_hook3, post_hook3)
 
-    #print "***** openClient3Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess3, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh3 = res.resarray[-1].object
-    stateid3 = res.resarray[-2].stateid
-    ops = [op.putfh(fh3),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid3, 0xffff)]
-    res = sess3.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid3 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client4 *************************** "
     sessionName = env.testname(t) + "4"
     sess4 = env.c4.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess4.client.cb_pre_hook(OP_CB_RECALL, pre_hook4)
-    sess4.client.cb_post_hook(OP_CB_RECALL, post_hook4)
-
-    #print "***** openClient4 READ   file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess4, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient4Read", res
-    check(res)
-
-    fh4 = res.resarray[-1].object
-    stateid4 = res.resarray[-2].stateid
-    ops = [op.putfh(fh4),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid4, 0xffff)]
-    res = sess4.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid4 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
+    timer.hook(sess4.client, OP_CB_RECALL, pre_hook4, post_hook4)
+
+    #print "***** Open for READ and get a read layout from all four clients"
+    opened = open_layout_fanout([sess1, sess2, sess3, sess4], fileOwner,
+                                filePath, LAYOUT4_OBJECTS_V2)
+    fh1, fh2, fh3, fh4 = [o.fh for o in opened]
+    stateid1, stateid2, stateid3, stateid4 = [o.stateid for o in opened]
+    layout_stateid1, layout_stateid2, layout_stateid3, layout_stateid4 = \
+        [o.layout_stateid for o in opened]
+    roc = opened[-1].roc
     #print "***** read_state4  *********"
     res = sess4.compound([op.putfh(fh4),
                           op.read(stateid4, 0, 1000)])
@@ -3472,27 +3414,32 @@ def testROC9(t, env):
     owner = open_owner4(0, fileOwner)
     how = openflag4(OPEN4_NOCREATE)
     open_op = op.open(0, OPEN4_SHARE_ACCESS_WRITE, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+    timer.open_sent()
     slot = sess4.compound_async(env.home + [open_op])
 
     #print "*************res from openClient4Write ===========", res
     #print "************* Wait for recall, and return delegation "
-    recall1.wait()  # STUB - deal with timeout
-    recall2.wait()  # STUB - deal with timeout
-    recall3.wait()  # STUB - deal with timeout
-    recall4.wait()  # STUB - deal with timeout
+    wait_event(recall1, what="CB_RECALL")
+    wait_event(recall2, what="CB_RECALL")
+    wait_event(recall3, what="CB_RECALL")
+    wait_event(recall4, what="CB_RECALL")
     #print "************* Getting here means CB_RECALL reply is in the send queue."
     #print "************* Give it a moment to actually be sent"
 
     res = sess1.compound([op.putfh(fh1), op.delegreturn(recall1.stateid1)])
+    timer.returned(sess1.client)
     check(res)
 
     res = sess2.compound([op.putfh(fh2), op.delegreturn(recall2.stateid2)])
+    timer.returned(sess2.client)
     check(res)
 
     res = sess3.compound([op.putfh(fh3), op.delegreturn(recall3.stateid3)])
+    timer.returned(sess3.client)
     check(res)
 
     res = sess4.compound([op.putfh(fh4), op.delegreturn(recall4.stateid4)])
+    timer.returned(sess4.client)
     check(res)
 
     res = sess4.listen(slot)
@@ -3628,6 +3575,7 @@ def testROC9(t, env):
         state = NFS4_OK
 
     check(res, state)
+    timer.report()
 
 
 
@@ -3639,6 +3587,7 @@ def testROC10(t, env):
     FLAGS: nfs-obj
     CODE: ROC10
     """
+    timer = RecallTimer(env.testname(t))
     recall1 = threading.Event()
     recall2 = threading.Event()
     recall3 = threading.Event()
@@ -3679,8 +3628,7 @@ def testROC10(t, env):
     #print "Create sess1 and client1"
     sessionName = env.testname(t) + "1"
     sess1 = env.c1.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess1.client.cb_pre_hook(OP_CB_RECALL, pre_hook1)
-    sess1.client.cb_post_hook(OP_CB_RECALL, post_hook1)
+    timer.hook(sess1.client, OP_CB_RECALL, pre_hook1, post_hook1)
 
     fileOwner = "owner_%s" % sessionName
     fileName = env.testname(t)
@@ -3688,122 +3636,60 @@ def testROC10(t, env):
 
     #print "********************* Creating a file with NO deleg"
     createWriteReadCloseClient1(sess1, fileOwner, filePath)
-    env.sleep(1)
-    res = open_file(sess1, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh1 = res.resarray[-1].object
-    stateid1 = res.resarray[-2].stateid
-    ops = [op.putfh(fh1),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid1, 0xffff)]
-    res = sess1.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid1 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
 
-    #print "***** Create - Client2Read *************************** "
+    #print "***** Create - Client2Read, Client3Read, Client4 *****"
     sessionName = env.testname(t) + "2"
     sess2 = env.c2.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess2.client.cb_pre_hook(OP_CB_RECALL, pre_hook2)
-    sess2.client.cb_post_hook(OP_CB_RECALL, post_hook2)
-
-    #print "***** openClient2Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess2, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh2 = res.resarray[-1].object
-    stateid2 = res.resarray[-2].stateid
-    ops = [op.putfh(fh2),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid2, 0xffff)]
-    res = sess2.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid2 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
+    timer.hook(sess2.client, OP_CB_RECALL, pre_hook2, post_hook2)
 
-    #print "***** Create - Client3Read *************************** "
     sessionName = env.testname(t) + "3"
     sess3 = env.c3.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess3.client.cb_pre_hook(OP_CB_RECALL, pre_hook3)
-    sess3.client.cb_post_hook(OP_CB_RECALL, post_hook3)
-
-    #print "***** openClient3Read: Opening file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess3, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient2Read=", res
-    check(res)
-
-    fh3 = res.resarray[-1].object
-    stateid3 = res.resarray[-2].stateid
-    ops = [op.putfh(fh3),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid3, 0xffff)]
-    res = sess3.compound(ops)
-    check(res)
+    timer.hook(sess3.client, OP_CB_RECALL, pre_hook3, post_hook3)
 
-    #print "***** Return read layout  *********"
-    layout_stateid3 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
-
-    #print "***** Create - Client4 *************************** "
     sessionName = env.testname(t) + "4"
     sess4 = env.c4.new_client_session(sessionName, flags=EXCHGID4_FLAG_USE_PNFS_MDS)
-    sess4.client.cb_pre_hook(OP_CB_RECALL, pre_hook4)
-    sess4.client.cb_post_hook(OP_CB_RECALL, post_hook4)
+    timer.hook(sess4.client, OP_CB_RECALL, pre_hook4, post_hook4)
 
-    #print "***** openClient4 READ   file '%s', for READ  with owner '%s', with session name '%s'" % (filePath, fileOwner, sessionName)
-    res = open_file(sess4, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
-        deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
-    #print "***********res from openClient4Read", res
-    check(res)
-
-    fh4 = res.resarray[-1].object
-    stateid4 = res.resarray[-2].stateid
-    ops = [op.putfh(fh4),
-           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_READ,
-                        0, 0xffffffffffffffff, 0, stateid4, 0xffff)]
-    res = sess4.compound(ops)
-    check(res)
-
-    #print "***** Return read layout  *********"
-    layout_stateid4 = res.resarray[-1].logr_stateid
-    roc = res.resarray[-1].logr_return_on_close
+    #print "***** Open for READ and get a read layout from all four clients"
+    opened = open_layout_fanout([sess1, sess2, sess3, sess4], fileOwner,
+                                filePath, LAYOUT4_OBJECTS_V2)
+    fh1, fh2, fh3, fh4 = [o.fh for o in opened]
+    stateid1, stateid2, stateid3, stateid4 = [o.stateid for o in opened]
+    layout_stateid1, layout_stateid2, layout_stateid3, layout_stateid4 = \
+        [o.layout_stateid for o in opened]
+    roc = opened[-1].roc
 
     #print "***** Open some fail for Write Client4Write *************************** "
     claim = open_claim4(CLAIM_NULL, fileName)
     owner = open_owner4(0, fileOwner)
     how = openflag4(OPEN4_NOCREATE)
     open_op = op.open(0, OPEN4_SHARE_ACCESS_WRITE, OPEN4_SHARE_DENY_NONE, owner, how, claim)
+    timer.open_sent()
     slot = sess4.compound_async(env.home + [open_op])
 
     #print "*************res from openClient4Write ===========", res
     #print "************* Wait for recall, and return delegation "
-    recall1.wait()  # STUB - deal with timeout
-    recall2.wait()  # STUB - deal with timeout
-    recall3.wait()  # STUB - deal with timeout
-    recall4.wait()  # STUB - deal with timeout
+    wait_event(recall1, what="CB_RECALL")
+    wait_event(recall2, what="CB_RECALL")
+    wait_event(recall3, what="CB_RECALL")
+    wait_event(recall4, what="CB_RECALL")
     #print "************* Getting here means CB_RECALL reply is in the send queue."
     #print "************* Give it a moment to actually be sent"
 
     res = sess1.compound([op.putfh(fh1), op.delegreturn(recall1.stateid1)])
+    timer.returned(sess1.client)
     check(res)
 
     res = sess2.compound([op.putfh(fh2), op.delegreturn(recall2.stateid2)])
+    timer.returned(sess2.client)
     check(res)
 
     res = sess3.compound([op.putfh(fh3), op.delegreturn(recall3.stateid3)])
+    timer.returned(sess3.client)
     check(res)
 
     res = sess4.compound([op.putfh(fh4), op.delegreturn(recall4.stateid4)])
+    timer.returned(sess4.client)
     check(res)
 
     res = sess4.listen(slot)
@@ -3957,6 +3843,145 @@ def testROC10(t, env):
     check(res, state)
     
     
+    timer.report()
+
+
+def recallFanout(t, env, nclients, writers=0):
+    """Open from nclients clients, recall them with one conflicting OPEN,
+    then close and return every layout.
+    """
+    p = ObjV2Packer()
+    p.pack_pnfs_obj_layoutupdate4(
+        pnfs_obj_layoutupdate4(pnfs_obj_deltaspaceused4(True, 0), False))
+    scenario = RecallScenario(env, env.testname(t), nclients, writers,
+                              LAYOUT4_OBJECTS_V2, p.get_buffer())
+    scenario.create(createWriteReadCloseClient1)
+    scenario.open_all()
+    scenario.recall()
+    scenario.close_all()
+    scenario.return_layouts()
+    scenario.timer.report()
+
+
+def testROCFanout32(t, env):
+    """Multiopen to read from 32 clients, open_write from the last one.
+       All read delegations are recalled and returned, every client closes
+       and returns its layout.
+
+    FLAGS: nfs-obj-scale
+    CODE: ROCFAN32
+    """
+    recallFanout(t, env, 32)
+
+
+def testROCFanout64(t, env):
+    """Multiopen to read from 64 clients, open_write from the last one.
+
+    FLAGS: nfs-obj-scale
+    CODE: ROCFAN64
+    """
+    recallFanout(t, env, 64)
+
+
+def testROCFanout128(t, env):
+    """Multiopen to read from 128 clients, open_write from the last one.
+
+    FLAGS: nfs-obj-scale
+    CODE: ROCFAN128
+    """
+    recallFanout(t, env, 128)
+
+
+def testROCFanoutMixed64(t, env):
+    """Multiopen from 64 clients, 8 of them for write, open_write from the
+       last one.
+
+    FLAGS: nfs-obj-scale
+    CODE: ROCFANMIX64
+    """
+    recallFanout(t, env, 64, writers=8)
+
+
+def ioThroughput(t, env, target):
+    """Keep every slot busy with WRITEs for IO_DURATION seconds, then with
+    READs of what was written; closes target.
+    """
+    name = env.testname(t)
+    try:
+        written = report(name, run_io(target, "write"))
+        report(name, run_io(target, "read", span=min(written["bytes"], IO_SPAN)))
+    finally:
+        close_target(target)
+
+
+def testNfsObjThroughputMDS(t, env):
+    """Slot-parallel WRITE and READ throughput through the MDS
+
+    FLAGS: nfs-obj-bench
+    CODE: NFSOBJIO1
+    """
+    sess = pooled_session(env, t)
+    res = create_file(sess, env.testname(t))
+    check(res)
+    fh = res.resarray[-1].object
+    stateid = res.resarray[-2].stateid
+
+    ioThroughput(t, env, mds_target(sess, fh, stateid))
+
+    res = close_file(sess, fh, stateid=stateid)
+    check(res)
+
+
+def testNfsObjThroughputDS(t, env):
+    """Slot-parallel WRITE and READ throughput straight to the first data
+       server of a RW layout
+
+    FLAGS: nfs-obj-bench
+    CODE: NFSOBJIO2
+    """
+    sess = pooled_session(env, t)
+    res = create_file(sess, env.testname(t))
+    check(res)
+    fh = res.resarray[-1].object
+    stateid = res.resarray[-2].stateid
+
+    ops = [op.putfh(fh),
+           op.layoutget(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_RW,
+                        0, 0xffffffffffffffff, 0, stateid, 0xffff)]
+    res = sess.compound(ops)
+    check(res)
+    layout_stateid = res.resarray[-1].logr_stateid
+    layout = res.resarray[-1].logr_layout[0]
+
+    ioThroughput(t, env, ds_target(sess, layout, "%s_ds" % env.testname(t)))
+
+    ops = [op.putfh(fh),
+           op.layoutreturn(False, LAYOUT4_OBJECTS_V2, LAYOUTIOMODE4_ANY,
+                           layoutreturn4(LAYOUTRETURN4_FILE,
+                                         layoutreturn_file4(0,
+                                                            0xffffffffffffffff,
+                                                            layout_stateid,
+                                                            "")))]
+    res = sess.compound(ops)
+    check(res)
+    res = close_file(sess, fh, stateid=stateid)
+    check(res)
+
+
+def testNfsObjSlotScaling(t, env):
+    """OPEN/LAYOUTGET/LAYOUTCOMMIT/LAYOUTRETURN/CLOSE throughput and tail
+       latency as fore channel slots and compounds in flight grow
+
+    FLAGS: nfs-obj-bench
+    CODE: NFSOBJSLOTS1
+    """
+    p = ObjV2Packer()
+    p.pack_pnfs_obj_layoutupdate4(
+        pnfs_obj_layoutupdate4(pnfs_obj_deltaspaceused4(True, 0), False))
+    name = env.testname(t)
+    slot_report(name, slot_scaling(env, name, LAYOUT4_OBJECTS_V2,
+                                   p.get_buffer()))
+
 def testELEM1(t, env):
 
     """Multiopen to read four clients, open_write and write from two.
@@ -3977,7 +4002,6 @@ def testELEM1(t, env):
 
     #print "********************* Creating a file with NO deleg"
     createWriteReadCloseClient1(sess1, fileOwner, filePath)
-    env.sleep(1)
     res = open_file(sess1, fileOwner, filePath, access=OPEN4_SHARE_ACCESS_READ,
         deny=OPEN4_SHARE_DENY_NONE, deleg_type=OPEN_DELEGATE_READ, want_deleg=True)
     #print "***********res from openClient2Read=", res
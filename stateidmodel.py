@@ -0,0 +1,455 @@
+from nfs4_const import *
+from nfs4_type import *
+from environment import check, fail
+import nfs4_ops as op
+from sessionpool import CURRENT_STATEID
+from cbdispatch import add_cb_hook
+
+import collections
+import random
+import threading
+import time
+
+_clock = getattr(time, "monotonic", time.time)
+
+WALK_OPS = 20000        # LAYOUTGET/LAYOUTRETURN compounds per walk
+WALK_WINDOW = 16        # compounds in flight, at most one per file
+WALK_UNITS = 64         # ranges are whole units of WALK_UNIT bytes
+WALK_UNIT = 4096
+NFS4_LENGTH_ALL = 0xffffffffffffffff
+
+# The seqid rules checked here are those of RFC 5661 section 12.5.3: a
+# new layout stateid has seqid 1 and an "other" of its own; every later
+# LAYOUTGET and LAYOUTRETURN reply, and every CB_LAYOUTRECALL, carries
+# the same "other" with the seqid incremented by one.
+
+
+class _LayoutState(object):
+    """What the model expects of one client's layout stateid for one file
+
+    Seqids up to floor have all been seen; window holds those seen above
+    it, out of order.  A reply may only be ahead of floor by as many
+    replies as are still owed (in flight, plus slack for recalls), so
+    window never outgrows what is in flight.
+    """
+    __slots__ = ("other", "floor", "window", "inflight", "roc", "opens",
+                 "uncertain")
+
+    def __init__(self):
+        self.other = None
+        self.floor = 0
+        self.window = set()
+        self.inflight = 0
+        self.roc = False
+        self.opens = set()
+        self.uncertain = False
+
+    def forget(self):
+        """The server has freed the layout stateid"""
+        self.other = None
+        self.floor = 0
+        self.window = set()
+        self.roc = False
+        self.uncertain = False
+
+
+class LayoutStateidModel(object):
+    """Incremental layout stateid/seqid model, per (clientid, fh)
+
+    sent() counts a LAYOUTGET or LAYOUTRETURN in flight; the reply
+    methods check what the server returned against the model and update
+    it in O(1), without keeping any history, so replies of concurrent
+    compounds may arrive in any order.  quiesce() checks that no seqid
+    went missing once nothing is in flight.  CheckedSession feeds a
+    model from a session's traffic; watch_layout_recalls() from
+    CB_LAYOUTRECALL.
+    """
+    def __init__(self, slack=0):
+        self.slack = slack      # unsolicited seqid bumps to allow for
+        self._states = {}
+        self._files = {}        # clientid -> set of fh with state
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.window_max = 0
+
+    def _state(self, clientid, fh):
+        key = (clientid, fh)
+        state = self._states.get(key)
+        if state is None:
+            state = self._states[key] = _LayoutState()
+            self._files.setdefault(clientid, set()).add(fh)
+        return state
+
+    def _settle(self, state, clientid, fh):
+        # Drop a key that holds nothing and expects nothing
+        if state.other is None and not state.inflight and not state.opens:
+            del self._states[clientid, fh]
+            files = self._files[clientid]
+            files.discard(fh)
+            if not files:
+                del self._files[clientid]
+
+    def _bump(self, state, seqid, what):
+        ahead = seqid - state.floor
+        if ahead <= 0 or seqid in state.window:
+            fail("%s: seqid %i repeated (all up to %i already seen)"
+                 % (what, seqid, state.floor))
+        if ahead > state.inflight + self.slack:
+            fail("%s: seqid %i skips ahead of %i with %i replies owed"
+                 % (what, seqid, state.floor, state.inflight))
+        state.window.add(seqid)
+        self.window_max = max(self.window_max, len(state.window))
+        while state.floor + 1 in state.window:
+            state.floor += 1
+            state.window.remove(state.floor)
+
+    def _replied(self, state):
+        if state.inflight:
+            state.inflight -= 1
+        self.checked += 1
+
+    def sent(self, clientid, fh):
+        with self._lock:
+            self._state(clientid, fh).inflight += 1
+
+    def failed(self, clientid, fh):
+        """A LAYOUTGET or LAYOUTRETURN that was sent got an error"""
+        with self._lock:
+            state = self._state(clientid, fh)
+            self._replied(state)
+            self._settle(state, clientid, fh)
+
+    def layoutget(self, clientid, fh, arg_stateid, stateid, roc=False):
+        with self._lock:
+            state = self._state(clientid, fh)
+            what = "LAYOUTGET"
+            if state.other is None or \
+               (state.uncertain and stateid.other != state.other):
+                # A new layout stateid
+                if stateid.other == arg_stateid.other:
+                    fail("%s: new layout stateid reuses the other field of "
+                         "the stateid it was got with" % what)
+                state.forget()
+                state.other = stateid.other
+            elif stateid.other != state.other:
+                fail("%s: layout stateid other field changed" % what)
+            state.uncertain = False
+            state.roc = state.roc or roc
+            self._bump(state, stateid.seqid, what)
+            self._replied(state)
+
+    def layoutreturn(self, clientid, fh, present, stateid=None):
+        """A LAYOUTRETURN4_FILE reply; present is lrs_present"""
+        with self._lock:
+            state = self._state(clientid, fh)
+            what = "LAYOUTRETURN"
+            if present:
+                if state.other is not None and not state.uncertain and \
+                   stateid.other != state.other:
+                    fail("%s: layout stateid other field changed" % what)
+                if state.other is None or state.uncertain:
+                    state.forget()
+                    state.other = stateid.other
+                self._bump(state, stateid.seqid, what)
+            else:
+                state.forget()
+            self._replied(state)
+            self._settle(state, clientid, fh)
+
+    def returned_bulk(self, clientid, returntype):
+        """LAYOUTRETURN4_FSID or _ALL succeeded
+
+        ALL frees every layout of the client.  The model does not know
+        which files share an fsid, so after FSID it accepts either a new
+        or a continued layout stateid on the client's next LAYOUTGET.
+        """
+        with self._lock:
+            for fh in list(self._files.get(clientid, ())):
+                state = self._states[clientid, fh]
+                if returntype == LAYOUTRETURN4_ALL:
+                    state.forget()
+                    self._settle(state, clientid, fh)
+                else:
+                    state.uncertain = True
+
+    def recalled(self, clientid, fh, stateid):
+        """CB_LAYOUTRECALL of a file's layout, carrying a bumped seqid"""
+        with self._lock:
+            state = self._state(clientid, fh)
+            what = "CB_LAYOUTRECALL"
+            if state.other is None:
+                fail("%s: recall of a layout the client does not hold"
+                     % what)
+            if stateid.other != state.other:
+                fail("%s: layout stateid other field changed" % what)
+            self._bump(state, stateid.seqid, what)
+            self.checked += 1
+
+    def recalled_bulk(self, clientid):
+        with self._lock:
+            for fh in self._files.get(clientid, ()):
+                self._states[clientid, fh].uncertain = True
+
+    def opened(self, clientid, fh, other):
+        with self._lock:
+            self._state(clientid, fh).opens.add(other)
+
+    def closed(self, clientid, fh, other):
+        """CLOSE; the last close frees return-on-close layouts"""
+        with self._lock:
+            state = self._state(clientid, fh)
+            state.opens.discard(other)
+            if state.roc and not state.opens:
+                state.forget()
+            self._settle(state, clientid, fh)
+
+    def quiesce(self):
+        """With nothing in flight, every seqid must have been seen"""
+        with self._lock:
+            for (clientid, fh), state in self._states.items():
+                if state.inflight:
+                    fail("%i layout replies still owed" % state.inflight)
+                if state.window:
+                    fail("Layout seqid %i never seen, %i seen after it"
+                         % (state.floor + 1, min(state.window)))
+
+    def stats(self):
+        with self._lock:
+            return {"checked": self.checked, "files": len(self._states),
+                    "window_max": self.window_max}
+
+
+def _resolve(stateid, current):
+    if current is not None and \
+       (stateid.seqid, stateid.other) == \
+       (CURRENT_STATEID.seqid, CURRENT_STATEID.other):
+        return current
+    return stateid
+
+
+class CheckedSession(object):
+    """A session whose layout stateid replies are checked by a model
+
+    compound(), compound_async() and listen() feed the model; anything
+    else is the pynfs session's.  The file handle of each LAYOUTGET,
+    LAYOUTRETURN and CLOSE is followed through PUTFH arguments and GETFH
+    results; an operation whose file handle is only known from a later
+    GETFH (e.g. LAYOUTGET after OPEN) is counted in flight once its
+    reply arrives.
+    """
+    def __init__(self, sess, model):
+        self._sess = sess
+        self.model = model
+        self._pending = {}      # slot -> (ops, [fh or None] per op)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._sess, name)
+
+    @property
+    def _clientid(self):
+        return self._sess.client.clientid
+
+    def _send(self, ops):
+        fh = None
+        sent = []
+        for arg in ops:
+            if arg.argop == OP_PUTFH:
+                fh = arg.opputfh.object
+            elif arg.argop in (OP_PUTROOTFH, OP_PUTPUBFH, OP_LOOKUP,
+                               OP_LOOKUPP, OP_OPEN, OP_CREATE,
+                               OP_RESTOREFH):
+                fh = None
+            if fh is not None and (arg.argop == OP_LAYOUTGET or
+                                   (arg.argop == OP_LAYOUTRETURN and
+                                    arg.oplayoutreturn.lora_layoutreturn.
+                                    lr_returntype == LAYOUTRETURN4_FILE)):
+                self.model.sent(self._clientid, fh)
+                sent.append(fh)
+            else:
+                sent.append(None)
+        return sent
+
+    def compound(self, ops, *args, **kwargs):
+        sent = self._send(ops)
+        res = self._sess.compound(ops, *args, **kwargs)
+        self._check(ops, sent, res)
+        return res
+
+    def compound_async(self, ops, *args, **kwargs):
+        sent = self._send(ops)
+        slot = self._sess.compound_async(ops, *args, **kwargs)
+        with self._lock:
+            self._pending[slot] = (ops, sent)
+        return slot
+
+    def listen(self, slot, *args, **kwargs):
+        res = self._sess.listen(slot, *args, **kwargs)
+        with self._lock:
+            ops, sent = self._pending.pop(slot)
+        self._check(ops, sent, res)
+        return res
+
+    def _check(self, ops, sent, res):
+        model = self.model
+        clientid = self._clientid
+        results = list(res.resarray)
+        if results and results[0].resop == OP_SEQUENCE and \
+           (not ops or ops[0].argop != OP_SEQUENCE):
+            results = results[1:]
+        fh = None
+        current = None
+        opened = []
+        for i, arg in enumerate(ops):
+            r = results[i] if i < len(results) else None
+            ok = r is not None and \
+                (i < len(results) - 1 or res.status == NFS4_OK)
+            if not ok:
+                # Not reached, or failed: what was counted gets no reply
+                for was_sent in sent[i:]:
+                    if was_sent is not None:
+                        model.failed(clientid, was_sent)
+                return
+            if arg.argop == OP_PUTFH:
+                fh = arg.opputfh.object
+            elif arg.argop == OP_GETFH:
+                fh = r.object
+                for other in opened:
+                    model.opened(clientid, fh, other)
+                opened = []
+            elif arg.argop in (OP_PUTROOTFH, OP_PUTPUBFH, OP_LOOKUP,
+                               OP_LOOKUPP, OP_OPEN, OP_CREATE,
+                               OP_RESTOREFH):
+                fh = None
+            if arg.argop == OP_OPEN:
+                current = r.stateid
+                opened.append(r.stateid.other)
+            elif arg.argop == OP_CLOSE and fh is not None:
+                stateid = _resolve(arg.opclose.open_stateid, current)
+                model.closed(clientid, fh, stateid.other)
+            elif arg.argop == OP_LAYOUTGET:
+                if fh is None:
+                    continue
+                if sent[i] is None:
+                    model.sent(clientid, fh)
+                model.layoutget(clientid, fh,
+                                _resolve(arg.oplayoutget.loga_stateid,
+                                         current),
+                                r.logr_stateid, r.logr_return_on_close)
+            elif arg.argop == OP_LAYOUTRETURN:
+                returntype = arg.oplayoutreturn.lora_layoutreturn.\
+                    lr_returntype
+                if returntype != LAYOUTRETURN4_FILE:
+                    model.returned_bulk(clientid, returntype)
+                elif fh is not None:
+                    if sent[i] is None:
+                        model.sent(clientid, fh)
+                    model.layoutreturn(clientid, fh, r.lrs_present,
+                                       getattr(r, "lrs_stateid", None))
+
+
+def watch_layout_recalls(client, model):
+    """Feed model every CB_LAYOUTRECALL client receives
+
+    Replaces any CB_LAYOUTRECALL hooks the client had.  Allows the
+    model one seqid bump it has not seen yet, for a recall that crosses
+    a reply.
+    """
+    model.slack = max(model.slack, 1)
+
+    def pre_hook(arg, env):
+        recall = arg.clora_recall
+        if recall.lor_recalltype == LAYOUTRECALL4_FILE:
+            model.recalled(client.clientid, recall.lor_layout.lor_fh,
+                           recall.lor_layout.lor_stateid)
+        else:
+            model.recalled_bulk(client.clientid)
+
+    add_cb_hook(client, OP_CB_LAYOUTRECALL, pre_hook)
+
+
+class _WalkFile(object):
+    def __init__(self, fh, open_stateid):
+        self.fh = fh
+        self.open_stateid = open_stateid
+        self.layout_stateid = None
+
+
+def random_layouts(sess, files, lo_type, return_body="", count=WALK_OPS,
+                   window=WALK_WINDOW, seed=0):
+    """Random LAYOUTGETs and range, whole-file and FSID LAYOUTRETURNs
+
+    files are (fh, open stateid) of open files; up to window compounds
+    are in flight, never two for one file, so a checked session sees
+    replies of different files interleave.  Returns {ops, seconds,
+    ops_per_s}.
+    """
+    rnd = random.Random(seed)
+    walk = [_WalkFile(fh, stateid) for fh, stateid in files]
+    idle = collections.deque(walk)
+    pending = collections.deque()
+
+    def layoutget(f):
+        first = rnd.randrange(WALK_UNITS)
+        length = rnd.randint(1, WALK_UNITS - first) * WALK_UNIT
+        return op.layoutget(False, lo_type,
+                            rnd.choice((LAYOUTIOMODE4_READ,
+                                        LAYOUTIOMODE4_RW)),
+                            first * WALK_UNIT, length, 0,
+                            f.layout_stateid or f.open_stateid, 0xffff)
+
+    def layoutreturn(f):
+        if rnd.random() < 0.1:
+            offset, length = 0, NFS4_LENGTH_ALL
+        else:
+            first = rnd.randrange(WALK_UNITS)
+            offset = first * WALK_UNIT
+            length = rnd.randint(1, WALK_UNITS - first) * WALK_UNIT
+        return op.layoutreturn(False, lo_type, LAYOUTIOMODE4_ANY,
+                               layoutreturn4(LAYOUTRETURN4_FILE,
+                                             layoutreturn_file4(
+                                                 offset, length,
+                                                 f.layout_stateid,
+                                                 return_body)))
+
+    def complete():
+        slot, f, what = pending.popleft()
+        res = sess.listen(slot)
+        check(res, msg="%s in random layout walk" % what)
+        reply = res.resarray[-1]
+        if what == "LAYOUTGET":
+            f.layout_stateid = reply.logr_stateid
+        elif reply.lrs_present:
+            f.layout_stateid = reply.lrs_stateid
+        else:
+            f.layout_stateid = None
+        idle.append(f)
+
+    start = _clock()
+    for i in range(count):
+        if rnd.random() < 0.002:
+            # Give back everything of the fsid, with nothing in flight
+            while pending:
+                complete()
+            res = sess.compound([op.putfh(walk[0].fh),
+                                 op.layoutreturn(False, lo_type,
+                                                 LAYOUTIOMODE4_ANY,
+                                                 layoutreturn4(
+                                                     LAYOUTRETURN4_FSID))])
+            check(res, msg="LAYOUTRETURN4_FSID in random layout walk")
+            for f in walk:
+                f.layout_stateid = None
+            continue
+        while not idle or len(pending) >= window:
+            complete()
+        f = idle.popleft()
+        if f.layout_stateid is not None and rnd.random() < 0.4:
+            what, ops = "LAYOUTRETURN", [op.putfh(f.fh), layoutreturn(f)]
+        else:
+            what, ops = "LAYOUTGET", [op.putfh(f.fh), layoutget(f)]
+        pending.append((sess.compound_async(ops), f, what))
+    while pending:
+        complete()
+    elapsed = _clock() - start
+    return {"ops": count, "seconds": elapsed,
+            "ops_per_s": count / elapsed if elapsed else 0.0}
@@ -0,0 +1,138 @@
+from pnfs_obj_v2_const import *
+from objlayout import ObjLayoutView
+
+import collections
+
+import numpy as np
+
+# Vectorised placement of file offsets on the components of an objects-v2
+# layout, following the nested striping of RFC 5664 section 5.4 with the
+# parity units rotated left-symmetrically for RAID5 and PQ:
+#
+#   S = (W - P) * stripe_unit            data bytes per stripe row
+#   cycle = D * S * groups               one pass over every group
+#   m = L / cycle, g = (L % cycle) / (D * S), h = (L % cycle) % (D * S)
+#   row = m * D + h / S                  stripe row within group g
+#   unit = (h % S) / stripe_unit         data unit within the row
+#
+# RAID4 keeps parity in the last P columns; RAID5 and PQ start the parity
+# columns at (W - P - row) mod W and place data unit u in column
+# (start + P + u) mod W.  With odm_group_width == 0 all components form a
+# single group and odm_group_depth is ignored.
+
+PARITY_COUNT = {
+    PNFS_OBJ_RAID_0: 0,
+    PNFS_OBJ_RAID_4: 1,
+    PNFS_OBJ_RAID_5: 1,
+    PNFS_OBJ_RAID_PQ: 2,
+}
+
+# deviceid4 is a fixed 16 bytes, NULs included (RFC 5661 section 3.3.14)
+DEVICE_KEY = "V16"
+
+Placement = collections.namedtuple(
+    "Placement", ["component", "devices", "mirrors", "parity",
+                  "object_offset"])
+
+
+class StripeMap(object):
+    """Map file offsets to components and devices of one layout
+
+    dev_ids lists the onc_device_id of each entry of olo_components, in
+    order; comps_index is olo_comps_index, the position of the first of
+    those entries among all odm_num_comps components.  Offsets that land
+    on a component outside the layout map to component -1 and device None.
+    """
+    def __init__(self, olo_map, dev_ids, comps_index=0):
+        self.stripe_unit = olo_map.odm_stripe_unit
+        self.copies = olo_map.odm_mirror_cnt + 1
+        self.logical = olo_map.odm_num_comps // self.copies
+        self.width = olo_map.odm_group_width or self.logical
+        self.groups = self.logical // self.width
+        self.depth = olo_map.odm_group_depth if olo_map.odm_group_width \
+            else 0
+        self.raid = olo_map.odm_raid_algorithm
+        self.parity_count = PARITY_COUNT[self.raid]
+        self.data_width = self.width - self.parity_count
+        self.row_length = self.data_width * self.stripe_unit
+        self.comps_index = comps_index
+        self.ncomps = len(dev_ids)
+        # Trailing None is what component -1 (not in this layout) maps to
+        self._devices = np.array(list(dev_ids) + [None], dtype=object)
+        self._dev_keys = np.array(list(dev_ids), dtype=DEVICE_KEY)
+
+    @classmethod
+    def from_layout(cls, loc_body):
+        opaque = ObjLayoutView(loc_body)
+        dev_ids = [comp.oc_nfs_cred.onc_device_id
+                   for comp in opaque.olo_components]
+        return cls(opaque.olo_map, dev_ids, opaque.olo_comps_index)
+
+    def _rows(self, offsets):
+        """Return (group, row, unit, byte in unit) for each offset"""
+        su = self.stripe_unit
+        S = self.row_length
+        if self.depth:
+            group_span = self.depth * S
+            cycle, rem = np.divmod(offsets, group_span * self.groups)
+            group, h = np.divmod(rem, group_span)
+            row_in_group, within = np.divmod(h, S)
+            row = cycle * self.depth + row_in_group
+        else:
+            group = np.zeros_like(offsets)
+            row, within = np.divmod(offsets, S)
+        unit, byte = np.divmod(within, su)
+        return group, row, unit, byte
+
+    def _columns(self, row, unit):
+        """Return the data column and parity columns of each row"""
+        W = self.width
+        P = self.parity_count
+        if self.raid in (PNFS_OBJ_RAID_5, PNFS_OBJ_RAID_PQ):
+            start = (W - P - row) % W
+        else:
+            start = np.full_like(row, W - P)
+        data = (start + P + unit) % W if P else unit
+        parity = (start[:, None] + np.arange(P)) % W
+        return data, parity
+
+    def _local(self, logical):
+        """Component indices of each mirror, relative to this layout"""
+        comps = logical[..., None] * self.copies + np.arange(self.copies) \
+            - self.comps_index
+        outside = (comps < 0) | (comps >= self.ncomps)
+        return np.where(outside, -1, comps)
+
+    def place(self, offsets):
+        """Place an array of file offsets (each below 2**63)"""
+        offsets = np.asarray(offsets, dtype=np.int64)
+        group, row, unit, byte = self._rows(offsets)
+        data, parity = self._columns(row, unit)
+        base = group * self.width
+        mirrors = self._local(base + data)
+        parity = self._local(base[:, None] + parity).reshape(
+            len(offsets), self.parity_count * self.copies)
+        component = mirrors[:, 0]
+        devices = self._devices[component]
+        object_offset = row * self.stripe_unit + byte
+        return Placement(component, devices, mirrors, parity, object_offset)
+
+    def misdirected(self, offsets, dev_ids, writes=True):
+        """Return a mask of I/Os whose device is not a valid target
+
+        dev_ids holds the device each I/O at offsets was actually sent to.
+        Reads may go to any mirror; writes may also go to the row's
+        parity components.
+        """
+        placement = self.place(offsets)
+        targets = placement.mirrors
+        if writes and self.parity_count:
+            targets = np.concatenate([targets, placement.parity], axis=1)
+
+        seen = np.asarray(dev_ids, dtype=DEVICE_KEY)
+        # A device id may back several components, so compare device ids
+        # rather than component indices; components outside the layout
+        # match nothing, whatever device id they would look up.
+        target_keys = self._dev_keys[np.maximum(targets, 0)]
+        hits = (target_keys == seen[:, None]) & (targets >= 0)
+        return ~hits.any(axis=1)
@@ -0,0 +1,53 @@
+"""Cleanup run when the test environment finishes
+
+pynfs calls env.finish() once the last test has run.  install() wraps
+it so that callbacks registered with on_finish() for that environment,
+then those registered with at_finish() for the whole process, run
+first; a failing callback does not keep the others from running.
+"""
+import threading
+import traceback
+
+_global = []            # callbacks of at_finish(), for every environment
+_lock = threading.Lock()
+
+
+def _run(callbacks):
+    for callback in callbacks:
+        try:
+            callback()
+        except Exception:
+            traceback.print_exc()
+
+
+def install(env):
+    """Make env.finish() run the registered callbacks; idempotent"""
+    with _lock:
+        if getattr(env, "teardown_callbacks", None) is not None:
+            return
+        env.teardown_callbacks = []
+        finish = env.finish
+
+    def teardown_finish(*args, **kwargs):
+        with _lock:
+            callbacks = list(reversed(env.teardown_callbacks))
+            env.teardown_callbacks = []
+            callbacks.extend(reversed(_global))
+        _run(callbacks)
+        return finish(*args, **kwargs)
+
+    env.finish = teardown_finish
+
+
+def on_finish(env, callback):
+    """Run callback when env finishes"""
+    install(env)
+    with _lock:
+        env.teardown_callbacks.append(callback)
+
+
+def at_finish(callback):
+    """Run callback whenever an installed environment finishes"""
+    with _lock:
+        if callback not in _global:
+            _global.append(callback)
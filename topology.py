@@ -0,0 +1,122 @@
+import collections
+import threading
+
+ComponentRef = collections.namedtuple(
+    "ComponentRef", ["fh", "lo_type", "component", "mirror"])
+
+
+class TopologyIndex(object):
+    """Which file components live on which devices and data servers
+
+    Filled from validated layouts (check_layout(..., fh=fh)) for the
+    whole test session, so a test can ask which files have a component
+    on a data server without any more LAYOUTGET or GETDEVICEINFO traffic.
+    A component is identified by (fh, layout type, component index,
+    mirror); recording it again moves it to its new device.
+    """
+    def __init__(self):
+        self._files = {}        # fh -> {(lo_type, comp, mirror): dev_id}
+        self._devices = {}      # dev_id -> set of ComponentRef
+        self._addresses = {}    # dev_id -> tuple of addresses
+        self._by_address = {}   # address -> set of dev_ids
+        self._lock = threading.Lock()
+
+    def _set_addresses(self, dev_id, addresses):
+        old = self._addresses.get(dev_id, ())
+        if old == addresses:
+            return
+        for addr in old:
+            devs = self._by_address[addr]
+            devs.discard(dev_id)
+            if not devs:
+                del self._by_address[addr]
+        self._addresses[dev_id] = addresses
+        for addr in addresses:
+            self._by_address.setdefault(addr, set()).add(dev_id)
+
+    def _unlink(self, ref, dev_id):
+        refs = self._devices[dev_id]
+        refs.discard(ref)
+        if not refs:
+            del self._devices[dev_id]
+
+    def record(self, fh, lo_type, placements, addresses=None):
+        """Add (component, mirror, dev_id) placements of one layout of fh
+
+        addresses optionally maps dev_id to its data server addresses.
+        """
+        with self._lock:
+            comps = self._files.setdefault(fh, {})
+            for component, mirror, dev_id in placements:
+                key = (lo_type, component, mirror)
+                ref = ComponentRef(fh, lo_type, component, mirror)
+                old = comps.get(key)
+                if old is not None and old != dev_id:
+                    self._unlink(ref, old)
+                comps[key] = dev_id
+                self._devices.setdefault(dev_id, set()).add(ref)
+            for dev_id, addrs in (addresses or {}).items():
+                self._set_addresses(dev_id, tuple(addrs))
+
+    def forget(self, fh):
+        """Drop every component of fh, e.g. once the file is removed"""
+        with self._lock:
+            for (lo_type, component, mirror), dev_id in \
+                    self._files.pop(fh, {}).items():
+                self._unlink(ComponentRef(fh, lo_type, component, mirror),
+                             dev_id)
+
+    def components_on_device(self, dev_id):
+        with self._lock:
+            return list(self._devices.get(dev_id, ()))
+
+    def files_on_device(self, dev_id):
+        with self._lock:
+            return set(ref.fh for ref in self._devices.get(dev_id, ()))
+
+    def devices_on_address(self, addr):
+        with self._lock:
+            return set(self._by_address.get(addr, ()))
+
+    def files_on_address(self, addr):
+        """Files with a component on any device reachable at addr"""
+        with self._lock:
+            return set(ref.fh
+                       for dev_id in self._by_address.get(addr, ())
+                       for ref in self._devices.get(dev_id, ()))
+
+    def components_of_file(self, fh):
+        """Return {(lo_type, component, mirror): dev_id} of fh"""
+        with self._lock:
+            return dict(self._files.get(fh, {}))
+
+    def devices_of_file(self, fh):
+        with self._lock:
+            return set(self._files.get(fh, {}).values())
+
+    def addresses(self, dev_id):
+        with self._lock:
+            return self._addresses.get(dev_id, ())
+
+    def load(self):
+        """Return {dev_id: {"addresses", "components", "files"}}"""
+        with self._lock:
+            return dict((dev_id, {"addresses": self._addresses.get(dev_id, ()),
+                                  "components": len(refs),
+                                  "files": len(set(r.fh for r in refs))})
+                        for dev_id, refs in self._devices.items())
+
+    def clear(self):
+        with self._lock:
+            self._files.clear()
+            self._devices.clear()
+            self._addresses.clear()
+            self._by_address.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"files": len(self._files),
+                    "devices": len(self._devices),
+                    "addresses": len(self._by_address)}
+
+topology = TopologyIndex()
@@ -0,0 +1,69 @@
+from environment import check, fail
+
+import time
+
+_clock = getattr(time, "monotonic", time.time)
+
+WAIT_TIMEOUT = 30.0     # default deadline of every wait, in seconds
+POLL_INTERVAL = 0.01    # first poll interval of wait_until, doubled per poll
+POLL_MAX = 0.5
+
+
+def wait_event(event, timeout=WAIT_TIMEOUT, what="event"):
+    """Wait for a threading.Event, failing once the deadline passes"""
+    if not event.wait(timeout):
+        fail("Timed out after %.1fs waiting for %s" % (timeout, what))
+
+
+def wait_until(predicate, timeout=WAIT_TIMEOUT, what="condition",
+               interval=POLL_INTERVAL):
+    """Poll predicate() with backoff until it is true or the deadline passes
+
+    Returns the true value predicate() returned.
+    """
+    deadline = _clock() + timeout
+    while True:
+        value = predicate()
+        if value:
+            return value
+        remaining = deadline - _clock()
+        if remaining <= 0:
+            fail("Timed out after %.1fs waiting for %s" % (timeout, what))
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, POLL_MAX)
+
+
+def wait_reply_sent(sess, event=None, timeout=WAIT_TIMEOUT,
+                    what="callback"):
+    """Wait until a callback reply has reached the server
+
+    sess is a session of the client that answered the callback.  The
+    hook's env.notify (event) fires once the reply is queued on the back
+    channel; a SEQUENCE queued after it on the same connection is sent
+    behind it, so its reply proves the server has read the callback reply.
+    """
+    if event is not None:
+        wait_event(event, timeout, what)
+    res = sess.compound([])
+    check(res)
+
+
+def seqid_newer(seqid, than):
+    """True if seqid comes after than, allowing for wraparound"""
+    return 0 < (seqid - than) % 0x100000000 < 0x80000000
+
+
+def wait_seqid_advanced(get_stateid, stateid, timeout=WAIT_TIMEOUT,
+                        what="stateid seqid to advance"):
+    """Wait until get_stateid() returns a newer seqid than stateid's
+
+    get_stateid is typically a hook or tracker's view of the latest
+    stateid; returns that stateid.
+    """
+    def advanced():
+        current = get_stateid()
+        if current is not None and current.other == stateid.other and \
+           seqid_newer(current.seqid, stateid.seqid):
+            return current
+        return None
+    return wait_until(advanced, timeout, what)